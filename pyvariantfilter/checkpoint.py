@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+
+
+def get_file_checksum(path, previous=None, block_size=1 << 20):
+	"""
+	Get the SHA-256 checksum of a file along with its size and modification time.
+
+	The file is only read if it has changed since a previous checksum i.e. the size or modification time differ, so
+	rerunning against a large VCF does not read it again.
+
+	Input:
+
+		path: (String) Path to the file.
+		previous: (Dict) A checksum dictionary from an earlier call or None.
+		block_size: (Integer) How many bytes to read at a time.
+
+	Returns:
+
+		checksum: (Dict) Dictionary with the keys path, size, mtime_ns and sha256.
+
+	"""
+
+	stat = os.stat(path)
+
+	checksum = {'path': os.path.abspath(path),
+				'size': stat.st_size,
+				'mtime_ns': stat.st_mtime_ns,
+				'sha256': None}
+
+	if previous != None and all(previous.get(key) == checksum[key] for key in ['path', 'size', 'mtime_ns']):
+
+		checksum['sha256'] = previous['sha256']
+
+		return checksum
+
+	sha256 = hashlib.sha256()
+
+	with open(path, 'rb') as f:
+
+		for block in iter(lambda: f.read(block_size), b''):
+
+			sha256.update(block)
+
+	checksum['sha256'] = sha256.hexdigest()
+
+	return checksum
+
+
+def get_unit_key(unit_inputs):
+	"""
+	Get a deterministic key for the inputs of a unit of work. A unit whose key has changed since it was completed is
+	stale and must be run again.
+
+	Input:
+
+		unit_inputs: (Dict) Everything the unit's output depends on e.g. input checksums and the config hash.
+
+	Returns:
+
+		key: (String) SHA-256 hex digest of the inputs as canonical JSON.
+
+	"""
+
+	return hashlib.sha256(json.dumps(unit_inputs, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def write_json_atomic(data, path):
+	"""
+	Write JSON to a temporary file and then move it into place so a crash never leaves a partly written file.
+
+	Input:
+
+		data: The data to write.
+		path: (String) The output path.
+
+	Returns:
+
+		None
+
+	"""
+
+	temp_path = f'{path}.tmp'
+
+	with open(temp_path, 'w') as f:
+
+		json.dump(data, f, indent=1, sort_keys=True)
+
+	os.replace(temp_path, path)
+
+
+class RunManifest:
+	"""
+	The checkpoint manifest of a batch run, stored as manifest.json in the output directory.
+
+	It records the checksums of the inputs and each completed unit of work (a family or a family and contig) with the
+	key of the inputs it was run with. Each unit is saved as soon as it finishes so a rerun after a failure only runs
+	the units which are missing or stale.
+
+	path: Path to the manifest file (String)
+	inputs: Dictionary with the input name as the key and the checksum from get_file_checksum() as the value (Dict)
+	units: Dictionary with the unit_id as the key and the unit result as the value (Dict)
+
+	"""
+
+	def __init__(self, output_dir):
+
+		self.path = os.path.join(output_dir, 'manifest.json')
+		self.inputs = {}
+		self.units = {}
+
+		if os.path.exists(self.path):
+
+			with open(self.path) as f:
+
+				manifest = json.load(f)
+
+			self.inputs = manifest['inputs']
+			self.units = manifest['units']
+
+	def update_input(self, name, path):
+		"""
+		Checksum an input file, reusing the previous checksum if the file has not changed.
+
+		Input:
+
+			name: (String) The input name e.g. vcf
+			path: (String) Path to the input file.
+
+		Returns:
+
+			sha256: (String) The checksum of the file.
+
+		"""
+
+		self.inputs[name] = get_file_checksum(path, previous=self.inputs.get(name))
+
+		return self.inputs[name]['sha256']
+
+	def is_complete(self, unit_id, key):
+		"""
+		Check whether a unit has completed with the same inputs and its output still exists.
+
+		Input:
+
+			unit_id: (String) The unit.
+			key: (String) The unit key from get_unit_key()
+
+		Returns:
+
+			True if the unit can be skipped otherwise False.
+
+		"""
+
+		unit = self.units.get(unit_id)
+
+		if unit == None or unit['key'] != key or unit['status'] != 'completed':
+
+			return False
+
+		return unit['output'] != None and os.path.exists(unit['output'])
+
+	def set_unit(self, unit_id, key, result):
+		"""
+		Record the result of a unit and save the manifest.
+
+		Input:
+
+			unit_id: (String) The unit.
+			key: (String) The unit key from get_unit_key()
+			result: (Dict) The unit result e.g. from cli.run_family()
+
+		Returns:
+
+			None
+
+		"""
+
+		unit = dict(result)
+		unit['key'] = key
+
+		self.units[unit_id] = unit
+
+		self.save()
+
+	def save(self):
+		"""
+		Write the manifest atomically.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		write_json_atomic({'inputs': self.inputs, 'units': self.units}, self.path)
@@ -0,0 +1,616 @@
+from pyvariantfilter.family import Family
+from pyvariantfilter.variant_set import VariantSet
+from pyvariantfilter.config import AnalysisConfig, load_analysis_config
+from pyvariantfilter.variant import VALID_CHROMS
+from pyvariantfilter.utils import get_valid_contigs, get_regions
+from pyvariantfilter.checkpoint import RunManifest, get_unit_key, write_json_atomic
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pysam import VariantFile
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ['tsv', 'parquet']
+
+
+def read_ped_families(ped_file_path):
+	"""
+	Get the samples of each family in a PED file.
+
+	Input:
+
+		ped_file_path: (String) Path to the PED file.
+
+	Returns:
+
+		families: (Dict) Dictionary with the family_id as the key and a list of PED rows as the value in file order.
+
+	"""
+
+	families = {}
+
+	with open(ped_file_path) as csvfile:
+
+		for row in csv.reader(csvfile, delimiter='\t'):
+
+			if not row or row[0].startswith('#'):
+
+				continue
+
+			families.setdefault(row[0], []).append(row)
+
+	return families
+
+
+def get_default_proband(ped_rows):
+	"""
+	Choose the proband for a family - the first affected sample with both parents in the family, otherwise the first
+	affected sample.
+
+	Input:
+
+		ped_rows: (List) The PED rows of one family.
+
+	Returns:
+
+		proband_id: (String) The sample to use as the proband.
+
+	"""
+
+	samples = set(row[1] for row in ped_rows)
+
+	affected = [row for row in ped_rows if row[5] == '2']
+
+	if not affected:
+
+		raise ValueError(f'Family {ped_rows[0][0]} has no affected samples to use as the proband.')
+
+	for row in affected:
+
+		if row[2] in samples and row[3] in samples:
+
+			return row[1]
+
+	return affected[0][1]
+
+
+def run_family(vcf_file, ped_file_path, family_id, proband_id, config, output, output_format='tsv', regions=None, platypus=False):
+	"""
+	Run ingest, compound hets, inheritance and export for one family.
+
+	Input:
+
+		vcf_file: (String) Path to the VCF.
+		ped_file_path: (String) Path to the PED file.
+		family_id: (String) The family to analyse.
+		proband_id: (String) The proband.
+		config: (Dict) The analysis config from AnalysisConfig.to_dict()
+		output: (String) Path to the output file. It is written to a temporary file first so it only exists once complete.
+		output_format: (String) tsv or parquet
+		regions: (String or List) Optional BED file or list of (chrom, start, end) regions to load. Requires an indexed VCF.
+		platypus: (Boolean) Read the VCF with read_variants_from_platypus_vcf()
+
+	Returns:
+
+		result: (Dict) The family_id, proband_id, status, number of variants, output path, wall time, import filter
+		rejections and stage stats.
+
+	"""
+
+	start_time = time.perf_counter()
+
+	result = {'family_id': family_id,
+			  'proband_id': proband_id,
+			  'status': 'failed',
+			  'variants': 0,
+			  'rows': 0,
+			  'output': None,
+			  'error': None,
+			  'wall_time': 0.0,
+			  'import_filter_rejected': None,
+			  'stats': None}
+
+	try:
+
+		analysis_config = AnalysisConfig(config)
+
+		import_filter = analysis_config.get_import_filter()
+
+		family = Family(family_id)
+		family.read_from_ped_file(ped_file_path, family_id, proband_id)
+
+		variant_set = VariantSet()
+		variant_set.add_family(family)
+		variant_set.enable_stats()
+
+		if platypus == True:
+
+			reader = variant_set.read_variants_from_platypus_vcf
+
+		else:
+
+			reader = variant_set.read_variants_from_vcf
+
+		reader(vcf_file, filter_func=import_filter, args=(proband_id,), regions=regions)
+
+		variant_set.get_candidate_compound_hets(**analysis_config.get_candidate_compound_het_args())
+		variant_set.filter_compound_hets(**analysis_config.get_filter_compound_het_args())
+		variant_set.get_filtered_compound_hets_as_dict()
+
+		df = variant_set.to_df(**analysis_config.get_inheritance_args())
+
+		output_config = analysis_config.config['output']
+
+		if output_config['matching_models_only'] == True and len(df) > 0:
+
+			df = df[df['inheritance_models'] != '']
+
+		if output_config['columns'] != None:
+
+			df = df.reindex(columns=output_config['columns'])
+
+		write_output(df, output, output_format)
+
+		result['status'] = 'completed'
+		result['variants'] = len(variant_set.variant_dict)
+		result['rows'] = len(df)
+		result['output'] = output
+		result['import_filter_rejected'] = import_filter.rejected
+		result['stats'] = variant_set.stats.to_dict()
+
+	except Exception as e:
+
+		logger.exception(f'Family {family_id} failed.')
+
+		result['error'] = f'{type(e).__name__}: {e}'
+
+	result['wall_time'] = time.perf_counter() - start_time
+
+	return result
+
+
+def write_output(df, output, output_format):
+	"""
+	Write a DataFrame to a temporary file and then move it into place so a crash never leaves a partial output.
+
+	Input:
+
+		df: (DataFrame) The data to write.
+		output: (String) The output path.
+		output_format: (String) tsv or parquet
+
+	Returns:
+
+		None
+
+	"""
+
+	temp_output = f'{output}.tmp'
+
+	if output_format == 'tsv':
+
+		df.to_csv(temp_output, sep='\t', index=False)
+
+	elif output_format == 'parquet':
+
+		df.to_parquet(temp_output, index=False)
+
+	else:
+
+		raise ValueError(f'output_format must be one of {OUTPUT_FORMATS}')
+
+	os.replace(temp_output, output)
+
+
+def read_output(output, output_format):
+	"""
+	Read an output written by write_output(). TSV values are read as strings so they are written back unchanged.
+
+	Input:
+
+		output: (String) The output path.
+		output_format: (String) tsv or parquet
+
+	Returns:
+
+		df: (DataFrame) The output.
+
+	"""
+
+	if output_format == 'tsv':
+
+		try:
+
+			return pd.read_csv(output, sep='\t', dtype=str, keep_default_na=False)
+
+		except pd.errors.EmptyDataError:
+
+			# A family or contig with no variants.
+			return pd.DataFrame()
+
+	return pd.read_parquet(output)
+
+
+def get_contig_regions(vcf_file, regions=None):
+	"""
+	Get the regions to load for each contig of an indexed VCF so a family can be split into one unit per contig.
+	Compound hets are always within a gene so each contig can be analysed on its own.
+
+	Input:
+
+		vcf_file: (String) Path to the indexed VCF.
+		regions: (String) Optional BED file. Only the regions on each contig are loaded and contigs without any are skipped.
+
+	Returns:
+
+		contig_regions: (Dict) Dictionary with the chromosome (without a chr prefix) as the key and a list of
+		(chrom, start, end) regions as the value in VCF order.
+
+	"""
+
+	bcf_in = VariantFile(vcf_file)
+
+	if bcf_in.index == None:
+
+		raise ValueError('An indexed VCF is required to split families by contig.')
+
+	contigs = list(bcf_in.header.contigs) + [contig for contig in bcf_in.index if contig not in bcf_in.header.contigs]
+
+	valid_contigs, invalid_contigs = get_valid_contigs(contigs, VALID_CHROMS)
+
+	merged_regions = None
+
+	if regions != None:
+
+		merged_regions = get_regions(regions=regions)
+
+	contig_regions = {}
+
+	for contig in contigs:
+
+		if contig not in valid_contigs or contig not in bcf_in.index:
+
+			continue
+
+		chrom = valid_contigs[contig]
+
+		if merged_regions == None:
+
+			length = bcf_in.header.contigs[contig].length if contig in bcf_in.header.contigs else None
+
+			if length == None:
+
+				length = 2 ** 31 - 1
+
+			contig_regions[chrom] = [(chrom, 0, length)]
+
+		elif chrom in merged_regions:
+
+			contig_regions[chrom] = [(chrom, start, end) for start, end in merged_regions[chrom]]
+
+	bcf_in.close()
+
+	return contig_regions
+
+
+def get_parser():
+	"""
+	Get the argument parser for the command line.
+	"""
+
+	parser = argparse.ArgumentParser(prog='pyvariantfilter', description='Filter the variants of one or more families in a VCF.')
+
+	parser.add_argument('--vcf', required=True, help='VEP annotated VCF containing every family.')
+	parser.add_argument('--ped', required=True, help='PED file with one or more families.')
+	parser.add_argument('--config', default=None, help='JSON or YAML analysis config. Missing sections and keys use the defaults in pyvariantfilter.config.CONFIG_SCHEMA.')
+	parser.add_argument('--output', required=True, help='Output directory.')
+	parser.add_argument('--families', nargs='+', default=None, help='Only analyse these families. Defaults to every family in the PED file.')
+	parser.add_argument('--proband', action='append', default=[], metavar='FAMILY:SAMPLE', help='Set the proband of a family. Defaults to the first affected sample with both parents in the PED file.')
+	parser.add_argument('--threads', type=int, default=1, help='Number of families to analyse at once.')
+	parser.add_argument('--regions', default=None, help='BED file of regions to load. Requires an indexed VCF.')
+	parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None, dest='output_format', help='Output file format. Overrides output.format in the config.')
+	parser.add_argument('--platypus', action='store_true', help='Read a Platypus VCF.')
+	parser.add_argument('--split-contigs', action='store_true', help='Analyse and checkpoint each family one contig at a time. Requires an indexed VCF.')
+	parser.add_argument('--force', action='store_true', help='Run every unit again even if it completed in a previous run.')
+
+	return parser
+
+
+def run_units(units, threads, manifest):
+	"""
+	Run the units which are not already complete, saving each to the manifest as soon as it finishes.
+
+	Input:
+
+		units: (List) Unit dictionaries with the keys unit_id, key and args (the arguments for run_family())
+		threads: (Integer) Number of units to run at once.
+		manifest: (RunManifest) The checkpoint manifest.
+
+	Returns:
+
+		results: (Dict) Dictionary with the unit_id as the key and the result of run_family() as the value.
+
+	"""
+
+	results = {}
+
+	if threads == 1 or len(units) <= 1:
+
+		for unit in units:
+
+			results[unit['unit_id']] = run_family(*unit['args'])
+
+			manifest.set_unit(unit['unit_id'], unit['key'], results[unit['unit_id']])
+
+	else:
+
+		# Each unit is read and filtered in its own process.
+		with ProcessPoolExecutor(max_workers=threads) as executor:
+
+			futures = {executor.submit(run_family, *unit['args']): unit for unit in units}
+
+			for future in as_completed(futures):
+
+				unit = futures[future]
+
+				results[unit['unit_id']] = future.result()
+
+				manifest.set_unit(unit['unit_id'], unit['key'], results[unit['unit_id']])
+
+	return results
+
+
+def merge_family_outputs(family_id, unit_results, output, output_format):
+	"""
+	Merge the per contig outputs of a family into a single output.
+
+	Input:
+
+		family_id: (String) The family.
+		unit_results: (List) The results of the family's contig units in contig order.
+		output: (String) The family output path.
+		output_format: (String) tsv or parquet
+
+	Returns:
+
+		result: (Dict) The family result with the summed counts of its units.
+
+	"""
+
+	result = {'family_id': family_id,
+			  'proband_id': unit_results[0]['proband_id'],
+			  'status': 'failed',
+			  'variants': sum(unit['variants'] for unit in unit_results),
+			  'rows': sum(unit['rows'] for unit in unit_results),
+			  'output': None,
+			  'error': None,
+			  'wall_time': sum(unit['wall_time'] for unit in unit_results)}
+
+	failed = [unit for unit in unit_results if unit['status'] != 'completed']
+
+	if failed:
+
+		result['error'] = f'{len(failed)} contig units failed.'
+
+		return result
+
+	dfs = [read_output(unit['output'], output_format) for unit in unit_results if unit['rows'] > 0]
+
+	if dfs:
+
+		df = pd.concat(dfs, ignore_index=True, sort=False)
+
+	else:
+
+		df = pd.DataFrame()
+
+	write_output(df, output, output_format)
+
+	result['status'] = 'completed'
+	result['output'] = output
+
+	return result
+
+
+def main(argv=None):
+	"""
+	Run the command line and write a run_summary.json to the output directory.
+
+	The work is split into units - one per family or with --split-contigs one per family and contig. Each completed
+	unit is recorded in manifest.json in the output directory along with the checksums of the inputs. Running the
+	same command again skips the units which completed with the same VCF, PED rows, proband, regions and config and
+	only runs the missing, failed or stale ones.
+
+	Input:
+
+		argv: (List) The command line arguments. Defaults to sys.argv
+
+	Returns:
+
+		exit_code: (Integer) 0 if every family completed otherwise 1.
+
+	"""
+
+	args = get_parser().parse_args(argv)
+
+	logging.basicConfig(level=logging.INFO)
+
+	if args.threads < 1:
+
+		raise ValueError('--threads must be at least 1')
+
+	start_time = time.perf_counter()
+
+	analysis_config = load_analysis_config(args.config)
+
+	config = analysis_config.to_dict()
+
+	output_format = args.output_format
+
+	if output_format == None:
+
+		output_format = config['output']['format']
+
+	ped_families = read_ped_families(args.ped)
+
+	family_ids = args.families
+
+	if family_ids == None:
+
+		family_ids = list(ped_families)
+
+	for family_id in family_ids:
+
+		if family_id not in ped_families:
+
+			raise ValueError(f'Family {family_id} is not in the PED file.')
+
+	probands = {}
+
+	for proband in args.proband:
+
+		family_id, proband_id = proband.split(':', 1)
+
+		probands[family_id] = proband_id
+
+	os.makedirs(args.output, exist_ok=True)
+
+	manifest = RunManifest(args.output)
+
+	input_checksums = {'vcf': manifest.update_input('vcf', args.vcf)}
+
+	manifest.update_input('ped', args.ped)
+
+	if args.regions != None:
+
+		input_checksums['regions'] = manifest.update_input('regions', args.regions)
+
+	manifest.save()
+
+	contig_regions = None
+
+	if args.split_contigs == True:
+
+		contig_regions = get_contig_regions(args.vcf, regions=args.regions)
+
+		os.makedirs(os.path.join(args.output, 'units'), exist_ok=True)
+
+	units = []
+	family_units = {}
+
+	for family_id in family_ids:
+
+		proband_id = probands.get(family_id)
+
+		if proband_id == None:
+
+			proband_id = get_default_proband(ped_families[family_id])
+
+		# Only this family's PED rows so editing another family does not make its results stale.
+		unit_inputs = {'inputs': input_checksums,
+					   'ped_rows': ped_families[family_id],
+					   'proband_id': proband_id,
+					   'config_hash': analysis_config.get_hash(),
+					   'output_format': output_format,
+					   'platypus': args.platypus}
+
+		if contig_regions == None:
+
+			output = os.path.join(args.output, f'{family_id}.{output_format}')
+
+			units.append({'unit_id': family_id,
+						  'key': get_unit_key(unit_inputs),
+						  'args': (args.vcf, args.ped, family_id, proband_id, config, output, output_format, args.regions, args.platypus)})
+
+			family_units[family_id] = [family_id]
+
+		else:
+
+			family_units[family_id] = []
+
+			for chrom, regions in contig_regions.items():
+
+				unit_id = f'{family_id}:{chrom}'
+
+				output = os.path.join(args.output, 'units', f'{family_id}.{chrom}.{output_format}')
+
+				unit_inputs['regions'] = regions
+
+				units.append({'unit_id': unit_id,
+							  'key': get_unit_key(unit_inputs),
+							  'args': (args.vcf, args.ped, family_id, proband_id, config, output, output_format, regions, args.platypus)})
+
+				family_units[family_id].append(unit_id)
+
+	units_to_run = [unit for unit in units if args.force == True or not manifest.is_complete(unit['unit_id'], unit['key'])]
+
+	skipped = len(units) - len(units_to_run)
+
+	if skipped > 0:
+
+		logger.info(f'Skipping {skipped} units completed in a previous run.')
+
+	run_results = run_units(units_to_run, args.threads, manifest)
+
+	results = []
+
+	for family_id in family_ids:
+
+		unit_results = []
+
+		for unit_id in family_units[family_id]:
+
+			unit_result = dict(manifest.units[unit_id])
+			unit_result['skipped'] = unit_id not in run_results
+
+			del unit_result['key']
+
+			unit_results.append(unit_result)
+
+		if contig_regions == None:
+
+			results.append(unit_results[0])
+
+		else:
+
+			family_result = merge_family_outputs(family_id, unit_results, os.path.join(args.output, f'{family_id}.{output_format}'), output_format)
+			family_result['skipped'] = all(unit['skipped'] for unit in unit_results)
+			family_result['units'] = unit_results
+
+			results.append(family_result)
+
+	summary = {'vcf': os.path.abspath(args.vcf),
+			   'ped': os.path.abspath(args.ped),
+			   'inputs': manifest.inputs,
+			   'config': config,
+			   'config_hash': analysis_config.get_hash(),
+			   'import_filter_plan': analysis_config.get_import_filter().get_plan(),
+			   'output_format': output_format,
+			   'regions': args.regions,
+			   'split_contigs': args.split_contigs,
+			   'threads': args.threads,
+			   'wall_time': time.perf_counter() - start_time,
+			   'units_run': len(run_results),
+			   'units_skipped': skipped,
+			   'families_completed': sum(1 for result in results if result['status'] == 'completed'),
+			   'families_failed': sum(1 for result in results if result['status'] == 'failed'),
+			   'families': results}
+
+	write_json_atomic(summary, os.path.join(args.output, 'run_summary.json'))
+
+	if summary['families_failed'] > 0:
+
+		return 1
+
+	return 0
+
+
+if __name__ == '__main__':
+
+	sys.exit(main())
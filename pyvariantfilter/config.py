@@ -0,0 +1,529 @@
+from pyvariantfilter.variant import FILTER_CONTEXTS
+import copy
+import hashlib
+import json
+import os
+
+# The consequences used by the default import filter i.e. protein altering and splice region variants.
+DEFAULT_IMPORT_CONSEQUENCES = ['transcript_ablation',
+							   'splice_acceptor_variant',
+							   'splice_donor_variant',
+							   'stop_gained',
+							   'frameshift_variant',
+							   'stop_lost',
+							   'start_lost',
+							   'transcript_amplification',
+							   'inframe_insertion',
+							   'inframe_deletion',
+							   'missense_variant',
+							   'protein_altering_variant',
+							   'splice_region_variant']
+
+# The default consequences of VariantSet.get_candidate_compound_hets()
+DEFAULT_COMPOUND_HET_CONSEQUENCES = DEFAULT_IMPORT_CONSEQUENCES + ['incomplete_terminal_codon_variant',
+																   'start_retained_variant',
+																   'stop_retained_variant',
+																   'synonymous_variant',
+																   'coding_sequence_variant',
+																   'mature_miRNA_variant',
+																   '5_prime_UTR_variant',
+																   '3_prime_UTR_variant',
+																   'non_coding_transcript_exon_variant',
+																   'intron_variant',
+																   'NMD_transcript_variant',
+																   'non_coding_transcript_variant',
+																   'upstream_gene_variant',
+																   'downstream_gene_variant',
+																   'TFBS_ablation',
+																   'TFBS_amplification',
+																   'TF_binding_site_variant',
+																   'regulatory_region_ablation',
+																   'regulatory_region_amplification',
+																   'feature_elongation',
+																   'regulatory_region_variant',
+																   'feature_truncation']
+
+# Each section of an analysis config with the type and default of each key. A type of 'set' is a list of strings
+# where the order does not matter.
+CONFIG_SCHEMA = {'import_filter': {'proband_has_alt': (bool, True),
+								   'pass_only': (bool, True),
+								   'min_dp': (int, 20),
+								   'min_gq': (int, 30),
+								   'consequences': ('set', DEFAULT_IMPORT_CONSEQUENCES),
+								   'numerical_filters': (list, [{'annotation_key': 'gnomAD_AF'}])},
+				 'compound_hets': {'feature_key': (str, 'Feature'),
+								   'consequences': ('set', DEFAULT_COMPOUND_HET_CONSEQUENCES),
+								   'include_both_parents_missing': (bool, True),
+								   'include_denovo': (bool, True),
+								   'allow_hets_in_unaffected': (bool, False),
+								   'check_affected': (bool, True)},
+				 'inheritance': {'lenient': (bool, False),
+								 'low_penetrance_genes': ('set', []),
+								 'min_parental_gq_dn': (int, 30),
+								 'min_parental_depth_dn': (int, 10),
+								 'max_parental_alt_ref_ratio_dn': (float, 0.04),
+								 'min_parental_gq_upi': (int, 30),
+								 'min_parental_depth_upi': (int, 10)},
+				 'output': {'format': (str, 'tsv'),
+							'matching_models_only': (bool, True),
+							'columns': (list, None)}}
+
+# The import filter runs before compound hets are found so a variant never has the compound_het context.
+IMPORT_FILTER_CONTEXTS = [context for context in FILTER_CONTEXTS if context != 'compound_het']
+
+# A numerical filter compares an annotation against a threshold for each filter context - see
+# Variant.filter_on_numerical_transcript_annotation_lte()
+NUMERICAL_FILTER_SCHEMA = {'annotation_key': (str, None),
+						   'annotation_type': (str, 'transcript'),
+						   'comparison': (str, 'lte'),
+						   'thresholds': (dict, {context: 0.01 for context in IMPORT_FILTER_CONTEXTS}),
+						   'zero_values': (list, ['.', '', None]),
+						   'agg_func': (str, 'min')}
+
+# The relative cost of each import filter predicate. Cheaper predicates run first.
+PREDICATE_COSTS = {'proband_has_alt': 0,
+				   'pass_only': 1,
+				   'genotype_quality': 2,
+				   'consequences': 3,
+				   'numerical_info': 4,
+				   'numerical_transcript': 5}
+
+
+def validate_value(section, key, value, expected_type):
+	"""
+	Check the type of a config value and put it in a canonical form so that equivalent configs hash the same.
+
+	Input:
+
+		section: (String) The config section for error messages.
+		key: (String) The config key for error messages.
+		value: The value to check.
+		expected_type: The type from CONFIG_SCHEMA.
+
+	Returns:
+
+		value: The value in canonical form e.g. sets are sorted and unique, integers given for floats become floats.
+
+	"""
+
+	if value == None:
+
+		return None
+
+	if expected_type == 'set':
+
+		if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+
+			raise ValueError(f'{section}.{key} must be a list of strings.')
+
+		return sorted(set(value))
+
+	if expected_type == float:
+
+		if isinstance(value, bool) or not isinstance(value, (int, float)):
+
+			raise ValueError(f'{section}.{key} must be a number.')
+
+		return float(value)
+
+	if expected_type == int:
+
+		if isinstance(value, bool) or not isinstance(value, int):
+
+			raise ValueError(f'{section}.{key} must be an integer.')
+
+		return value
+
+	if not isinstance(value, expected_type):
+
+		raise ValueError(f'{section}.{key} must be a {expected_type.__name__}.')
+
+	return value
+
+
+def validate_numerical_filter(numerical_filter):
+	"""
+	Check a numerical filter and fill in its defaults.
+
+	Input:
+
+		numerical_filter: (Dict) One entry of import_filter.numerical_filters
+
+	Returns:
+
+		numerical_filter: (Dict) The validated filter with every key of NUMERICAL_FILTER_SCHEMA.
+
+	"""
+
+	if not isinstance(numerical_filter, dict):
+
+		raise ValueError('Each import_filter.numerical_filters entry must be a dictionary.')
+
+	unknown_keys = [key for key in numerical_filter if key not in NUMERICAL_FILTER_SCHEMA]
+
+	if unknown_keys:
+
+		raise ValueError(f'Unknown numerical filter keys {unknown_keys} - must be one of {list(NUMERICAL_FILTER_SCHEMA)}.')
+
+	if 'annotation_key' not in numerical_filter:
+
+		raise ValueError('A numerical filter must have an annotation_key.')
+
+	validated = {}
+
+	for key, (expected_type, default) in NUMERICAL_FILTER_SCHEMA.items():
+
+		value = copy.deepcopy(numerical_filter.get(key, default))
+
+		validated[key] = validate_value('numerical_filters', key, value, expected_type)
+
+	if validated['annotation_type'] not in ['transcript', 'info']:
+
+		raise ValueError('annotation_type must be transcript or info')
+
+	if validated['comparison'] not in ['lte', 'gte']:
+
+		raise ValueError('comparison must be lte or gte')
+
+	if validated['agg_func'] not in ['min', 'max', 'mean']:
+
+		raise ValueError('agg_func must be min, max or mean')
+
+	if 'compound_het' in validated['thresholds']:
+
+		raise ValueError(f'The {validated["annotation_key"]} filter has a compound_het threshold but the import filter runs before compound hets are found.')
+
+	thresholds = {}
+
+	for context in IMPORT_FILTER_CONTEXTS:
+
+		if context not in validated['thresholds']:
+
+			raise ValueError(f'The {validated["annotation_key"]} filter has no threshold for {context}.')
+
+		thresholds[context] = validate_value('thresholds', context, validated['thresholds'][context], float)
+
+	unknown_contexts = [context for context in validated['thresholds'] if context not in IMPORT_FILTER_CONTEXTS]
+
+	if unknown_contexts:
+
+		raise ValueError(f'Unknown filter contexts {unknown_contexts} - must be one of {IMPORT_FILTER_CONTEXTS}.')
+
+	validated['thresholds'] = thresholds
+
+	return validated
+
+
+class AnalysisConfig:
+	"""
+	A declarative analysis config covering the import filter, compound het grouping, inheritance model parameters
+	and output. It replaces a hand written filter_func so that an analysis can be stored, compared and cached.
+
+	Missing sections and keys take their defaults from CONFIG_SCHEMA and the values are put in a canonical form,
+	so two configs which describe the same analysis have the same get_hash().
+
+	config: The validated config with every section and key (Dict)
+
+	"""
+
+	def __init__(self, config_dict={}):
+
+		if not isinstance(config_dict, dict):
+
+			raise ValueError('An analysis config must be a dictionary.')
+
+		unknown_sections = [section for section in config_dict if section not in CONFIG_SCHEMA]
+
+		if unknown_sections:
+
+			raise ValueError(f'Unknown config sections {unknown_sections} - must be one of {list(CONFIG_SCHEMA)}.')
+
+		self.config = {}
+
+		for section, section_schema in CONFIG_SCHEMA.items():
+
+			section_dict = config_dict.get(section, {})
+
+			if not isinstance(section_dict, dict):
+
+				raise ValueError(f'Config section {section} must be a dictionary.')
+
+			unknown_keys = [key for key in section_dict if key not in section_schema]
+
+			if unknown_keys:
+
+				raise ValueError(f'Unknown {section} keys {unknown_keys} - must be one of {list(section_schema)}.')
+
+			self.config[section] = {}
+
+			for key, (expected_type, default) in section_schema.items():
+
+				value = copy.deepcopy(section_dict.get(key, default))
+
+				self.config[section][key] = validate_value(section, key, value, expected_type)
+
+		numerical_filters = self.config['import_filter']['numerical_filters']
+
+		if numerical_filters != None:
+
+			self.config['import_filter']['numerical_filters'] = [validate_numerical_filter(numerical_filter) for numerical_filter in numerical_filters]
+
+		if self.config['output']['format'] not in ['tsv', 'parquet']:
+
+			raise ValueError('output.format must be tsv or parquet')
+
+		columns = self.config['output']['columns']
+
+		if columns != None and not all(isinstance(column, str) for column in columns):
+
+			raise ValueError('output.columns must be a list of strings.')
+
+	def __eq__(self, other):
+
+		return isinstance(other, AnalysisConfig) and self.config == other.config
+
+	def to_dict(self):
+		"""
+		Get the validated config as a dictionary.
+
+		Input: Self
+
+		Returns:
+
+			config: (Dict) A copy of the validated config.
+
+		"""
+
+		return copy.deepcopy(self.config)
+
+	def to_json(self):
+		"""
+		Get the config as canonical JSON i.e. sorted keys and no whitespace.
+
+		Input: Self
+
+		Returns:
+
+			config_json: (String) The config as JSON.
+
+		"""
+
+		return json.dumps(self.config, sort_keys=True, separators=(',', ':'))
+
+	def get_hash(self):
+		"""
+		Get a deterministic hash of the config. Results can be cached on the inputs and this hash.
+
+		Input: Self
+
+		Returns:
+
+			config_hash: (String) SHA-256 hex digest of self.to_json()
+
+		"""
+
+		return hashlib.sha256(self.to_json().encode()).hexdigest()
+
+	def get_import_filter(self):
+		"""
+		Compile the import_filter section into an ImportFilterPlan for use as a reader filter_func.
+
+		Input: Self
+
+		Returns:
+
+			plan: (ImportFilterPlan) The compiled import filter.
+
+		"""
+
+		return ImportFilterPlan(self.config['import_filter'])
+
+	def get_candidate_compound_het_args(self):
+		"""
+		Get the keyword arguments for VariantSet.get_candidate_compound_hets()
+		"""
+
+		compound_hets = self.config['compound_hets']
+
+		return {'feature_key': compound_hets['feature_key'],
+				'consequences': {consequence: None for consequence in compound_hets['consequences']}}
+
+	def get_filter_compound_het_args(self):
+		"""
+		Get the keyword arguments for VariantSet.filter_compound_hets()
+		"""
+
+		compound_hets = self.config['compound_hets']
+
+		return {key: compound_hets[key] for key in ['include_both_parents_missing', 'include_denovo', 'allow_hets_in_unaffected', 'check_affected']}
+
+	def get_inheritance_args(self):
+		"""
+		Get the keyword arguments for VariantSet.to_df() and VariantSet.get_variant_inheritance_models()
+		"""
+
+		inheritance_args = dict(self.config['inheritance'])
+		inheritance_args['low_penetrance_genes'] = set(inheritance_args['low_penetrance_genes'])
+
+		return inheritance_args
+
+
+class ImportFilterPlan:
+	"""
+	An import filter compiled from the import_filter section of an AnalysisConfig.
+
+	Each check is a predicate with a relative cost from PREDICATE_COSTS and the predicates run cheapest first so that
+	most variants are rejected before any transcript annotations are parsed as numbers. The number of variants each
+	predicate rejects is counted.
+
+	Pass the plan as the filter_func of a reader with args=(proband_id,)
+
+	predicates: List of (name, predicate) tuples in the order they run (List)
+	rejected: Dictionary with the predicate name as the key and the number of variants it rejected as the value (Dict)
+
+	"""
+
+	def __init__(self, import_filter):
+
+		predicates = []
+
+		if import_filter['proband_has_alt'] == True:
+
+			predicates.append(('proband_has_alt', 'proband_has_alt', lambda variant, proband_id: variant.has_alt(proband_id)))
+
+		if import_filter['pass_only'] == True:
+
+			predicates.append(('pass_only', 'pass_only', lambda variant, proband_id: variant.passes_filter()))
+
+		if import_filter['min_dp'] != None or import_filter['min_gq'] != None:
+
+			min_dp = import_filter['min_dp'] or 0
+			min_gq = import_filter['min_gq'] or 0
+
+			predicates.append(('genotype_quality', 'genotype_quality', lambda variant, proband_id: variant.passes_gt_filter(proband_id, min_dp=min_dp, min_gq=min_gq)))
+
+		if import_filter['consequences'] != None:
+
+			consequences = set(import_filter['consequences'])
+
+			predicates.append(('consequences', 'consequences', lambda variant, proband_id: variant.get_worst_consequence() in consequences))
+
+		for numerical_filter in import_filter['numerical_filters'] or []:
+
+			name = f'{numerical_filter["annotation_type"]}_{numerical_filter["annotation_key"]}_{numerical_filter["comparison"]}'
+
+			predicates.append((f'numerical_{numerical_filter["annotation_type"]}', name, get_numerical_predicate(numerical_filter)))
+
+		# sorted() is stable so predicates with the same cost keep the config order.
+		predicates = sorted(predicates, key=lambda predicate: PREDICATE_COSTS[predicate[0]])
+
+		self.predicates = [(name, predicate) for cost_key, name, predicate in predicates]
+		self.rejected = {name: 0 for name, predicate in self.predicates}
+
+	def __call__(self, variant, proband_id):
+
+		for name, predicate in self.predicates:
+
+			if predicate(variant, proband_id) == False:
+
+				self.rejected[name] += 1
+
+				return False
+
+		return True
+
+	def get_plan(self):
+		"""
+		Get the names of the predicates in the order they run.
+
+		Input: Self
+
+		Returns:
+
+			plan: (List) The predicate names.
+
+		"""
+
+		return [name for name, predicate in self.predicates]
+
+
+def get_numerical_predicate(numerical_filter):
+	"""
+	Get a predicate for a numerical filter from the Variant.filter_on_numerical_* methods. A variant without a filter
+	context e.g. the proband is homozygous reference fails the filter rather than raising a ValueError.
+
+	Input:
+
+		numerical_filter: (Dict) A validated numerical filter.
+
+	Returns:
+
+		predicate: Function taking a variant and proband_id and returning True if the variant passes.
+
+	"""
+
+	method_name = f'filter_on_numerical_{numerical_filter["annotation_type"]}_annotation_{numerical_filter["comparison"]}'
+
+	annotation_key = numerical_filter['annotation_key']
+	thresholds = numerical_filter['thresholds']
+	zero_values = numerical_filter['zero_values']
+	agg_func = numerical_filter['agg_func']
+
+	def predicate(variant, proband_id):
+
+		if variant.get_filter_context() == None:
+
+			return False
+
+		return getattr(variant, method_name)(annotation_key,
+											 compound_het=None,
+											 zero_values=zero_values,
+											 agg_func=agg_func,
+											 **thresholds)
+
+	return predicate
+
+
+def load_analysis_config(config_path=None):
+	"""
+	Load an analysis config from a JSON or YAML file. YAML needs the optional PyYAML package.
+
+	Input:
+
+		config_path: (String) Path to a .json, .yaml or .yml file. Use None for the default config.
+
+	Returns:
+
+		config: (AnalysisConfig) The validated config.
+
+	"""
+
+	if config_path == None:
+
+		return AnalysisConfig()
+
+	extension = os.path.splitext(config_path)[1].lower()
+
+	with open(config_path) as f:
+
+		if extension in ['.yaml', '.yml']:
+
+			try:
+
+				import yaml
+
+			except ImportError:
+
+				raise ImportError('Reading YAML configs requires PyYAML. Install it with pip install pyyaml.')
+
+			config_dict = yaml.safe_load(f)
+
+		else:
+
+			config_dict = json.load(f)
+
+	if config_dict == None:
+
+		config_dict = {}
+
+	return AnalysisConfig(config_dict)
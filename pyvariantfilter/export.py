@@ -0,0 +1,382 @@
+import sqlite3
+import pandas as pd
+
+VARIANT_COLUMNS = ['variant_key',
+				   'variant_id',
+				   'family_id',
+				   'chromosome',
+				   'position',
+				   'ref',
+				   'alt',
+				   'filter_status',
+				   'quality',
+				   'worst_consequence']
+
+GENOTYPE_COLUMNS = ['variant_key',
+					'sample',
+					'genotype',
+					'ref_reads',
+					'alt_reads',
+					'depth',
+					'genotype_quality']
+
+TRANSCRIPT_COLUMNS = ['variant_key', 'transcript_number']
+
+TABLE_NAMES = ['variants', 'genotypes', 'transcripts']
+
+
+def format_info_value(value):
+	"""
+	Format an INFO value for a normalised table. Multi value fields become a comma separated string as in the VCF.
+
+	Input:
+
+		value: An INFO value from Variant.info_annotations
+
+	Returns:
+
+		value: The value unchanged or a string if it was a tuple or list.
+
+	"""
+
+	if isinstance(value, (tuple, list)):
+
+		return ','.join(str(x) for x in value)
+
+	return value
+
+
+def get_normalised_columns(variant_set, add_inheritance=True):
+	"""
+	Get the columns of each normalised table. The INFO and CSQ fields can differ between variants so one pass is made
+	over the variants to collect all of them before any rows are written.
+
+	Input:
+
+		variant_set: (VariantSet) The VariantSet to export.
+		add_inheritance: (Boolean) Whether the variants table has an inheritance_models column.
+
+	Returns:
+
+		columns: (Dict) Dictionary with the table name as the key and a list of columns as the value.
+		info_types: (Dict) Dictionary with the info column as the key and the Python type of its non missing values - str
+		if the values have different types e.g. a field with a variable number of values - or None if all are missing.
+
+	"""
+
+	info_value_types = {}
+	csq_keys = {}
+
+	for variant in variant_set.variant_dict.values():
+
+		if variant.info_annotations != None:
+
+			for key, value in variant.info_annotations.items():
+
+				column = f'info_{key}'
+
+				if column not in info_value_types:
+
+					info_value_types[column] = set()
+
+				if value != None:
+
+					info_value_types[column].add(type(format_info_value(value)))
+
+		if variant.transcript_annotations != None:
+
+			for transcript in variant.transcript_annotations:
+
+				for key in transcript:
+
+					csq_keys[key] = None
+
+	info_types = {}
+
+	for column, value_types in info_value_types.items():
+
+		if len(value_types) == 0:
+
+			info_types[column] = None
+
+		elif len(value_types) == 1:
+
+			info_types[column] = value_types.pop()
+
+		else:
+
+			info_types[column] = str
+
+	variant_columns = list(VARIANT_COLUMNS)
+
+	if add_inheritance == True:
+
+		variant_columns.append('inheritance_models')
+
+	if variant_set.gene_scores:
+
+		variant_columns.append('gene_score')
+
+	columns = {'variants': variant_columns + sorted(info_types),
+			   'genotypes': list(GENOTYPE_COLUMNS),
+			   'transcripts': TRANSCRIPT_COLUMNS + [key for key in csq_keys if key not in TRANSCRIPT_COLUMNS]}
+
+	return columns, info_types
+
+
+def iter_normalised_rows(variant_set, add_inheritance=True, inheritance_args={}, chunk_size=10000):
+	"""
+	Iterate over the normalised rows of a VariantSet in chunks.
+
+	Each variant gets an integer variant_key which joins its single row in the variants table to its rows in the
+	genotypes (one per sample) and transcripts (one per transcript annotation) tables.
+
+	Input:
+
+		variant_set: (VariantSet) The VariantSet to export.
+		add_inheritance: (Boolean) Whether to add the inheritance_models column to the variants table.
+		inheritance_args: (Dict) Keyword arguments for VariantSet.get_variant_inheritance_models()
+		chunk_size: (Integer) The number of variants in each chunk.
+
+	Returns:
+
+		Generator of dictionaries with the table name as the key and a list of row dictionaries as the value.
+
+	"""
+
+	chunk = {table_name: [] for table_name in TABLE_NAMES}
+	variants_in_chunk = 0
+
+	for variant_key, variant_id in enumerate(variant_set.variant_dict):
+
+		variant = variant_set.variant_dict[variant_id]
+
+		row = {'variant_key': variant_key,
+			   'variant_id': variant.variant_id,
+			   'family_id': variant.family.family_id,
+			   'chromosome': variant.chrom,
+			   'position': variant.pos,
+			   'ref': variant.ref,
+			   'alt': variant.alt,
+			   'filter_status': None,
+			   'quality': variant.quality,
+			   'worst_consequence': None}
+
+		if variant.filter_status != None:
+
+			row['filter_status'] = '|'.join(variant.filter_status)
+
+		if variant.transcript_annotations != None:
+
+			row['worst_consequence'] = variant.get_worst_consequence()
+
+		if add_inheritance == True:
+
+			row['inheritance_models'] = '|'.join(variant_set.get_variant_inheritance_models(variant_id, **inheritance_args))
+
+		if variant_set.gene_scores:
+
+			row['gene_score'] = variant_set.gene_scores.get(variant_id)
+
+		if variant.info_annotations != None:
+
+			for key, value in variant.info_annotations.items():
+
+				row[f'info_{key}'] = format_info_value(value)
+
+		chunk['variants'].append(row)
+
+		for sample in variant.genotypes:
+
+			genotype_data = variant.genotypes[sample]
+
+			chunk['genotypes'].append({'variant_key': variant_key,
+									   'sample': sample,
+									   'genotype': '/'.join(genotype_data['genotype']),
+									   'ref_reads': genotype_data['allele_depths'][0],
+									   'alt_reads': genotype_data['allele_depths'][1],
+									   'depth': genotype_data['depth'],
+									   'genotype_quality': genotype_data['genotype_quality']})
+
+		if variant.transcript_annotations != None:
+
+			for transcript_number, transcript in enumerate(variant.transcript_annotations):
+
+				transcript_row = {'variant_key': variant_key, 'transcript_number': transcript_number}
+				transcript_row.update(transcript)
+
+				chunk['transcripts'].append(transcript_row)
+
+		variants_in_chunk = variants_in_chunk + 1
+
+		if variants_in_chunk == chunk_size:
+
+			yield chunk
+
+			chunk = {table_name: [] for table_name in TABLE_NAMES}
+			variants_in_chunk = 0
+
+	if variants_in_chunk > 0:
+
+		yield chunk
+
+
+def write_sqlite(chunks, columns, db_path):
+	"""
+	Stream normalised chunks into a SQLite database with one table per normalised table and an index on variant_key.
+
+	Existing tables with the same names are replaced.
+
+	Input:
+
+		chunks: Iterable of chunks from iter_normalised_rows()
+		columns: (Dict) The columns of each table from get_normalised_columns()
+		db_path: (String) Path to the SQLite database.
+
+	Returns:
+
+		None
+
+	"""
+
+	connection = sqlite3.connect(db_path)
+
+	try:
+
+		for table_name in TABLE_NAMES:
+
+			connection.execute(f'DROP TABLE IF EXISTS {table_name}')
+
+		for chunk in chunks:
+
+			for table_name in TABLE_NAMES:
+
+				df = pd.DataFrame(chunk[table_name], columns=columns[table_name])
+
+				df.to_sql(table_name, connection, if_exists='append', index=False)
+
+		for table_name in TABLE_NAMES:
+
+			# Make sure empty tables still exist.
+			pd.DataFrame([], columns=columns[table_name]).to_sql(table_name, connection, if_exists='append', index=False)
+
+			connection.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_variant_key ON {table_name} (variant_key)')
+
+		connection.commit()
+
+	finally:
+
+		connection.close()
+
+
+def get_parquet_schemas(columns, info_types):
+	"""
+	Get a pyarrow schema for each table. Parquet needs the same schema for every chunk so the types are fixed up front
+	rather than inferred from the first chunk.
+
+	Input:
+
+		columns: (Dict) The columns of each table from get_normalised_columns()
+		info_types: (Dict) The info column types from get_normalised_columns()
+
+	Returns:
+
+		schemas: (Dict) Dictionary with the table name as the key and a pyarrow.Schema as the value.
+
+	"""
+
+	import pyarrow as pa
+
+	python_types = {bool: pa.bool_(), int: pa.int64(), float: pa.float64()}
+
+	integer_columns = ['variant_key', 'position', 'ref_reads', 'alt_reads', 'depth', 'genotype_quality', 'transcript_number']
+
+	schemas = {}
+
+	for table_name in TABLE_NAMES:
+
+		fields = []
+
+		for column in columns[table_name]:
+
+			if column in integer_columns:
+
+				fields.append(pa.field(column, pa.int64()))
+
+			elif column in ['quality', 'gene_score']:
+
+				fields.append(pa.field(column, pa.float64()))
+
+			elif column in info_types:
+
+				fields.append(pa.field(column, python_types.get(info_types[column], pa.string())))
+
+			else:
+
+				fields.append(pa.field(column, pa.string()))
+
+		schemas[table_name] = pa.schema(fields)
+
+	return schemas
+
+
+def write_parquet(chunks, columns, info_types, output_prefix):
+	"""
+	Stream normalised chunks into one Parquet file per table e.g. {output_prefix}.variants.parquet
+
+	Requires the optional pyarrow package.
+
+	Input:
+
+		chunks: Iterable of chunks from iter_normalised_rows()
+		columns: (Dict) The columns of each table from get_normalised_columns()
+		info_types: (Dict) The info column types from get_normalised_columns()
+		output_prefix: (String) Path prefix for the Parquet files.
+
+	Returns:
+
+		paths: (Dict) Dictionary with the table name as the key and the Parquet file path as the value.
+
+	"""
+
+	try:
+
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+
+	except ImportError:
+
+		raise ImportError('Writing Parquet files requires pyarrow. Install it with pip install pyarrow.')
+
+	schemas = get_parquet_schemas(columns, info_types)
+
+	string_columns = {table_name: [field.name for field in schemas[table_name] if field.type == pa.string()] for table_name in TABLE_NAMES}
+
+	paths = {table_name: f'{output_prefix}.{table_name}.parquet' for table_name in TABLE_NAMES}
+
+	writers = {table_name: pq.ParquetWriter(paths[table_name], schemas[table_name]) for table_name in TABLE_NAMES}
+
+	try:
+
+		for chunk in chunks:
+
+			for table_name in TABLE_NAMES:
+
+				if chunk[table_name]:
+
+					table_columns = {column: [row.get(column) for row in chunk[table_name]] for column in columns[table_name]}
+
+					# Values in a string column may have other types e.g. an INFO field with one or several values.
+					for column in string_columns[table_name]:
+
+						table_columns[column] = [value if value == None else str(value) for value in table_columns[column]]
+
+					writers[table_name].write_table(pa.Table.from_pydict(table_columns, schema=schemas[table_name]))
+
+	finally:
+
+		for writer in writers.values():
+
+			writer.close()
+
+	return paths
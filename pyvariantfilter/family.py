@@ -1,4 +1,5 @@
 from pyvariantfilter.family_member import FamilyMember
+from pyvariantfilter.inheritance import InheritanceRules
 import csv
 
 class Family:
@@ -13,6 +14,9 @@ class Family:
 		
 		self.family_id = family_id
 		self.family_members = []
+		self.member_bits = None
+		self.role_masks = None
+		self.inheritance_rules = None
 		
 	def __repr__(self):
 		 return self.family_id
@@ -53,7 +57,112 @@ class Family:
 				raise ValueError(f'Family member ({family_member.family_member_id}) already in Family.')
 		
 		self.family_members.append(family_member)
+
+		self.clear_cached_masks()
 		
+	def clear_cached_masks(self):
+		"""
+		Clear the cached member bits, role masks and inheritance rules. Called whenever the Family changes. Call it directly if the
+		attributes of a FamilyMember already in the Family e.g. affected are changed.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		self.member_bits = None
+		self.role_masks = None
+		self.inheritance_rules = None
+
+	def get_member_bits(self):
+		"""
+		Get the bit assigned to each FamilyMember. Bits are assigned in the order the members were added so
+		a set of family members can be held in a single integer.
+
+		Input: Self
+
+		Returns:
+
+			member_bits (Dict): Dictionary with the family_member_id as the key and the bit (1, 2, 4...) as the value.
+
+		"""
+
+		if self.member_bits == None:
+
+			self.member_bits = {family_member.get_id(): 1 << i for i, family_member in enumerate(self.family_members)}
+
+		return self.member_bits
+
+	def get_role_masks(self):
+		"""
+		Get bitmasks of the family members in each role. Each mask is the bitwise OR of the member bits from
+		get_member_bits() e.g. masks['affected'] & masks['male'] is the affected males.
+
+		Input: Self
+
+		Returns:
+
+			role_masks (Dict): Dictionary with the keys all, affected, unaffected, male, female and proband.
+
+		"""
+
+		if self.role_masks == None:
+
+			member_bits = self.get_member_bits()
+
+			role_masks = {'all': 0, 'affected': 0, 'unaffected': 0, 'male': 0, 'female': 0, 'proband': 0}
+
+			for family_member in self.family_members:
+
+				bit = member_bits[family_member.get_id()]
+
+				role_masks['all'] |= bit
+
+				if family_member.affected == True:
+
+					role_masks['affected'] |= bit
+
+				else:
+
+					role_masks['unaffected'] |= bit
+
+				if family_member.sex == 1:
+
+					role_masks['male'] |= bit
+
+				else:
+
+					role_masks['female'] |= bit
+
+				if family_member.proband == True:
+
+					role_masks['proband'] |= bit
+
+			self.role_masks = role_masks
+
+		return self.role_masks
+
+	def get_inheritance_rules(self):
+		"""
+		Get the inheritance model rules compiled for this pedigree. Built once and shared by every variant in the family.
+
+		Input: Self
+
+		Returns:
+
+			inheritance_rules (InheritanceRules): The compiled rules.
+
+		"""
+
+		if self.inheritance_rules == None:
+
+			self.inheritance_rules = InheritanceRules(self)
+
+		return self.inheritance_rules
+
 	def get_affected_family_members(self):
 		"""
 		Return those family members who are affected.
@@ -148,6 +257,8 @@ class Family:
 
 		"""
 
+
+		self.clear_cached_masks()
 		
 		for existing_member in self.family_members:
 			
@@ -472,6 +583,7 @@ class Family:
 
 					family_dict[row[1]].mum = family_dict[row[3]]
 
+		self.clear_cached_masks()
 
 		self.set_proband(proband_id)
 
@@ -0,0 +1,557 @@
+from pyvariantfilter.variant import VALID_CHROMS
+from pyvariantfilter.utils import get_valid_contigs, get_info_field_dict, get_split_info_field_dict, parse_csq_field, split_transcript_annotations, trim_alleles
+from pyvariantfilter.stats import WarningCounter
+from pyvariantfilter.checkpoint import get_file_checksum
+from pysam import VariantFile
+import json
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The arrays stored for each matrix with their dtype and the shape of each site (n_samples is filled in on load).
+ARRAYS = {'gt': ('int8', 2),
+		  'ad': ('int32', 2),
+		  'dp': ('int32', None),
+		  'gq': ('int32', None)}
+
+SITE_ARRAYS = {'positions': 'int64',
+			   'ref_lengths': 'int32',
+			   'site_offsets': 'int64'}
+
+
+def build_genotype_matrix(vcf_file, output_dir, parse_csq=True, vep_csq_key='CSQ', chunk_size=10000):
+	"""
+	Convert the GT, AD, DP and GQ fields of every sample in a VCF into NumPy arrays on disk which can be memory mapped
+	by GenotypeMatrix. The VCF is decoded once and each family can then be loaded from the arrays with
+	VariantSet.read_variants_from_genotype_matrix().
+
+	Multi-allelic records are split into one site per alt allele in the same way as VariantSet.read_variants_from_vcf()
+	so the matrix only holds biallelic sites.
+
+	Files written to output_dir:
+
+		gt.bin - Allele index for each site, sample and allele. 0 = ref, 1 = alt and -1 = missing (int8)
+		ad.bin - Ref and alt read depths for each site and sample (int32)
+		dp.bin - Depth for each site and sample (int32)
+		gq.bin - Genotype quality for each site and sample (int32)
+		positions.bin - 1 based position of the VCF record of each site (int64)
+		ref_lengths.bin - Length of the ref allele of the VCF record of each site (int32)
+		sites.jsonl - The chrom, pos, ref, alt, filter, quality, INFO and CSQ of each site, one JSON line per site.
+		site_offsets.bin - Byte offset of each site in sites.jsonl (int64)
+		metadata.json - The samples, number of sites, the row range of each chromosome and the size, modification
+		time and checksum of the VCF.
+
+	The positions and ref lengths are those of the record rather than the trimmed alleles of a split site so the
+	rows stay sorted and region queries select the same records as reading the VCF through its index.
+
+	The missing values follow read_variants_from_vcf() e.g. a missing GQ value becomes 0.
+
+	Input:
+
+		vcf_file: (String) Path to a VCF sorted by position. Must have AD, GQ and DP fields in the Format section.
+		output_dir: (String) Directory to write the matrix to. Created if it does not exist.
+		parse_csq: (Boolean) Whether to keep the CSQ field added by VEP.
+		vep_csq_key: (String) The key of the CSQ field in the VCF INFO section.
+		chunk_size: (Integer) How many sites to hold in memory before writing them to disk.
+
+	Returns:
+
+		genotype_matrix: (GenotypeMatrix) The new matrix.
+
+	"""
+
+	os.makedirs(output_dir, exist_ok=True)
+
+	warning_counter = WarningCounter(logger)
+
+	bcf_in = VariantFile(vcf_file)
+
+	samples = list(bcf_in.header.samples)
+
+	csq_fields = None
+
+	if parse_csq == True:
+
+		csq_fields = str(bcf_in.header.info[vep_csq_key].record)
+
+		csq_fields = csq_fields.strip()
+
+		index = csq_fields.index('Format:') + 8
+
+		csq_fields = csq_fields[index:len(csq_fields)-2].split('|')
+
+	info_numbers = {key: bcf_in.header.info[key].number for key in bcf_in.header.info}
+
+	valid_contigs, invalid_contigs = get_valid_contigs(list(bcf_in.header.contigs), VALID_CHROMS)
+
+	if invalid_contigs:
+
+		logger.debug(f'{len(invalid_contigs)} contigs are not valid chromosomes and will be skipped: {invalid_contigs}')
+
+	files = {name: open(os.path.join(output_dir, f'{name}.bin'), 'wb') for name in list(ARRAYS) + list(SITE_ARRAYS)}
+	sites_file = open(os.path.join(output_dir, 'sites.jsonl'), 'wb')
+
+	contigs = {}
+	records_skipped = {}
+	n_sites = 0
+	chunk = []
+
+	def write_chunk(chunk):
+
+		n_chunk = len(chunk)
+
+		arrays = {'gt': np.full((n_chunk, len(samples), 2), -1, dtype='int8'),
+				  'ad': np.zeros((n_chunk, len(samples), 2), dtype='int32'),
+				  'dp': np.zeros((n_chunk, len(samples)), dtype='int32'),
+				  'gq': np.zeros((n_chunk, len(samples)), dtype='int32'),
+				  'positions': np.zeros(n_chunk, dtype='int64'),
+				  'ref_lengths': np.zeros(n_chunk, dtype='int32'),
+				  'site_offsets': np.zeros(n_chunk, dtype='int64')}
+
+		for i, (site, record_pos, record_ref_length, genotypes) in enumerate(chunk):
+
+			arrays['positions'][i] = record_pos
+			arrays['ref_lengths'][i] = record_ref_length
+			arrays['site_offsets'][i] = sites_file.tell()
+
+			sites_file.write((json.dumps(site) + '\n').encode())
+
+			for j, (gt, ad, dp, gq) in enumerate(genotypes):
+
+				arrays['gt'][i, j] = gt
+				arrays['ad'][i, j] = ad
+				arrays['dp'][i, j] = dp
+				arrays['gq'][i, j] = gq
+
+		for name in arrays:
+
+			arrays[name].tofile(files[name])
+
+	try:
+
+		for rec in bcf_in:
+
+			if rec.contig not in valid_contigs:
+
+				if rec.contig not in invalid_contigs:
+
+					# Contigs which are not in the header are resolved the first time they are seen.
+					new_valid, new_invalid = get_valid_contigs([rec.contig], VALID_CHROMS)
+
+					valid_contigs.update(new_valid)
+					invalid_contigs.extend(new_invalid)
+
+				if rec.contig not in valid_contigs:
+
+					warning_counter.warn('invalid_chrom', rec.contig, f'{rec.contig} is not a valid chromosome. Not entered into genotype matrix.')
+
+					records_skipped['invalid_chrom'] = records_skipped.get('invalid_chrom', 0) + 1
+
+					continue
+
+			chrom = valid_contigs[rec.contig]
+
+			alts = rec.alts
+			n_alleles = len(alts) + 1
+
+			csq = None
+
+			# Star alleles are skipped below and do not have a CSQ annotation.
+			if parse_csq == True and set(alts) != {'*'}:
+
+				csq = list(rec.info[vep_csq_key])
+
+			if len(alts) == 1:
+
+				split_alleles = [(1, rec.pos, rec.ref, alts[0], csq, get_info_field_dict(rec.info, vep_csq_key))]
+
+			else:
+
+				split_alleles = []
+
+				if csq != None:
+
+					transcript_annotations = parse_csq_field(csq, csq_fields)
+
+				for allele_number, alt in enumerate(alts, start=1):
+
+					pos, ref, trimmed_alt = trim_alleles(rec.pos, rec.ref, alt)
+
+					allele_csq = csq
+
+					if csq != None:
+
+						# Keep the raw CSQ entries of this allele so the sites are parsed the same way as a biallelic site.
+						allele_transcripts = split_transcript_annotations(transcript_annotations, rec.ref, alts, allele_number)
+
+						allele_csq = [entry for entry, transcript in zip(csq, transcript_annotations) if transcript in allele_transcripts]
+
+					split_alleles.append((allele_number, pos, ref, trimmed_alt, allele_csq, get_split_info_field_dict(rec.info, info_numbers, allele_number, vep_csq_key)))
+
+			for allele_number, pos, ref, alt, allele_csq, info_dict in split_alleles:
+
+				if alt == '*':
+
+					records_skipped['star_alt'] = records_skipped.get('star_alt', 0) + 1
+
+					continue
+
+				if chrom not in contigs:
+
+					contigs[chrom] = [n_sites, n_sites, 0]
+
+				elif contigs[chrom][1] != n_sites:
+
+					raise ValueError(f'The VCF must be sorted - {rec.contig} is not in a single block.')
+
+				site = {'chrom': chrom,
+						'pos': pos,
+						'ref': ref,
+						'alt': alt,
+						'filter_status': list(rec.filter.keys()),
+						'quality': rec.qual,
+						'info': info_dict,
+						'csq': allele_csq}
+
+				# Alleles from the other alts of a multi-allelic record become missing.
+				allele_map = {0: 0, allele_number: 1}
+
+				genotypes = []
+
+				for sample in samples:
+
+					sample_genotype_data = rec.samples[sample]
+
+					gt = [-1 if allele == None else allele_map.get(allele, -1) for allele in sample_genotype_data['GT']]
+
+					if gt[0] == -1 and gt[1] == -1:
+
+						ad = [0, 0]
+
+					elif len(sample_genotype_data['AD']) == 1 and sample_genotype_data['AD'][0] == None:
+
+						ad = [0, 0]
+
+					else:
+
+						assert len(sample_genotype_data['AD']) == n_alleles
+
+						ad = [0 if depth == None else depth for depth in [sample_genotype_data['AD'][0], sample_genotype_data['AD'][allele_number]]]
+
+					try:
+
+						gq = sample_genotype_data['GQ']
+
+					except:
+
+						warning_counter.warn('missing_gq', sample, f'Warning No GQ for variant {chrom}:{pos}{ref}>{alt}. This could cause filtering errors.')
+						# set to high so we don't accidently filter out
+						gq = 100
+
+					if gq == None:
+
+						gq = 0
+
+					dp = sample_genotype_data['DP']
+
+					if dp == None:
+
+						dp = 0
+
+					genotypes.append((gt, ad, dp, gq))
+
+				chunk.append((site, rec.pos, len(rec.ref), genotypes))
+
+				contigs[chrom][1] = n_sites + 1
+				contigs[chrom][2] = max(contigs[chrom][2], len(rec.ref))
+
+				n_sites = n_sites + 1
+
+			if len(chunk) >= chunk_size:
+
+				write_chunk(chunk)
+				chunk = []
+
+		if chunk:
+
+			write_chunk(chunk)
+
+	finally:
+
+		for f in files.values():
+
+			f.close()
+
+		sites_file.close()
+
+	warning_counter.log_summary()
+
+	metadata = {'vcf_file': os.path.abspath(vcf_file),
+				'vcf_checksum': get_file_checksum(vcf_file),
+				'samples': samples,
+				'n_sites': n_sites,
+				'csq_fields': csq_fields,
+				'contigs': contigs,
+				'records_skipped': records_skipped}
+
+	with open(os.path.join(output_dir, 'metadata.json'), 'w') as f:
+
+		json.dump(metadata, f, indent=1)
+
+	return GenotypeMatrix(output_dir)
+
+
+class GenotypeMatrix:
+	"""
+	Memory mapped GT, AD, DP and GQ arrays for every sample in a VCF written by build_genotype_matrix().
+
+	The arrays have one row per site in VCF order so each chromosome is a contiguous block of rows. Slicing a block
+	only reads that part of the files from disk. See get_block() for when a read is a view and when it is a copy.
+
+	directory: The directory containing the matrix (String)
+	samples: The samples in the VCF in column order (List)
+	n_sites: The number of sites (Integer)
+	csq_fields: The VEP CSQ field names or None if the CSQ was not kept (List)
+	contigs: Dictionary with the chromosome as the key and [first_row, end_row, max_ref_length] as the value (Dict)
+	vcf_file: The VCF the matrix was built from (String)
+	vcf_checksum: The size, modification time and checksum of the VCF from checkpoint.get_file_checksum() (Dict)
+	gt, ad, dp, gq, positions, ref_lengths, site_offsets: The memory mapped arrays (numpy.memmap)
+
+	"""
+
+	def __init__(self, directory):
+
+		self.directory = directory
+
+		with open(os.path.join(directory, 'metadata.json')) as f:
+
+			metadata = json.load(f)
+
+		self.samples = metadata['samples']
+		self.n_sites = metadata['n_sites']
+		self.csq_fields = metadata['csq_fields']
+		self.contigs = metadata['contigs']
+		self.vcf_file = metadata['vcf_file']
+		self.vcf_checksum = metadata.get('vcf_checksum')
+
+		self.sample_index = {sample: i for i, sample in enumerate(self.samples)}
+
+		for name, (dtype, ploidy) in ARRAYS.items():
+
+			shape = (self.n_sites, len(self.samples))
+
+			if ploidy != None:
+
+				shape = shape + (ploidy,)
+
+			setattr(self, name, self._open_array(name, dtype, shape))
+
+		for name, dtype in SITE_ARRAYS.items():
+
+			setattr(self, name, self._open_array(name, dtype, (self.n_sites,)))
+
+	def __len__(self):
+
+		return self.n_sites
+
+	def _open_array(self, name, dtype, shape):
+
+		# numpy cannot memory map an empty file.
+		if self.n_sites == 0 or shape[-1] == 0:
+
+			return np.zeros(shape, dtype=dtype)
+
+		return np.memmap(os.path.join(self.directory, f'{name}.bin'), dtype=dtype, mode='r', shape=shape)
+
+	def get_sample_indices(self, sample_ids):
+		"""
+		Get the column of each sample.
+
+		Input:
+
+			sample_ids: (List) The sample ids e.g. the family_member_ids of a Family.
+
+		Returns:
+
+			sample_indices: (List) The column of each sample in the same order - raises a ValueError if any are missing.
+
+		"""
+
+		missing = [sample_id for sample_id in sample_ids if sample_id not in self.sample_index]
+
+		if missing:
+
+			raise ValueError(f'Family members {missing} are not samples in the genotype matrix.')
+
+		return [self.sample_index[sample_id] for sample_id in sample_ids]
+
+	def check_vcf(self):
+		"""
+		Check that the VCF the matrix was built from has not changed since. The VCF is only read again if its size or
+		modification time differ. A VCF which no longer exists is not an error as the matrix can be used without it.
+
+		Input: Self
+
+		Returns:
+
+			None - raises a ValueError if the VCF has changed.
+
+		"""
+
+		if self.vcf_checksum == None:
+
+			logger.warning(f'The genotype matrix in {self.directory} has no VCF checksum and may be out of date.')
+
+			return
+
+		if not os.path.exists(self.vcf_file):
+
+			return
+
+		checksum = get_file_checksum(self.vcf_file, previous=self.vcf_checksum)
+
+		if checksum['sha256'] != self.vcf_checksum['sha256']:
+
+			raise ValueError(f'{self.vcf_file} has changed since the genotype matrix in {self.directory} was built - rebuild it with build_genotype_matrix().')
+
+	def get_block(self, name, rows, sample_indices):
+		"""
+		Read the values of some samples at some rows from one of the arrays.
+
+		A contiguous range of rows and of sample columns is read as a slice of the memory map, which is a view and only
+		reads those pages from disk. Rows or columns which are not contiguous e.g. a region query use fancy indexing
+		which copies the block, as does putting the columns into the order given.
+
+		Input:
+
+			name: (String) The array e.g. gt
+			rows: (numpy.ndarray) The row numbers in order.
+			sample_indices: (List) The sample columns from get_sample_indices()
+
+		Returns:
+
+			block: (numpy.ndarray) The values with one row per row and one column per sample in the order given.
+
+		"""
+
+		array = getattr(self, name)
+
+		if len(rows) > 0 and rows[-1] - rows[0] + 1 == len(rows):
+
+			block = array[rows[0]:rows[-1] + 1]
+
+		else:
+
+			block = array[rows]
+
+		first_column = min(sample_indices, default=0)
+		end_column = max(sample_indices, default=-1) + 1
+
+		if end_column - first_column == len(sample_indices):
+
+			block = block[:, first_column:end_column]
+
+			if sample_indices != list(range(first_column, end_column)):
+
+				block = block[:, [i - first_column for i in sample_indices]]
+
+			return block
+
+		return block[:, sample_indices]
+
+	def get_rows(self, regions=None):
+		"""
+		Get the rows to read, either every row or those overlapping a set of regions.
+
+		Input:
+
+			regions: (Dict) Merged regions from utils.get_regions() with a 0 based start and exclusive end or None for every row.
+
+		Returns:
+
+			rows: (numpy.ndarray or slice) The row numbers in order.
+
+		"""
+
+		if regions == None:
+
+			return slice(0, self.n_sites)
+
+		rows = []
+
+		for chrom in self.contigs:
+
+			if chrom not in regions:
+
+				continue
+
+			first_row, end_row, max_ref_length = self.contigs[chrom]
+
+			starts = self.positions[first_row:end_row] - 1
+
+			for start, end in regions[chrom]:
+
+				# A site starting before the region can only overlap it if it is within max_ref_length of the start.
+				low = np.searchsorted(starts, start - max_ref_length + 1, side='left')
+				high = np.searchsorted(starts, end, side='left')
+
+				overlapping = starts[low:high] + self.ref_lengths[first_row + low:first_row + high] > start
+
+				rows.append(np.arange(first_row + low, first_row + high)[overlapping])
+
+		if not rows:
+
+			return np.zeros(0, dtype='int64')
+
+		return np.unique(np.concatenate(rows))
+
+	def get_site(self, row):
+		"""
+		Read the site level data for a row from the sites.jsonl sidecar.
+
+		Input:
+
+			row: (Integer) The row number.
+
+		Returns:
+
+			site: (Dict) Dictionary with the keys chrom, pos, ref, alt, filter_status, quality, info and csq.
+
+		"""
+
+		with open(os.path.join(self.directory, 'sites.jsonl'), 'rb') as f:
+
+			return self._read_site(f, row)
+
+	def iter_sites(self, rows):
+		"""
+		Read the site level data for a list of rows with a single open file.
+
+		Input:
+
+			rows: (List) The row numbers in order.
+
+		Returns:
+
+			Generator of site dictionaries. See get_site()
+
+		"""
+
+		with open(os.path.join(self.directory, 'sites.jsonl'), 'rb') as f:
+
+			for row in rows:
+
+				yield self._read_site(f, row)
+
+	def _read_site(self, f, row):
+
+		f.seek(int(self.site_offsets[row]))
+
+		site = json.loads(f.readline())
+
+		# JSON turns the tuples used by pysam for multi value fields into lists.
+		site['info'] = {key: tuple(value) if isinstance(value, list) else value for key, value in site['info'].items()}
+
+		return site
@@ -0,0 +1,275 @@
+from pyvariantfilter.wrappers import check_hpo_terms
+import csv
+import glob
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def read_hpo_gene_table(path, hpo_column=0, gene_column=1, score_column=2, delimiter='\t', header=True):
+	"""
+	Read a local HPO to gene association table with one row per HPO term and gene.
+
+	Input:
+
+		path (String): Path to the table.
+		hpo_column (Integer): The column containing the HPO term e.g. HP:0001250
+		gene_column (Integer): The column containing the gene e.g. the gene symbol.
+		score_column (Integer): The column containing the association score. Use None to give every association a score of 1.
+		delimiter (String): The column delimiter.
+		header (Boolean): Whether the first row is a header.
+
+	Output:
+
+		Generator of (hpo_term, gene, score) tuples.
+
+	"""
+
+	with open(path) as csvfile:
+
+		reader = csv.reader(csvfile, delimiter=delimiter)
+
+		if header == True:
+
+			next(reader, None)
+
+		for row in reader:
+
+			if not row or row[0].startswith('#'):
+
+				continue
+
+			score = 1.0
+
+			if score_column != None:
+
+				score = float(row[score_column])
+
+			yield row[hpo_column], row[gene_column], score
+
+
+def read_phen2gene_knowledgebase(knowledgebase_dir, gene_column=1, score_column=3):
+	"""
+	Read the Phen2Gene HPO to gene knowledgebase i.e. a directory with one HP_XXXXXXX.candidate_gene_list file per
+	HPO term. By default the columns are read in the same layout as the Phen2Gene output read by
+	wrappers.read_gene_list() i.e. rank, gene, gene id and score.
+
+	Input:
+
+		knowledgebase_dir (String): The knowledgebase directory e.g. Phen2Gene/lib/Knowledgebase
+		gene_column (Integer): The column containing the gene. Use 2 for the gene id.
+		score_column (Integer): The column containing the score.
+
+	Output:
+
+		Generator of (hpo_term, gene, score) tuples.
+
+	"""
+
+	for path in sorted(glob.glob(os.path.join(knowledgebase_dir, 'HP_*.candidate_gene_list'))):
+
+		hpo_term = os.path.basename(path).split('.')[0].replace('_', ':')
+
+		with open(path) as csvfile:
+
+			reader = csv.reader(csvfile, delimiter='\t')
+
+			for row in reader:
+
+				if len(row) <= max(gene_column, score_column):
+
+					continue
+
+				try:
+
+					score = float(row[score_column])
+
+				except ValueError:
+
+					# Header row
+					continue
+
+				yield hpo_term, row[gene_column], score
+
+
+class HPOGeneScorer:
+	"""
+	Score genes against sets of HPO terms in process rather than running Phenolyzer or Phen2Gene for each family.
+
+	The associations are held in compressed sparse row form - for each HPO term a slice of gene indices and scores -
+	so scoring a phenotype set sums a few small arrays. The score of a gene is the weighted sum of its association
+	scores over the HPO terms in the set.
+
+	genes: The genes in index order (List)
+	term_index: Dictionary with the HPO term as the key and its row as the value (Dict)
+	term_offsets: Start of each term's slice in gene_indices and scores, with a final end offset (numpy.ndarray)
+	gene_indices: The gene index of each association (numpy.ndarray)
+	scores: The score of each association (numpy.ndarray)
+
+	"""
+
+	def __init__(self, associations):
+
+		# Keep the highest score if a term and gene are given more than once.
+		association_dict = {}
+
+		gene_index = {}
+
+		for hpo_term, gene, score in associations:
+
+			if gene not in gene_index:
+
+				gene_index[gene] = len(gene_index)
+
+			key = (hpo_term, gene_index[gene])
+
+			if key not in association_dict or score > association_dict[key]:
+
+				association_dict[key] = score
+
+		self.genes = list(gene_index)
+		self.term_index = {}
+
+		keys = sorted(association_dict)
+
+		term_offsets = []
+		gene_indices = np.zeros(len(keys), dtype='int32')
+		scores = np.zeros(len(keys), dtype='float32')
+
+		for i, key in enumerate(keys):
+
+			hpo_term, gene = key
+
+			if hpo_term not in self.term_index:
+
+				self.term_index[hpo_term] = len(term_offsets)
+				term_offsets.append(i)
+
+			gene_indices[i] = gene
+			scores[i] = association_dict[key]
+
+		term_offsets.append(len(keys))
+
+		self.term_offsets = np.array(term_offsets, dtype='int64')
+		self.gene_indices = gene_indices
+		self.scores = scores
+
+	def __len__(self):
+
+		return len(self.term_index)
+
+	def get_gene_scores(self, hpo_terms, term_weights=None):
+		"""
+		Get the score of every gene for a set of HPO terms as an array.
+
+		Input:
+
+			hpo_terms (List): List of HPO terms. Duplicates are ignored.
+			term_weights (Dict): Optional weight for each HPO term. Terms not in the dictionary have a weight of 1.
+
+		Output:
+
+			gene_scores (numpy.ndarray): The score of each gene in self.genes order.
+
+		"""
+
+		selected_genes = []
+		selected_scores = []
+
+		for hpo_term in sorted(set(hpo_terms)):
+
+			if hpo_term not in self.term_index:
+
+				logger.warning(f'{hpo_term} has no gene associations and will be ignored.')
+
+				continue
+
+			row = self.term_index[hpo_term]
+
+			start = self.term_offsets[row]
+			end = self.term_offsets[row + 1]
+
+			weight = 1.0
+
+			if term_weights != None:
+
+				weight = term_weights.get(hpo_term, 1.0)
+
+			selected_genes.append(self.gene_indices[start:end])
+			selected_scores.append(self.scores[start:end] * weight)
+
+		if not selected_genes:
+
+			return np.zeros(len(self.genes), dtype='float64')
+
+		return np.bincount(np.concatenate(selected_genes), weights=np.concatenate(selected_scores), minlength=len(self.genes))
+
+	def score(self, hpo_terms, term_weights=None, normalise=True):
+		"""
+		Score the genes for a set of HPO terms.
+
+		Input:
+
+			hpo_terms (List): List of HPO terms.
+			term_weights (Dict): Optional weight for each HPO term.
+			normalise (Boolean): Divide the scores by the top score so they are between 0 and 1.
+
+		Output:
+
+			gene_score_dict (Dict): A dictionary with the gene as the key and the score as the value in the same form as
+			wrappers.run_phen2gene(). Only genes with a score above 0 are included, ordered from the highest score.
+
+		"""
+
+		check_hpo_terms(hpo_terms)
+
+		gene_scores = self.get_gene_scores(hpo_terms, term_weights=term_weights)
+
+		scored = np.flatnonzero(gene_scores > 0)
+
+		if len(scored) == 0:
+
+			return {}
+
+		if normalise == True:
+
+			gene_scores = gene_scores / gene_scores[scored].max()
+
+		# Highest score first with ties broken on the gene name.
+		order = sorted(scored, key=lambda i: (-gene_scores[i], self.genes[i]))
+
+		return {self.genes[i]: float(gene_scores[i]) for i in order}
+
+	def score_batch(self, hpo_term_sets, term_weights=None, normalise=True):
+		"""
+		Score many phenotype sets e.g. one per family. Identical phenotype sets are only scored once.
+
+		Input:
+
+			hpo_term_sets (Dict): Dictionary with a job name e.g. the family_id as the key and a list of HPO terms as the value.
+			term_weights (Dict): Optional weight for each HPO term.
+			normalise (Boolean): Divide the scores by the top score so they are between 0 and 1.
+
+		Output:
+
+			results (Dict): Dictionary with the job name as the key and a gene_score_dict as the value.
+
+		"""
+
+		scored_sets = {}
+
+		results = {}
+
+		for job_name, hpo_terms in hpo_term_sets.items():
+
+			key = tuple(sorted(set(hpo_terms)))
+
+			if key not in scored_sets:
+
+				scored_sets[key] = self.score(hpo_terms, term_weights=term_weights, normalise=normalise)
+
+			results[job_name] = scored_sets[key]
+
+		return results
@@ -0,0 +1,297 @@
+class InheritanceRules:
+	"""
+	Inheritance model rules compiled for a single pedigree.
+
+	Everything which only depends on the Family e.g. the affected males or whether an X dominant pattern is possible
+	at all given the children of affected males is worked out once when the object is created. Each model then
+	reduces to a few bitmask tests against Variant.get_genotype_masks().
+
+	Get an instance using Family.get_inheritance_rules() so that it is shared by all variants in the family.
+
+	"""
+
+	def __init__(self, family):
+
+		member_bits = family.get_member_bits()
+		role_masks = family.get_role_masks()
+
+		self.affected = role_masks['affected']
+		self.unaffected = role_masks['unaffected']
+		self.proband = role_masks['proband']
+
+		self.affected_male = role_masks['affected'] & role_masks['male']
+		self.affected_female = role_masks['affected'] & role_masks['female']
+		self.unaffected_male = role_masks['unaffected'] & role_masks['male']
+		self.unaffected_female = role_masks['unaffected'] & role_masks['female']
+		self.affected_not_proband = role_masks['affected'] & ~role_masks['proband']
+
+		# The trio used by the de novo and uniparental isodisomy models.
+		self.proband_id = None
+		self.mum_id = None
+		self.dad_id = None
+		self.proband_female = False
+
+		proband = family.get_proband()
+
+		if proband != None:
+
+			self.proband_id = proband.get_id()
+			self.proband_female = proband.sex == 2
+
+			if proband.get_mum() != None and proband.get_dad() != None:
+
+				self.mum_id = proband.get_mum().get_id()
+				self.dad_id = proband.get_dad().get_id()
+
+		self.has_both_parents = self.mum_id != None
+
+		# X dominant - the daughters of affected males must be affected and their sons must not be affected.
+		self.x_dominant_possible = True
+
+		for family_member in family.get_all_family_members():
+
+			dad = family_member.get_dad()
+
+			if dad != None and member_bits[dad.get_id()] & self.affected_male:
+
+				if family_member.sex == 2 and family_member.affected == False:
+
+					self.x_dominant_possible = False
+
+				if family_member.sex == 1 and family_member.affected == True:
+
+					self.x_dominant_possible = False
+
+	def matches_autosomal_dominant(self, variant, lenient=False, low_penetrance_genes={}):
+		"""
+		See Variant.matches_autosomal_dominant()
+		"""
+
+		if variant.chrom in ['X', 'Y', 'MT', 'M']:
+
+			return False
+
+		genotype_masks = variant.get_genotype_masks()
+
+		if lenient == False:
+
+			# All affected must be het or missing
+			if self.affected & ~(genotype_masks['het'] | genotype_masks['missing']):
+
+				return False
+
+		else:
+
+			# Affected people who are not the proband are allowed to be hom alt
+			if self.affected_not_proband & ~(genotype_masks['has_alt'] | genotype_masks['missing']):
+
+				return False
+
+			if self.proband & ~(genotype_masks['het'] | genotype_masks['missing']):
+
+				return False
+
+		if low_penetrance_genes:
+
+			for gene in variant.get_genes(feature_key='SYMBOL'):
+
+				if gene in low_penetrance_genes:
+
+					return True
+
+		# All unaffected must not have the alt
+		if self.unaffected & genotype_masks['has_alt']:
+
+			return False
+
+		return True
+
+	def matches_autosomal_reccessive(self, variant):
+		"""
+		See Variant.matches_autosomal_reccessive()
+		"""
+
+		if variant.chrom in ['X', 'Y', 'MT', 'M']:
+
+			return False
+
+		genotype_masks = variant.get_genotype_masks()
+
+		# All affected must be hom alt or missing
+		if self.affected & ~(genotype_masks['hom_alt'] | genotype_masks['missing']):
+
+			return False
+
+		# Unaffected must not be hom alt
+		if self.unaffected & genotype_masks['hom_alt']:
+
+			return False
+
+		return True
+
+	def matches_x_reccessive(self, variant):
+		"""
+		See Variant.matches_x_reccessive()
+		"""
+
+		if variant.chrom != 'X':
+
+			return False
+
+		genotype_masks = variant.get_genotype_masks()
+
+		if self.affected_female & ~(genotype_masks['hom_alt'] | genotype_masks['missing']):
+
+			return False
+
+		if self.unaffected_female & genotype_masks['hom_alt']:
+
+			return False
+
+		if self.affected_male & genotype_masks['hom_ref']:
+
+			return False
+
+		if self.unaffected_male & genotype_masks['has_alt']:
+
+			return False
+
+		return True
+
+	def matches_x_dominant(self, variant):
+		"""
+		See Variant.matches_x_dominant()
+		"""
+
+		if variant.chrom != 'X' or self.x_dominant_possible == False:
+
+			return False
+
+		genotype_masks = variant.get_genotype_masks()
+
+		# Affected males must not be hom ref
+		if self.affected_male & genotype_masks['hom_ref']:
+
+			return False
+
+		# Affected females must be het or missing
+		if self.affected_female & ~(genotype_masks['het'] | genotype_masks['missing']):
+
+			return False
+
+		# Unaffected samples must not have the variant
+		if self.unaffected & genotype_masks['has_alt']:
+
+			return False
+
+		return True
+
+	def get_matching_inheritance_models(self,
+										variant,
+										compound_het_dict,
+										lenient=False,
+										low_penetrance_genes={},
+										min_parental_gq_dn=30,
+										min_parental_depth_dn=10,
+										max_parental_alt_ref_ratio_dn=0.04,
+										min_parental_gq_upi=30,
+										min_parental_depth_upi=10):
+		"""
+		See Variant.get_matching_inheritance_models()
+
+		Evaluates every model in one pass. The genotype masks and the parental GQ, depth and alt/ref ratios are looked up
+		once and shared by the de novo and uniparental isodisomy models rather than being fetched again by each one.
+		"""
+
+		genotype_masks = variant.get_genotype_masks()
+		chrom = variant.chrom
+
+		matching_models = []
+
+		if self.matches_autosomal_dominant(variant, lenient=lenient, low_penetrance_genes=low_penetrance_genes):
+
+			matching_models.append('autosomal_dominant')
+
+		if self.matches_autosomal_reccessive(variant):
+
+			matching_models.append('autosomal_reccessive')
+
+		if self.matches_x_reccessive(variant):
+
+			matching_models.append('x_reccessive')
+
+		if self.matches_x_dominant(variant):
+
+			matching_models.append('x_dominant')
+
+		proband_bit = self.proband
+		de_novo = False
+		uniparental_isodisomy = False
+
+		# Both models need the proband to have the alt and both parents to be present.
+		if self.has_both_parents == True and genotype_masks['has_alt'] & proband_bit:
+
+			member_bits = variant.family.get_member_bits()
+			mum_bit = member_bits[self.mum_id]
+			dad_bit = member_bits[self.dad_id]
+
+			mum_genotype = variant.genotypes[self.mum_id]
+			dad_genotype = variant.genotypes[self.dad_id]
+
+			mum_has_alt = genotype_masks['has_alt'] & mum_bit
+			dad_has_alt = genotype_masks['has_alt'] & dad_bit
+
+			key = (self.proband_id, min_parental_gq_dn, min_parental_depth_dn, max_parental_alt_ref_ratio_dn)
+
+			if key not in variant.denovo_cache:
+
+				variant.denovo_cache[key] = (not mum_has_alt and
+											 mum_genotype['genotype_quality'] >= min_parental_gq_dn and
+											 mum_genotype['depth'] >= min_parental_depth_dn and
+											 variant.get_alt_ref_ratio(self.mum_id) <= max_parental_alt_ref_ratio_dn and
+											 not dad_has_alt and
+											 dad_genotype['genotype_quality'] >= min_parental_gq_dn and
+											 dad_genotype['depth'] >= min_parental_depth_dn and
+											 variant.get_alt_ref_ratio(self.dad_id) < max_parental_alt_ref_ratio_dn)
+
+			de_novo = variant.denovo_cache[key]
+
+			if genotype_masks['hom_alt'] & proband_bit:
+
+				parents_pass_quality = (mum_genotype['depth'] >= min_parental_depth_upi and
+										dad_genotype['depth'] >= min_parental_depth_upi and
+										mum_genotype['genotype_quality'] >= min_parental_gq_upi and
+										dad_genotype['genotype_quality'] >= min_parental_gq_upi)
+
+				mum_het = genotype_masks['het'] & mum_bit
+				dad_het = genotype_masks['het'] & dad_bit
+
+				if chrom not in ['X', 'Y', 'MT', 'M']:
+
+					uniparental_isodisomy = parents_pass_quality and ((mum_het and not dad_has_alt) or (dad_het and not mum_has_alt))
+
+				elif chrom == 'X' and self.proband_female == True:
+
+					uniparental_isodisomy = parents_pass_quality and not dad_has_alt and (mum_het or not mum_has_alt)
+
+		if de_novo:
+
+			matching_models.append('de_novo')
+
+		if uniparental_isodisomy:
+
+			matching_models.append('uniparental_isodisomy')
+
+		if chrom == 'MT' or chrom == 'M':
+
+			matching_models.append('mitochrondrial')
+
+		if chrom == 'Y':
+
+			matching_models.append('y_chrom')
+
+		if variant.variant_id in compound_het_dict:
+
+			matching_models.append('compound_het')
+
+		return matching_models
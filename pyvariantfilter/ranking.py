@@ -0,0 +1,190 @@
+from pyvariantfilter.variant import CONSEQUENCE_SEVERITY
+import heapq
+
+# How strongly each inheritance model supports a variant. A variant takes the weight of its best model.
+INHERITANCE_MODEL_WEIGHTS = {'de_novo': 4,
+							 'compound_het': 3,
+							 'autosomal_reccessive': 3,
+							 'x_reccessive': 3,
+							 'uniparental_isodisomy': 3,
+							 'autosomal_dominant': 2,
+							 'x_dominant': 2,
+							 'mitochrondrial': 1,
+							 'y_chrom': 1}
+
+
+def get_population_frequency(variant, frequency_key, frequency_type='transcript', zero_values=['.', '', None]):
+	"""
+	Get the population frequency of a variant, taking the highest value if there are several.
+
+	Input:
+
+		variant: (Variant) The variant.
+		frequency_key: (String) The annotation containing the frequency e.g. gnomAD_AF
+		frequency_type: (String) transcript for a CSQ annotation or info for an INFO annotation.
+		zero_values: (List) Values which should be treated as 0 e.g. '.'
+
+	Returns:
+
+		frequency: (Float) The frequency or None if the variant does not have the annotation.
+
+	"""
+
+	if frequency_type == 'transcript':
+
+		if variant.transcript_annotations == None or len(variant.transcript_annotations) == 0:
+
+			return None
+
+		for transcript in variant.transcript_annotations:
+
+			if frequency_key not in transcript:
+
+				return None
+
+		return variant.get_numerical_transcript_annotation(frequency_key, zero_values=zero_values, agg_func='max')
+
+	elif frequency_type == 'info':
+
+		if variant.info_annotations == None or frequency_key not in variant.info_annotations:
+
+			return None
+
+		return variant.get_numerical_info_annotation(frequency_key, zero_values=zero_values, agg_func='max')
+
+	else:
+
+		raise ValueError('frequency_type must be transcript or info')
+
+
+def get_ranking_features(variant,
+						 inheritance_models,
+						 gene_score=None,
+						 frequency_key='gnomAD_AF',
+						 frequency_type='transcript',
+						 consequence_severity=CONSEQUENCE_SEVERITY):
+	"""
+	Get the features used to rank a variant.
+
+	Input:
+
+		variant: (Variant) The variant.
+		inheritance_models: (List) The inheritance models the variant matches.
+		gene_score: (Float) The gene score from VariantSet.add_gene_scores() or None.
+		frequency_key: (String) The population frequency annotation. Use None to skip the frequency.
+		frequency_type: (String) transcript or info - see get_population_frequency()
+		consequence_severity: (List) Consequences from most to least severe.
+
+	Returns:
+
+		features: (Dict) Dictionary with the keys variant_id, inheritance_models, worst_consequence,
+		consequence_severity (1 for the most severe consequence down to 0 if there is none), population_frequency
+		and gene_score.
+
+	"""
+
+	worst_consequence = None
+	severity = 0.0
+
+	if variant.transcript_annotations != None:
+
+		worst_consequence = variant.get_worst_consequence(consequence_severity=consequence_severity)
+
+		if worst_consequence != None:
+
+			severity = 1 - (consequence_severity.index(worst_consequence) / len(consequence_severity))
+
+	population_frequency = None
+
+	if frequency_key != None:
+
+		population_frequency = get_population_frequency(variant, frequency_key, frequency_type=frequency_type)
+
+	return {'variant_id': variant.variant_id,
+			'inheritance_models': inheritance_models,
+			'worst_consequence': worst_consequence,
+			'consequence_severity': severity,
+			'population_frequency': population_frequency,
+			'gene_score': gene_score}
+
+
+def default_score(features):
+	"""
+	The default ranking score. Variants are ordered on their best inheritance model, then the severity of their worst
+	consequence, then their gene score and finally with the rarest first.
+
+	Input:
+
+		features: (Dict) The features from get_ranking_features()
+
+	Returns:
+
+		score: (Tuple) A score which sorts the best variant highest.
+
+	"""
+
+	inheritance_weight = max([INHERITANCE_MODEL_WEIGHTS.get(model, 0) for model in features['inheritance_models']], default=0)
+
+	gene_score = features['gene_score']
+
+	if gene_score == None:
+
+		gene_score = 0.0
+
+	population_frequency = features['population_frequency']
+
+	if population_frequency == None:
+
+		population_frequency = 0.0
+
+	return (inheritance_weight, features['consequence_severity'], gene_score, -population_frequency)
+
+
+def select_top_k(features_iter, k, score_func=default_score):
+	"""
+	Select the k highest scoring items in one pass keeping no more than k items in memory.
+
+	Ties are broken in favour of the item seen first so the ranking is stable.
+
+	Input:
+
+		features_iter: Iterable of feature dictionaries e.g. from get_ranking_features()
+		k: (Integer) The number of items to keep.
+		score_func: Function taking a feature dictionary and returning a score which can be compared e.g. a float or tuple.
+
+	Returns:
+
+		ranked: (List) The top k feature dictionaries from highest to lowest score with the score and rank (starting at 1) added.
+
+	"""
+
+	if k < 1:
+
+		raise ValueError('k must be at least 1')
+
+	heap = []
+
+	for i, features in enumerate(features_iter):
+
+		# The heap holds the worst kept item at the front. On a tie the later item is worse.
+		entry = (score_func(features), -i, features)
+
+		if len(heap) < k:
+
+			heapq.heappush(heap, entry)
+
+		elif entry[:2] > heap[0][:2]:
+
+			heapq.heapreplace(heap, entry)
+
+	ranked = []
+
+	for rank, (score, order, features) in enumerate(sorted(heap, key=lambda entry: entry[:2], reverse=True)):
+
+		features = dict(features)
+		features['score'] = score
+		features['rank'] = rank + 1
+
+		ranked.append(features)
+
+	return ranked
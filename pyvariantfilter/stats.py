@@ -0,0 +1,271 @@
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+	"""
+	Wall time and counters for a single stage of a VariantSet workflow e.g. reading a VCF or pairing compound hets.
+
+	name: The name of the stage e.g. ingest (String)
+	wall_time: Seconds spent in the stage (Float)
+	records_read: Number of records or variants looked at by the stage (Integer)
+	records_rejected: Dictionary with the rejection reason as the key and the count as the value (Dict)
+	contigs_skipped: Contigs which were not loaded as a whole because they are not valid chromosomes (List)
+	variants_kept: Number of variants kept by the stage (Integer)
+	transcripts_parsed: Number of transcript annotations parsed by the stage (Integer)
+	pairs_evaluated: Number of compound het pairs evaluated by the stage (Integer)
+	pairs_passed: Number of compound het pairs which passed the stage (Integer)
+
+	"""
+
+	def __init__(self, name):
+
+		self.name = name
+		self.wall_time = 0.0
+		self.records_read = 0
+		self.records_rejected = {}
+		self.contigs_skipped = []
+		self.variants_kept = 0
+		self.transcripts_parsed = 0
+		self.pairs_evaluated = 0
+		self.pairs_passed = 0
+		self.start_time = time.perf_counter()
+
+	def __repr__(self):
+		return f'{self.name}: {self.wall_time:.3f}s'
+
+	def reject(self, reason):
+		"""
+		Record that a record was rejected.
+
+		Input:
+
+			reason: (String) Why the record was rejected e.g. invalid_chrom
+
+		Returns:
+
+			None
+
+		"""
+
+		self.records_rejected[reason] = self.records_rejected.get(reason, 0) + 1
+
+	def stop(self):
+		"""
+		Stop the stage timer and record the wall time.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		self.wall_time = time.perf_counter() - self.start_time
+
+	def to_dict(self):
+		"""
+		Return the stage as a dictionary suitable for JSON serialisation.
+
+		Input: Self
+
+		Returns:
+
+			stage_dict: (Dict) The stage name, timing and counters.
+
+		"""
+
+		return {'stage': self.name,
+				'wall_time': self.wall_time,
+				'records_read': self.records_read,
+				'records_rejected': dict(self.records_rejected),
+				'contigs_skipped': list(self.contigs_skipped),
+				'variants_kept': self.variants_kept,
+				'transcripts_parsed': self.transcripts_parsed,
+				'pairs_evaluated': self.pairs_evaluated,
+				'pairs_passed': self.pairs_passed}
+
+
+class VariantSetStats:
+	"""
+	Collects a StageStats object for each stage run on a VariantSet.
+
+	family_id: The family_id of the VariantSet's family (String)
+	log_json: Whether to emit each finished stage as a JSON log line (Boolean)
+	stages: List of finished StageStats objects in the order they were run (List)
+
+	"""
+
+	def __init__(self, family_id=None, log_json=False):
+
+		self.family_id = family_id
+		self.log_json = log_json
+		self.stages = []
+
+	def add_stage(self, stage):
+		"""
+		Add a finished stage. If log_json is True then the stage is logged as a single JSON line at INFO level.
+
+		Input:
+
+			stage: (StageStats) The finished stage.
+
+		Returns:
+
+			None
+
+		"""
+
+		assert isinstance(stage, StageStats)
+
+		self.stages.append(stage)
+
+		if self.log_json == True:
+
+			stage_dict = stage.to_dict()
+			stage_dict['family_id'] = self.family_id
+
+			logger.info(json.dumps(stage_dict, sort_keys=True))
+
+	def get_stage(self, name):
+		"""
+		Get the most recent stage with a given name.
+
+		Input:
+
+			name: (String) The stage name e.g. ingest
+
+		Returns:
+
+			stage: (StageStats) The most recent matching stage or None if the stage has not been run.
+
+		"""
+
+		for stage in reversed(self.stages):
+
+			if stage.name == name:
+
+				return stage
+
+		return None
+
+	def to_dict(self):
+		"""
+		Return all stages as a dictionary suitable for JSON serialisation.
+
+		Input: Self
+
+		Returns:
+
+			stats_dict: (Dict) The family_id, total wall time and a list of stage dictionaries.
+
+		"""
+
+		return {'family_id': self.family_id,
+				'wall_time': sum(stage.wall_time for stage in self.stages),
+				'stages': [stage.to_dict() for stage in self.stages]}
+
+	def to_json(self):
+		"""
+		Return all stages as a JSON string.
+
+		Input: Self
+
+		Returns:
+
+			stats_json: (String) JSON representation of self.to_dict()
+
+		"""
+
+		return json.dumps(self.to_dict(), sort_keys=True)
+
+
+class WarningCounter:
+	"""
+	Aggregates repeated warnings e.g. one per record or per sample into counters keyed by reason and key (such as
+	the contig or sample name) so that large files do not flood the log.
+
+	Only the first max_logged_per_reason warnings for each reason are logged individually. Call log_summary()
+	once the work is finished to log a single line per reason with the counts for each key.
+
+	logger: The logging.Logger to write to.
+	max_logged_per_reason: How many individual warnings to log for each reason before going quiet (Integer)
+	counts: Dictionary with the reason as the key and a dictionary of key counts as the value (Dict)
+	totals: Dictionary with the reason as the key and the total count as the value (Dict)
+
+	"""
+
+	def __init__(self, logger, max_logged_per_reason=5):
+
+		self.logger = logger
+		self.max_logged_per_reason = max_logged_per_reason
+		self.counts = {}
+		self.totals = {}
+
+	def warn(self, reason, key, message):
+		"""
+		Count a warning and log it if fewer than max_logged_per_reason warnings have been logged for the reason.
+
+		Input:
+
+			reason: (String) The type of warning e.g. missing_gq
+			key: (String) What the warning is about e.g. a sample id or contig name.
+			message: (String) The message to log.
+
+		Returns:
+
+			None
+
+		"""
+
+		reason_counts = self.counts.setdefault(reason, {})
+
+		reason_counts[key] = reason_counts.get(key, 0) + 1
+
+		total = self.totals.get(reason, 0) + 1
+
+		self.totals[reason] = total
+
+		if total <= self.max_logged_per_reason:
+
+			self.logger.warning(message)
+
+		if total == self.max_logged_per_reason:
+
+			self.logger.warning(f'Further {reason} warnings will be summarised.')
+
+	def get_total(self, reason):
+		"""
+		Get the total number of warnings recorded for a reason.
+
+		Input:
+
+			reason: (String) The type of warning e.g. missing_gq
+
+		Returns:
+
+			total: (Integer) The number of warnings.
+
+		"""
+
+		return self.totals.get(reason, 0)
+
+	def log_summary(self):
+		"""
+		Log a single line per reason containing the total and the count per key.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		for reason in sorted(self.counts):
+
+			self.logger.warning(f'{reason}: {self.get_total(reason)} warnings {json.dumps(self.counts[reason], sort_keys=True)}')
@@ -0,0 +1,417 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pyvariantfilter.variant import Variant
+import json
+import sqlite3
+
+SCHEMA = [
+	"""CREATE TABLE IF NOT EXISTS variants (
+		variant_key INTEGER PRIMARY KEY AUTOINCREMENT,
+		variant_id TEXT NOT NULL UNIQUE,
+		chrom TEXT NOT NULL,
+		pos INTEGER NOT NULL,
+		ref TEXT NOT NULL,
+		alt TEXT NOT NULL,
+		filter_status TEXT,
+		quality REAL,
+		info TEXT,
+		worst_consequence TEXT,
+		transcript_count INTEGER)""",
+	"""CREATE TABLE IF NOT EXISTS genotypes (
+		variant_key INTEGER NOT NULL,
+		sample TEXT NOT NULL,
+		genotype TEXT NOT NULL,
+		ref_reads INTEGER NOT NULL,
+		alt_reads INTEGER NOT NULL,
+		depth INTEGER NOT NULL,
+		genotype_quality INTEGER NOT NULL,
+		PRIMARY KEY (variant_key, sample))""",
+	"""CREATE TABLE IF NOT EXISTS transcripts (
+		variant_key INTEGER NOT NULL,
+		transcript_number INTEGER NOT NULL,
+		annotation TEXT NOT NULL,
+		PRIMARY KEY (variant_key, transcript_number))""",
+	"""CREATE TABLE IF NOT EXISTS transcript_features (
+		variant_key INTEGER NOT NULL,
+		transcript_number INTEGER NOT NULL,
+		feature_key TEXT NOT NULL,
+		feature TEXT)""",
+	'CREATE INDEX IF NOT EXISTS variants_position ON variants (chrom, pos)',
+	'CREATE INDEX IF NOT EXISTS variants_worst_consequence ON variants (worst_consequence)',
+	'CREATE INDEX IF NOT EXISTS transcript_features_feature ON transcript_features (feature_key, feature)',
+	'CREATE INDEX IF NOT EXISTS transcript_features_variant ON transcript_features (variant_key)'
+]
+
+
+class SQLiteVariantStore(MutableMapping):
+	"""
+	A dictionary like store of Variant objects keyed by variant_id and backed by a SQLite database so that a
+	VariantSet does not need to hold every variant in memory. Use VariantSet.use_sqlite_storage() rather than
+	creating one directly.
+
+	Variants are written to the database when they are added and rebuilt as new Variant objects when they are read.
+	The most recently read variants are kept in a least recently used cache so their genotype masks, de novo
+	results and filter context are reused rather than worked out again on every lookup e.g. by to_df(). Changes
+	made to a Variant after it has been added are not saved unless it is added again.
+
+	The worst consequence of each variant is worked out once when it is added and stored in an indexed column.
+	Together with the transcript_features table this lets the compound het grouping select its variants with a
+	single query. The genotype checks depend on which sample is the proband so they are made when the query runs.
+
+	db_path: Path to the SQLite database. An existing database is reopened (String)
+	family: The Family the variants belong to (Family)
+	feature_keys: The transcript annotation keys to index for compound het grouping e.g. Feature (List)
+	batch_size: How many rows to fetch at a time when iterating (Integer)
+	cache_size: How many loaded Variants to keep in memory. 0 rebuilds them on every read (Integer)
+
+	"""
+
+	def __init__(self, db_path, family, feature_keys=['Feature', 'SYMBOL', 'Gene'], batch_size=1000, cache_size=10000):
+
+		self.db_path = db_path
+		self.family = family
+		self.feature_keys = list(feature_keys)
+		self.batch_size = batch_size
+		self.cache_size = cache_size
+
+		# variant_key to Variant in least to most recently used order.
+		self.variant_cache = OrderedDict()
+
+		self.connection = sqlite3.connect(db_path)
+
+		for statement in SCHEMA:
+
+			self.connection.execute(statement)
+
+		self.connection.commit()
+
+	def __len__(self):
+
+		return self.connection.execute('SELECT COUNT(*) FROM variants').fetchone()[0]
+
+	def __contains__(self, variant_id):
+
+		return self._get_variant_key(variant_id) != None
+
+	def __iter__(self):
+
+		for rows in self._iter_batches('SELECT variant_id FROM variants ORDER BY variant_key'):
+
+			for row in rows:
+
+				yield row[0]
+
+	def __getitem__(self, variant_id):
+
+		variant_key = self._get_variant_key(variant_id)
+
+		if variant_key == None:
+
+			raise KeyError(variant_id)
+
+		return self._load_variants([variant_key])[variant_key]
+
+	def __setitem__(self, variant_id, variant):
+
+		assert variant_id == variant.variant_id
+
+		if variant_id in self:
+
+			del self[variant_id]
+
+		worst_consequence = None
+		transcript_count = None
+
+		if variant.transcript_annotations != None:
+
+			# Distinguishes a variant with no transcripts from one without a CSQ annotation.
+			transcript_count = len(variant.transcript_annotations)
+
+			try:
+
+				worst_consequence = variant.get_worst_consequence()
+
+			except ValueError:
+
+				worst_consequence = None
+
+		filter_status = None
+
+		if variant.filter_status != None:
+
+			filter_status = json.dumps(list(variant.filter_status))
+
+		cursor = self.connection.execute("""INSERT INTO variants (variant_id, chrom, pos, ref, alt, filter_status, quality, info, worst_consequence, transcript_count)
+											VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+											(variant.variant_id,
+											 variant.chrom,
+											 variant.pos,
+											 variant.ref,
+											 variant.alt,
+											 filter_status,
+											 variant.quality,
+											 json.dumps(variant.info_annotations),
+											 worst_consequence,
+											 transcript_count))
+
+		variant_key = cursor.lastrowid
+
+		self.connection.executemany('INSERT INTO genotypes VALUES (?, ?, ?, ?, ?, ?, ?)',
+									[(variant_key,
+									  sample,
+									  json.dumps(genotype_data['genotype']),
+									  genotype_data['allele_depths'][0],
+									  genotype_data['allele_depths'][1],
+									  genotype_data['depth'],
+									  genotype_data['genotype_quality']) for sample, genotype_data in variant.genotypes.items()])
+
+		if variant.transcript_annotations != None:
+
+			self.connection.executemany('INSERT INTO transcripts VALUES (?, ?, ?)',
+										[(variant_key, transcript_number, json.dumps(transcript))
+										 for transcript_number, transcript in enumerate(variant.transcript_annotations)])
+
+			self.connection.executemany('INSERT INTO transcript_features VALUES (?, ?, ?, ?)',
+										[(variant_key, transcript_number, feature_key, transcript[feature_key])
+										 for transcript_number, transcript in enumerate(variant.transcript_annotations)
+										 for feature_key in self.feature_keys if feature_key in transcript])
+
+	def __delitem__(self, variant_id):
+
+		variant_key = self._get_variant_key(variant_id)
+
+		if variant_key == None:
+
+			raise KeyError(variant_id)
+
+		for table_name in ['variants', 'genotypes', 'transcripts', 'transcript_features']:
+
+			self.connection.execute(f'DELETE FROM {table_name} WHERE variant_key = ?', (variant_key,))
+
+		self.variant_cache.pop(variant_key, None)
+
+	def values(self):
+		"""
+		Iterate over the variants a batch at a time rather than with one query per variant.
+		"""
+
+		for variant_id, variant in self.items():
+
+			yield variant
+
+	def items(self):
+		"""
+		Iterate over (variant_id, Variant) tuples a batch at a time rather than with one query per variant.
+		"""
+
+		for rows in self._iter_batches('SELECT variant_key, variant_id FROM variants ORDER BY variant_key'):
+
+			variants = self._load_variants([row[0] for row in rows])
+
+			for variant_key, variant_id in rows:
+
+				yield variant_id, variants[variant_key]
+
+	def commit(self):
+		"""
+		Commit any pending writes to the database.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		self.connection.commit()
+
+	def close(self):
+		"""
+		Commit any pending writes and close the database connection.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		self.connection.commit()
+		self.connection.close()
+
+	def get_candidate_compound_hets(self, feature_key, consequences):
+		"""
+		Group the compound het candidates by feature using an indexed query. Gives the same result as
+		VariantSet.get_candidate_compound_hets() over an in memory dict.
+
+		The query selects the variants by worst consequence and feature. Whether the proband is het, the variant is
+		on an autosome or the X in a female and no unaffected sample is hom alt is checked on the loaded variants
+		so the result follows the current proband.
+
+		Input:
+
+			feature_key: (String) The feature to group compound hets on. Must be one of self.feature_keys.
+			consequences: (Dict) A dictionary containing the consequences to include as a compound het.
+
+		Returns:
+
+			candidate_compound_het_dict: (Dict) Dictionary with the feature as the key and a list of Variants as the value.
+			candidate_count: (Integer) The number of variants which are candidates.
+
+		"""
+
+		if feature_key not in self.feature_keys:
+
+			raise ValueError(f'{feature_key} is not indexed - must be one of {self.feature_keys}.')
+
+		consequences = list(consequences)
+
+		placeholders = ','.join('?' for consequence in consequences)
+
+		rows = self.connection.execute(f"""SELECT f.feature, v.variant_key FROM variants v
+										   JOIN transcript_features f ON f.variant_key = v.variant_key
+										   WHERE v.worst_consequence IN ({placeholders})
+										   AND f.feature_key = ?
+										   ORDER BY v.variant_key, f.transcript_number""", consequences + [feature_key]).fetchall()
+
+		variants = self._load_variants(sorted(set(row[1] for row in rows)))
+
+		proband_id = self.family.get_proband_id()
+
+		candidates = {}
+
+		for variant_key, variant in variants.items():
+
+			if (variant.is_on_autosome_or_xfemale() and
+				variant.is_het(proband_id) and
+				variant.is_hom_alt_in_unaffected() == False):
+
+				candidates[variant_key] = variant
+
+		candidate_compound_het_dict = {}
+
+		for feature, variant_key in rows:
+
+			if variant_key in candidates:
+
+				candidate_compound_het_dict.setdefault(feature, []).append(candidates[variant_key])
+
+		return candidate_compound_het_dict, len(candidates)
+
+	def _get_variant_key(self, variant_id):
+
+		row = self.connection.execute('SELECT variant_key FROM variants WHERE variant_id = ?', (variant_id,)).fetchone()
+
+		if row == None:
+
+			return None
+
+		return row[0]
+
+	def _iter_batches(self, query, parameters=()):
+
+		cursor = self.connection.execute(query, parameters)
+
+		while True:
+
+			rows = cursor.fetchmany(self.batch_size)
+
+			if not rows:
+
+				break
+
+			yield rows
+
+	def _load_variants(self, variant_keys):
+		"""
+		Get the Variant objects for a list of variant_keys from the cache, rebuilding the others using one query per
+		table for each batch.
+
+		Input:
+
+			variant_keys: (List) The variant_keys to load.
+
+		Returns:
+
+			variants: (Dict) Dictionary with the variant_key as the key and the Variant as the value.
+
+		"""
+
+		variants = {}
+
+		missing_keys = []
+
+		for variant_key in variant_keys:
+
+			if variant_key in self.variant_cache:
+
+				self.variant_cache.move_to_end(variant_key)
+
+				variants[variant_key] = self.variant_cache[variant_key]
+
+			else:
+
+				missing_keys.append(variant_key)
+
+		for i in range(0, len(missing_keys), self.batch_size):
+
+			batch = missing_keys[i:i + self.batch_size]
+
+			placeholders = ','.join('?' for variant_key in batch)
+
+			genotypes = {}
+			transcripts = {}
+
+			for variant_key, sample, genotype, ref_reads, alt_reads, depth, genotype_quality in self.connection.execute(f'SELECT * FROM genotypes WHERE variant_key IN ({placeholders}) ORDER BY rowid', batch):
+
+				genotypes.setdefault(variant_key, {})[sample] = {'genotype': json.loads(genotype),
+																 'allele_depths': [ref_reads, alt_reads],
+																 'genotype_quality': genotype_quality,
+																 'depth': depth}
+
+			for variant_key, transcript_number, annotation in self.connection.execute(f'SELECT * FROM transcripts WHERE variant_key IN ({placeholders}) ORDER BY variant_key, transcript_number', batch):
+
+				transcripts.setdefault(variant_key, []).append(json.loads(annotation))
+
+			for variant_key, chrom, pos, ref, alt, filter_status, quality, info, transcript_count in self.connection.execute(f'SELECT variant_key, chrom, pos, ref, alt, filter_status, quality, info, transcript_count FROM variants WHERE variant_key IN ({placeholders})', batch):
+
+				if filter_status != None:
+
+					filter_status = json.loads(filter_status)
+
+				info_annotations = json.loads(info)
+
+				# JSON turns the tuples used by pysam for multi value fields into lists.
+				if info_annotations != None:
+
+					info_annotations = {key: tuple(value) if isinstance(value, list) else value for key, value in info_annotations.items()}
+
+				variant = Variant(chrom=chrom, pos=pos, ref=ref, alt=alt, filter_status=filter_status, quality=quality, validate=False)
+				variant.add_family(self.family)
+				variant.add_genotypes_bulk(genotypes.get(variant_key, {}))
+				variant.info_annotations = info_annotations
+
+				if transcript_count != None:
+
+					variant.transcript_annotations = transcripts.get(variant_key, [])
+
+				variants[variant_key] = variant
+
+				self._cache_variant(variant_key, variant)
+
+		return variants
+
+	def _cache_variant(self, variant_key, variant):
+
+		if self.cache_size < 1:
+
+			return
+
+		self.variant_cache[variant_key] = variant
+		self.variant_cache.move_to_end(variant_key)
+
+		while len(self.variant_cache) > self.cache_size:
+
+			self.variant_cache.popitem(last=False)
@@ -0,0 +1,248 @@
+def get_upd_site_evidence(variant, min_parental_gq=30, min_parental_depth=10):
+	"""
+	Classify the UPD evidence given by a single site in a trio.
+
+	Input:
+
+		variant: (Variant) A variant with genotypes for the proband and both parents.
+		min_parental_gq: (Integer) Both parental genotypes must have a GQ value above this.
+		min_parental_depth: (Integer) Both parental genotypes must have a depth above this.
+
+	Returns:
+
+		A tuple of 0/1 flags (paternal, maternal, paternal_isodisomy, maternal_isodisomy, biparental) where paternal and
+		maternal are sites supporting a paternal or maternal UPD (isodisomy or ambiguous mendelian errors),
+		the isodisomy flags are the subset which support isodisomy and biparental is a site where the proband
+		provably inherits an allele from each parent.
+
+	"""
+
+	paternal_isodisomy = variant.matches_paternal_uniparental_isodisomy(min_parental_gq=min_parental_gq, min_parental_depth=min_parental_depth)
+	maternal_isodisomy = variant.matches_maternal_uniparental_isodisomy(min_parental_gq=min_parental_gq, min_parental_depth=min_parental_depth)
+
+	paternal = paternal_isodisomy or variant.matches_paternal_uniparental_ambiguous(min_parental_gq=min_parental_gq, min_parental_depth=min_parental_depth)
+	maternal = maternal_isodisomy or variant.matches_maternal_uniparental_ambiguous(min_parental_gq=min_parental_gq, min_parental_depth=min_parental_depth)
+
+	biparental = variant.is_biparental_inheritance(min_parental_gq=min_parental_gq, min_parental_depth=min_parental_depth) == True
+
+	return (int(paternal), int(maternal), int(paternal_isodisomy), int(maternal_isodisomy), int(biparental))
+
+
+def call_upd_regions(variant_set,
+					 chroms=None,
+					 window_size=5000000,
+					 step=None,
+					 min_supporting_sites=5,
+					 min_support_fraction=0.8,
+					 min_biparental_sites=5,
+					 min_parental_gq=30,
+					 min_parental_depth=10):
+	"""
+	Call candidate uniparental disomy (UPD) and biparental inheritance segments along the genome.
+
+	Each site is classified once with get_upd_site_evidence() and running totals (prefix sums) of each class are kept
+	so every window's counts are a subtraction rather than a rescan. Windows which pass are merged into segments.
+
+	The VariantSet should be loaded with proband_variants_only=False so that sites where the proband is homozygous
+	reference are available as evidence.
+
+	Input:
+
+		variant_set: (VariantSet) A VariantSet for a family where the proband has both parents.
+		chroms: (List) Chromosomes to scan. Defaults to the autosomes in the VariantSet.
+		window_size: (Integer) The window size in bases.
+		step: (Integer) How far to move each window. Defaults to half the window size.
+		min_supporting_sites: (Integer) A window needs at least this many sites supporting UPD from one parent. Must be at least 1.
+		min_support_fraction: (Float) The supporting sites must make up at least this fraction of the supporting plus biparental sites.
+		min_biparental_sites: (Integer) A window with at least this many biparental sites and no UPD sites is called biparental. Must be at least 1.
+		min_parental_gq: (Integer) Both parental genotypes must have a GQ value above this to be used as evidence.
+		min_parental_depth: (Integer) Both parental genotypes must have a depth above this to be used as evidence.
+
+	Returns:
+
+		A list of segment dictionaries with the keys chrom, start, end, call (paternal_upd, maternal_upd or biparental),
+		sites (all sites in the segment), supporting_sites, isodisomy_sites and contradicting_sites. For UPD calls the
+		contradicting sites are biparental sites and for biparental calls they are UPD sites from either parent.
+
+	"""
+
+	if variant_set.family.proband_has_both_parents() == False:
+
+		raise ValueError('The proband must have both parents to call UPD regions.')
+
+	# A window needs at least one informative site for its support fraction and calls.
+	if min_supporting_sites < 1 or min_biparental_sites < 1:
+
+		raise ValueError('min_supporting_sites and min_biparental_sites must be at least 1.')
+
+	if step == None:
+
+		step = max(1, window_size // 2)
+
+	variant_index = variant_set.get_variant_index()
+
+	if chroms == None:
+
+		chroms = [chrom for chrom in variant_index.get_chroms() if chrom not in ['X', 'Y', 'MT', 'M']]
+
+	segments = []
+
+	for chrom in chroms:
+
+		variants = variant_set.get_sorted_variants(chrom)
+
+		if variants:
+
+			segments.extend(_call_chrom_segments(variants,
+												 window_size,
+												 step,
+												 min_supporting_sites,
+												 min_support_fraction,
+												 min_biparental_sites,
+												 min_parental_gq,
+												 min_parental_depth))
+
+	return segments
+
+
+def _call_chrom_segments(variants,
+						 window_size,
+						 step,
+						 min_supporting_sites,
+						 min_support_fraction,
+						 min_biparental_sites,
+						 min_parental_gq,
+						 min_parental_depth):
+	"""
+	Call the UPD and biparental segments on a single chromosome. See call_upd_regions().
+
+	Input:
+
+		variants: (List) Variant objects on one chromosome sorted by position.
+
+	Returns:
+
+		A list of segment dictionaries sorted by start.
+
+	"""
+
+	positions = [variant.pos for variant in variants]
+
+	# prefix[k][i] is the number of sites before index i with evidence class k.
+	prefix = [[0], [0], [0], [0], [0]]
+
+	for variant in variants:
+
+		evidence = get_upd_site_evidence(variant, min_parental_gq=min_parental_gq, min_parental_depth=min_parental_depth)
+
+		for k in range(5):
+
+			prefix[k].append(prefix[k][-1] + evidence[k])
+
+	def count(k, low, high):
+
+		return prefix[k][high] - prefix[k][low]
+
+	# Site index ranges (low, high) of finished and currently open segments for each call.
+	site_ranges = []
+	open_segments = {}
+
+	low = 0
+	high = 0
+
+	window_start = positions[0]
+
+	while window_start <= positions[-1]:
+
+		window_end = window_start + window_size - 1
+
+		while low < len(positions) and positions[low] < window_start:
+
+			low = low + 1
+
+		if high < low:
+
+			high = low
+
+		while high < len(positions) and positions[high] <= window_end:
+
+			high = high + 1
+
+		# Jump over gaps with no sites e.g. centromeres in as few steps as possible.
+		if low == high and low < len(positions):
+
+			window_start = window_start + ((positions[low] - window_end + step - 1) // step) * step
+
+			continue
+
+		paternal = count(0, low, high)
+		maternal = count(1, low, high)
+		biparental = count(4, low, high)
+
+		calls = []
+
+		if paternal >= min_supporting_sites and paternal / (paternal + biparental) >= min_support_fraction:
+
+			calls.append('paternal_upd')
+
+		if maternal >= min_supporting_sites and maternal / (maternal + biparental) >= min_support_fraction:
+
+			calls.append('maternal_upd')
+
+		if biparental >= min_biparental_sites and paternal + maternal == 0:
+
+			calls.append('biparental')
+
+		for call in calls:
+
+			# Extend the open segment if the windows share sites otherwise start a new one.
+			if call in open_segments and low < open_segments[call][1]:
+
+				open_segments[call][1] = max(open_segments[call][1], high)
+
+			else:
+
+				if call in open_segments:
+
+					site_ranges.append((call, open_segments[call][0], open_segments[call][1]))
+
+				open_segments[call] = [low, high]
+
+		window_start = window_start + step
+
+	for call in open_segments:
+
+		site_ranges.append((call, open_segments[call][0], open_segments[call][1]))
+
+	segments = []
+
+	for call, low, high in site_ranges:
+
+		if call == 'paternal_upd':
+
+			supporting = count(0, low, high)
+			isodisomy = count(2, low, high)
+			contradicting = count(4, low, high)
+
+		elif call == 'maternal_upd':
+
+			supporting = count(1, low, high)
+			isodisomy = count(3, low, high)
+			contradicting = count(4, low, high)
+
+		else:
+
+			supporting = count(4, low, high)
+			isodisomy = 0
+			contradicting = count(0, low, high) + count(1, low, high)
+
+		segments.append({'chrom': variants[0].chrom,
+						 'start': positions[low],
+						 'end': positions[high - 1],
+						 'call': call,
+						 'sites': high - low,
+						 'supporting_sites': supporting,
+						 'isodisomy_sites': isodisomy,
+						 'contradicting_sites': contradicting})
+
+	return sorted(segments, key=lambda segment: (segment['start'], segment['call']))
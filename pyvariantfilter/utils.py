@@ -33,6 +33,229 @@ def parse_csq_field(csq_fields, field_description):
 	return consequence_list
 
 
+def normalise_chrom(contig):
+	"""
+	Remove the chr prefix from a contig name e.g. chr1 -> 1 and chrM -> M.
+
+	Input:
+
+	contig - The contig name from the VCF e.g. chr1
+
+	Returns:
+
+		The contig name without the chr prefix.
+
+	"""
+
+	if contig.startswith('chr'):
+
+		return contig[3:]
+
+	return contig
+
+
+def get_valid_contigs(contigs, valid_chroms):
+	"""
+	Resolve which VCF contigs should be loaded.
+
+	Input:
+
+	contigs - An iterable of contig names from the VCF header or index e.g. ['chr1', 'chrUn_KI270302v1']
+	valid_chroms - Dictionary with the accepted chromosome names (without a chr prefix) as keys.
+
+	Returns:
+
+		A tuple of (valid_contigs, invalid_contigs). valid_contigs is a dictionary with the VCF contig name as the key and
+		the normalised chromosome as the value. invalid_contigs is a list of the contigs which are not accepted.
+
+	"""
+
+	valid_contigs = {}
+	invalid_contigs = []
+
+	for contig in contigs:
+
+		chrom = normalise_chrom(contig)
+
+		if chrom in valid_chroms:
+
+			valid_contigs[contig] = chrom
+
+		else:
+
+			invalid_contigs.append(contig)
+
+	return valid_contigs, invalid_contigs
+
+
+def read_bed_file(bed_file):
+	"""
+	Read the intervals from a BED file.
+
+	Input:
+
+	bed_file - Path to a BED file. Track, browser and comment lines are ignored.
+
+	Returns:
+
+		A list of (chrom, start, end, name) tuples. Start is 0 based and end is exclusive as in the BED file. Name is
+		the fourth column or None if the file only has three columns.
+
+	"""
+
+	intervals = []
+
+	with open(bed_file, 'r') as bed:
+
+		for line in bed:
+
+			if line.startswith(('#', 'track', 'browser')) or line.strip() == '':
+
+				continue
+
+			row = line.rstrip('\n').split('\t')
+
+			name = None
+
+			if len(row) > 3:
+
+				name = row[3]
+
+			intervals.append((row[0], int(row[1]), int(row[2]), name))
+
+	return intervals
+
+
+def merge_intervals(intervals):
+	"""
+	Merge overlapping or adjacent intervals on each chromosome.
+
+	Input:
+
+	intervals - An iterable of (chrom, start, end) tuples. Start is 0 based and end is exclusive. Any chr prefix
+	is removed from the chromosome.
+
+	Returns:
+
+		A dictionary with the chromosome as the key and a sorted list of non overlapping (start, end) tuples as the value.
+
+	"""
+
+	intervals_by_chrom = {}
+
+	for interval in intervals:
+
+		chrom = normalise_chrom(str(interval[0]))
+
+		start = int(interval[1])
+		end = int(interval[2])
+
+		if end < start:
+
+			raise ValueError(f'Interval {interval} has an end before its start.')
+
+		intervals_by_chrom.setdefault(chrom, []).append((start, end))
+
+	merged = {}
+
+	for chrom in intervals_by_chrom:
+
+		merged_intervals = []
+
+		for start, end in sorted(intervals_by_chrom[chrom]):
+
+			if merged_intervals and start <= merged_intervals[-1][1]:
+
+				if end > merged_intervals[-1][1]:
+
+					merged_intervals[-1] = (merged_intervals[-1][0], end)
+
+			else:
+
+				merged_intervals.append((start, end))
+
+		merged[chrom] = merged_intervals
+
+	return merged
+
+
+def get_regions(regions=None, genes=None, gene_bed=None):
+	"""
+	Build the merged regions to load from a BED file or list of intervals and/or a list of gene symbols.
+
+	Input:
+
+	regions - Path to a BED file or a list of (chrom, start, end) tuples with a 0 based start and exclusive end.
+	genes - List of gene symbols e.g. a virtual gene panel. Requires gene_bed.
+	gene_bed - Path to a BED file with the gene symbol in the fourth column used to look up the genes.
+
+	Returns:
+
+		A dictionary with the chromosome (without a chr prefix) as the key and a sorted list of merged (start, end)
+		tuples as the value.
+
+	"""
+
+	intervals = []
+
+	if regions != None:
+
+		if isinstance(regions, str):
+
+			intervals = intervals + [interval[:3] for interval in read_bed_file(regions)]
+
+		else:
+
+			intervals = intervals + [tuple(interval[:3]) for interval in regions]
+
+	if genes != None:
+
+		if gene_bed == None:
+
+			raise ValueError('A gene_bed file is required to look up gene coordinates.')
+
+		genes = set(genes)
+
+		found = set()
+
+		for chrom, start, end, name in read_bed_file(gene_bed):
+
+			if name in genes:
+
+				intervals.append((chrom, start, end))
+				found.add(name)
+
+		if found != genes:
+
+			raise ValueError(f'Genes {sorted(genes - found)} were not found in {gene_bed}.')
+
+	return merge_intervals(intervals)
+
+
+def check_vcf_samples(header, family_member_ids):
+	"""
+	Check that every family member has a sample column in the VCF.
+
+	Input:
+
+	header - The header object from the PySam VCF parser.
+	family_member_ids - List of family_member_ids which will be read from the VCF.
+
+	Returns:
+
+		None - raises a ValueError if any family members are missing from the VCF.
+
+	"""
+
+	samples = set(header.samples)
+
+	missing = [family_member_id for family_member_id in family_member_ids if family_member_id not in samples]
+
+	if missing:
+
+		raise ValueError(f'Family members {missing} are not samples in the VCF.')
+
+
 def get_info_field_dict(info_fields, vep_csq_key='CSQ'):
 	"""
 	Get the info fields from a VCF as a dictionary.
@@ -64,6 +287,143 @@ def get_info_field_dict(info_fields, vep_csq_key='CSQ'):
 
 	return info_dict
 
+def get_split_info_field_dict(info_fields, info_numbers, allele_number, vep_csq_key='CSQ'):
+	"""
+	Get the info fields for one alt allele of a multi-allelic record as a dictionary.
+
+	Fields with one value per alt allele (Number=A) keep the value for this allele and fields with one value per
+	allele (Number=R) keep the ref value and the value for this allele. Other fields are as get_info_field_dict().
+
+	Input:
+
+	info_fields - The info_fields object from the PySam VCF parser.
+	info_numbers - Dictionary with the info key as the key and the Number from the VCF header as the value.
+	allele_number - The index of the alt allele in the record starting from 1.
+	vep_csq_key - The key to access the CSQ field.
+
+	"""
+
+	info_dict = get_info_field_dict(info_fields, vep_csq_key)
+
+	for key in info_dict:
+
+		value = info_fields[key]
+
+		if not isinstance(value, tuple):
+
+			continue
+
+		if info_numbers.get(key) == 'A' and len(value) >= allele_number:
+
+			info_dict[key] = value[allele_number - 1]
+
+		elif info_numbers.get(key) == 'R' and len(value) > allele_number:
+
+			info_dict[key] = (value[0], value[allele_number])
+
+	return info_dict
+
+def trim_alleles(pos, ref, alt):
+	"""
+	Remove the bases shared by the end and then the start of the ref and alt alleles, leaving at least one base in
+	each. Splitting a multi-allelic record can leave padding bases e.g. GTT>GT becomes GT>G.
+
+	Variants are not left aligned as that needs the reference genome.
+
+	Input:
+
+	pos - The position of the ref allele.
+	ref - The ref allele.
+	alt - The alt allele.
+
+	Returns:
+
+	A (pos, ref, alt) tuple.
+
+	"""
+
+	while len(ref) > 1 and len(alt) > 1 and ref[-1] == alt[-1]:
+
+		ref = ref[:-1]
+		alt = alt[:-1]
+
+	while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+
+		ref = ref[1:]
+		alt = alt[1:]
+		pos = pos + 1
+
+	return pos, ref, alt
+
+def get_vep_alleles(ref, alts):
+	"""
+	Get the Allele value VEP gives each alt allele of a VCF record in the CSQ field.
+
+	If any alt is an indel and every allele shares the same first base VEP removes the first base, using - for an
+	empty allele e.g. ref GTT with alts G and GT gives - and T.
+
+	Input:
+
+	ref - The ref allele.
+	alts - List of the alt alleles.
+
+	Returns:
+
+	A list with the VEP allele of each alt.
+
+	"""
+
+	is_indel = False
+
+	for alt in alts:
+
+		if len(alt) != len(ref):
+
+			is_indel = True
+
+	if is_indel == True and len(set(allele[0] for allele in [ref] + list(alts))) == 1:
+
+		return [alt[1:] or '-' for alt in alts]
+
+	return list(alts)
+
+def split_transcript_annotations(transcript_annotations, ref, alts, allele_number):
+	"""
+	Get the transcript annotations which belong to one alt allele of a multi-allelic record.
+
+	Uses the ALLELE_NUM field if VEP was run with --allele_number and otherwise the Allele field.
+
+	Input:
+
+	transcript_annotations - A list of transcript dictionaries from parse_csq_field()
+	ref - The ref allele.
+	alts - List of the alt alleles.
+	allele_number - The index of the alt allele in the record starting from 1.
+
+	Returns:
+
+	A list of the transcript dictionaries for the alt allele.
+
+	"""
+
+	vep_allele = get_vep_alleles(ref, alts)[allele_number - 1]
+
+	allele_transcripts = []
+
+	for transcript in transcript_annotations:
+
+		if transcript.get('ALLELE_NUM') not in [None, '']:
+
+			if transcript['ALLELE_NUM'] == str(allele_number):
+
+				allele_transcripts.append(transcript)
+
+		elif transcript.get('Allele') == vep_allele:
+
+			allele_transcripts.append(transcript)
+
+	return allele_transcripts
+
 def compound_het_pair_pass_filter(pair,
 							 affected,
 							 unaffected,
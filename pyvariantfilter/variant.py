@@ -1,9 +1,58 @@
 from pyvariantfilter.family import Family
 import statistics
 
+VALID_CHROMS = {'1': None, '2': None, '3': None, '4': None,
+ '5': None, '6': None, '7': None, '8': None, '9': None,
+ '10': None, '11': None, '12': None, '13': None,
+ '14': None, '15': None, '16': None, '17': None,
+ '18': None, '19': None, '20': None, '21': None,
+ '22': None, 'X': None, 'Y': None, 'MT': None, 'M': None}
+
+# The contexts returned by Variant.get_filter_context() in the order used for the VariantSet context codes.
+FILTER_CONTEXTS = ['compound_het', 'ad_het', 'ad_hom_alt', 'x_male', 'x_female_het', 'x_female_hom', 'y', 'mt']
+
+# VEP consequences from most to least severe. The default order for Variant.get_worst_consequence()
+CONSEQUENCE_SEVERITY = ['transcript_ablation',
+						'splice_acceptor_variant',
+						'splice_donor_variant',
+						'stop_gained',
+						'frameshift_variant',
+						'stop_lost',
+						'start_lost',
+						'transcript_amplification',
+						'inframe_insertion',
+						'inframe_deletion',
+						'missense_variant',
+						'protein_altering_variant',
+						'splice_region_variant',
+						'incomplete_terminal_codon_variant',
+						'start_retained_variant',
+						'stop_retained_variant',
+						'synonymous_variant',
+						'coding_sequence_variant',
+						'mature_miRNA_variant',
+						'5_prime_UTR_variant',
+						'3_prime_UTR_variant',
+						'non_coding_transcript_exon_variant',
+						'intron_variant',
+						'NMD_transcript_variant',
+						'non_coding_transcript_variant',
+						'upstream_gene_variant',
+						'downstream_gene_variant',
+						'TFBS_ablation',
+						'TFBS_amplification',
+						'TF_binding_site_variant',
+						'regulatory_region_ablation',
+						'regulatory_region_amplification',
+						'feature_elongation',
+						'regulatory_region_variant',
+						'feature_truncation',
+						'intergenic_variant']
+
+
 class Variant:
 	
-	def __init__(self, chrom, pos, ref, alt, filter_status=None, quality=None):
+	def __init__(self, chrom, pos, ref, alt, filter_status=None, quality=None, validate=True):
 		
 		self.chrom = chrom
 		self.pos = pos
@@ -16,8 +65,16 @@ class Variant:
 		self.variant_id = f'{self.chrom}:{self.pos}{self.ref}>{self.alt}'
 		self.family = None
 		self.genotypes = {}
+		self.genotype_masks = None
+		self.low_quality_masks = {}
+		self.alt_ref_ratios = {}
+		self.denovo_cache = {}
+		self.filter_context = None
 
-		self.is_valid()
+		# Readers which have already checked the chromosome can skip validation.
+		if validate == True:
+
+			self.is_valid()
 			
 	def __repr__(self):
 		 return self.variant_id
@@ -32,17 +89,10 @@ class Variant:
 
 		"""
 
-		valid_chroms = {'1': None, '2': None, '3': None, '4': None,
-		 '5': None, '6': None, '7': None, '8': None, '9': None,
-		 '10': None, '11': None, '12': None, '13': None,
-		 '14': None, '15': None, '16': None, '17': None,
-		 '18': None, '19': None, '20': None, '21': None,
-		 '22': None, 'X': None, 'Y': None, 'MT': None, 'M': None}
-
 		# Chromosome is correct
-		if self.chrom not in valid_chroms:
+		if self.chrom not in VALID_CHROMS:
 
-			raise ValueError(f'Chromosome not in {valid_chroms} for variant {self.variant_id}.')
+			raise ValueError(f'Chromosome not in {VALID_CHROMS} for variant {self.variant_id}.')
 
 		# Position must be an Integer
 		if isinstance(self.pos, int) == False:
@@ -88,6 +138,35 @@ class Variant:
 									'allele_depths': allele_depths,
 									'genotype_quality': genome_quality,
 									'depth': depth}
+
+		self.alt_ref_ratios[family_member_id] = self.calculate_alt_ref_ratio(allele_depths)
+
+		self.clear_cached_masks()
+
+	def add_genotypes_bulk(self, genotypes):
+		"""
+		Add the genotypes for all family members in one call without validating each one.
+
+		Only for trusted data such as the VariantSet readers which check the samples once per file.
+		Use add_genotype() for a validated single genotype.
+
+		Input:
+
+			genotypes: Dictionary with the family_member_id as the key and a dictionary with the genotype, allele_depths,
+			genotype_quality and depth keys as the value - the same format as self.genotypes. (Dict)
+
+		Returns:
+
+			None
+		"""
+
+		self.genotypes.update(genotypes)
+
+		for family_member_id in genotypes:
+
+			self.alt_ref_ratios[family_member_id] = self.calculate_alt_ref_ratio(genotypes[family_member_id]['allele_depths'])
+
+		self.clear_cached_masks()
 		  
 	def add_family(self, family):
 		"""
@@ -105,6 +184,139 @@ class Variant:
 		assert isinstance(family, Family)
 	
 		self.family = family
+
+		self.clear_cached_masks()
+
+	def clear_cached_masks(self):
+		"""
+		Clear the cached genotype masks, de novo results and filter context. Called whenever the genotypes or family change.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		self.genotype_masks = None
+		self.low_quality_masks = {}
+		self.denovo_cache = {}
+		self.filter_context = None
+
+	def calculate_alt_ref_ratio(self, allele_depths):
+		"""
+		Calculate the alt/ref read ratio from a list of allele depths.
+
+		Input:
+
+			allele_depths: List of allele_depths - First item in list should be ref and second alt e.g. [10, 5] (List of Integers)
+
+		Returns:
+
+			ratio: (Float) The alt/ref ratio or 0 if there are no ref reads.
+
+		"""
+
+		# no div by 0 - what if ads are 0,0
+		if allele_depths[0] == 0:
+
+			return 0
+
+		return allele_depths[1] / allele_depths[0]
+
+	def get_genotype_masks(self):
+		"""
+		Get bitmasks of the family members in each genotype class using the bits from Family.get_member_bits().
+
+		Family members without a genotype are treated as missing.
+
+		Input: Self
+
+		Returns:
+
+			genotype_masks: (Dict) Dictionary with the keys has_alt, het, hom_alt, hom_ref and missing.
+
+		"""
+
+		if self.genotype_masks == None:
+
+			has_alt = 0
+			het = 0
+			hom_alt = 0
+			hom_ref = 0
+			missing = 0
+
+			for family_member_id, bit in self.family.get_member_bits().items():
+
+				genotype_data = self.genotypes.get(family_member_id)
+
+				if genotype_data == None:
+
+					missing |= bit
+
+					continue
+
+				gt = genotype_data['genotype']
+
+				alt_count = gt.count(self.alt)
+
+				if alt_count == 1:
+
+					has_alt |= bit
+					het |= bit
+
+				elif alt_count == 2:
+
+					has_alt |= bit
+					hom_alt |= bit
+
+				elif gt.count(self.ref) == 2:
+
+					hom_ref |= bit
+
+				elif gt.count('.') == 2:
+
+					missing |= bit
+
+			self.genotype_masks = {'has_alt': has_alt, 'het': het, 'hom_alt': hom_alt, 'hom_ref': hom_ref, 'missing': missing}
+
+		return self.genotype_masks
+
+	def get_low_quality_mask(self, min_dp, min_gq):
+		"""
+		Get a bitmask of the family members with a depth below min_dp or a genotype quality below min_gq.
+
+		Family members without a genotype are treated as low quality.
+
+		Input:
+
+			min_dp: The minimum depth.
+			min_gq: The minimum genotype quality.
+
+		Returns:
+
+			low_quality_mask: (Integer) Bitmask of the low quality family members.
+
+		"""
+
+		key = (min_dp, min_gq)
+
+		if key not in self.low_quality_masks:
+
+			low_quality = 0
+
+			for family_member_id, bit in self.family.get_member_bits().items():
+
+				genotype_data = self.genotypes.get(family_member_id)
+
+				if genotype_data == None or genotype_data['depth'] < min_dp or genotype_data['genotype_quality'] < min_gq:
+
+					low_quality |= bit
+
+			self.low_quality_masks[key] = low_quality
+
+		return self.low_quality_masks[key]
 		
 	def get_genes(self, feature_key='Feature'):
 		"""
@@ -132,43 +344,7 @@ class Variant:
 
 		return genes
 	
-	def get_worst_consequence(self, consequence_severity=[
-		'transcript_ablation', 
-		'splice_acceptor_variant', 
-		'splice_donor_variant', 
-		'stop_gained', 
-		'frameshift_variant',
-		'stop_lost',
-		'start_lost',
-		'transcript_amplification',
-		'inframe_insertion',
-		'inframe_deletion',
-		'missense_variant',
-		'protein_altering_variant',
-		'splice_region_variant',
-		'incomplete_terminal_codon_variant',
-		'start_retained_variant',
-		'stop_retained_variant',
-		'synonymous_variant',
-		'coding_sequence_variant',
-		'mature_miRNA_variant',
-		'5_prime_UTR_variant',
-		'3_prime_UTR_variant',
-		'non_coding_transcript_exon_variant',
-		'intron_variant',
-		'NMD_transcript_variant',
-		'non_coding_transcript_variant',
-		'upstream_gene_variant',
-		'downstream_gene_variant',
-		'TFBS_ablation',
-		'TFBS_amplification',
-		'TF_binding_site_variant',
-		'regulatory_region_ablation',
-		'regulatory_region_amplification',
-		'feature_elongation',
-		'regulatory_region_variant',
-		'feature_truncation',
-		'intergenic_variant'], consequence_key='Consequence'):
+	def get_worst_consequence(self, consequence_severity=CONSEQUENCE_SEVERITY, consequence_key='Consequence'):
 		"""
 		Get the worst consequence of all the transcripts in the self.transcript_annotations.
 
@@ -483,6 +659,25 @@ class Variant:
 		
 		return ad[1]
 
+	def get_alt_ref_ratio(self, family_member_id):
+		"""
+		Get the alt/ref read ratio for a family_member. Worked out once when the genotype is added.
+
+		Input:
+
+			family_member_id: family_member_id of a Family Member object.
+
+		Returns:
+
+			ratio: alt/ref read ratio or 0 if there are no ref reads.
+
+		"""
+		if family_member_id not in self.alt_ref_ratios:
+
+			self.alt_ref_ratios[family_member_id] = self.calculate_alt_ref_ratio(self.genotypes[family_member_id]['allele_depths'])
+
+		return self.alt_ref_ratios[family_member_id]
+
 	def get_ref_reads(self, family_member_id):
 		"""
 		Get the ref read count for a family_member.
@@ -525,64 +720,7 @@ class Variant:
 
 		"""
 
-		if self.chrom in ['X', 'Y', 'MT', 'M']:
-			
-			return False
-	
-		
-		# Check that all affected are het
-		affected = self.family.get_affected_family_members()
-		
-		if lenient == False:
-		
-			for family_member_id in affected:
-
-				if self.is_het(family_member_id) == False and self.is_missing(family_member_id) == False:
-
-					return False
-				
-		else:
-			
-			# affected people who are not the proband are allowed to be hom alt
-			for family_member_id in affected:
-					
-				if self.family.get_proband_id() != family_member_id:
-					
-					if self.has_alt(family_member_id) == False and self.is_missing(family_member_id) == False:
-
-						return False
-					
-				else:
-										
-					if self.is_het(family_member_id) == False and self.is_missing(family_member_id) == False:
-
-						return False
-
-		check_unaffected = True
-
-		if low_penetrance_genes:
-
-			genes = self.get_genes(feature_key='SYMBOL')
-
-			for gene in genes:
-
-				if gene in low_penetrance_genes:
-
-					check_unaffected = False
-					break
-
-		if check_unaffected == True:
-
-			# Check that all unaffected are hom ref and not missing if they are return false
-			unaffected = self.family.get_unaffected_family_members()
-				
-			for family_member_id in unaffected:
-					
-				if self.has_alt(family_member_id) == True:
-						
-					return False
-				
-		return True
+		return self.family.get_inheritance_rules().matches_autosomal_dominant(self, lenient=lenient, low_penetrance_genes=low_penetrance_genes)
 		
 	
 	def matches_autosomal_reccessive(self):
@@ -603,30 +741,8 @@ class Variant:
 		3) No unaffected samples can be homozygous for the alternate allele. Can be missing.
 
 		"""
-		
-		if self.chrom in ['X', 'Y', 'MT', 'M']:
-			
-			return False
-		
-		# Check that all affected are hom alt
-		affected = self.family.get_affected_family_members()
-		
-		for family_member_id in affected:
-					
-			if self.is_hom_alt(family_member_id) == False and self.is_missing(family_member_id) == False:
-									
-				return False
-		
-		# Check that unaffected are not hom alt 
-		unaffected = self.family.get_unaffected_family_members()
-			
-		for family_member_id in unaffected:
-							
-			if self.is_hom_alt(family_member_id) == True:
-					
-				return False      
-			
-		return True
+
+		return self.family.get_inheritance_rules().matches_autosomal_reccessive(self)
 		
 	
 	def matches_denovo(self, min_parental_gq=30, min_parental_depth=10, max_parental_alt_ref_ratio=0.04):
@@ -652,6 +768,19 @@ class Variant:
 			4) Parents must have a alt/ref ratio below max_parental_alt_ref_ratio
 
 		
+		"""
+		key = (self.family.get_proband_id(), min_parental_gq, min_parental_depth, max_parental_alt_ref_ratio)
+
+		# The result is cached per proband and threshold set as the compound het filter asks the same question for each pair.
+		if key not in self.denovo_cache:
+
+			self.denovo_cache[key] = self._evaluate_denovo(min_parental_gq, min_parental_depth, max_parental_alt_ref_ratio)
+
+		return self.denovo_cache[key]
+
+	def _evaluate_denovo(self, min_parental_gq, min_parental_depth, max_parental_alt_ref_ratio):
+		"""
+		Evaluate the de novo rules without the cache. See matches_denovo().
 		"""
 		proband = self.family.get_proband()
 		
@@ -670,42 +799,14 @@ class Variant:
 				mum_id = mum.get_id()
 				dad_id = dad.get_id()
 				
-				mum_gq = self.get_genotype_quality(mum_id)
-				mum_dp = self.get_depth(mum_id)
-				mum_alt = self.get_alt_reads(mum_id)
-				mum_ref = self.get_ref_reads(mum_id)
-
-				# no div by 0 - what if ads are 0,0
-				if mum_ref == 0:
-
-					mum_ad_ratio = 0
-
-				else:
-
-					mum_ad_ratio = mum_alt / mum_ref
-				
-				dad_gq = self.get_genotype_quality(dad_id)
-				dad_dp = self.get_depth(dad_id)
-				dad_alt = self.get_alt_reads(dad_id) 
-				dad_ref = self.get_ref_reads(dad_id)
-
-				# no div by 0
-				if dad_ref == 0:
-
-					dad_ad_ratio = 0
-
-				else:
-
-					dad_ad_ratio = dad_alt / dad_ref
-				
 				if (self.has_alt(mum_id) == False and 
-					mum_gq >= min_parental_gq and 
-					mum_dp >= min_parental_depth and 
-					mum_ad_ratio <= max_parental_alt_ref_ratio and
+					self.get_genotype_quality(mum_id) >= min_parental_gq and 
+					self.get_depth(mum_id) >= min_parental_depth and 
+					self.get_alt_ref_ratio(mum_id) <= max_parental_alt_ref_ratio and
 					self.has_alt(dad_id) == False and
-					dad_gq >= min_parental_gq and
-					dad_dp >= min_parental_depth and
-					dad_ad_ratio < max_parental_alt_ref_ratio):
+					self.get_genotype_quality(dad_id) >= min_parental_gq and
+					self.get_depth(dad_id) >= min_parental_depth and
+					self.get_alt_ref_ratio(dad_id) < max_parental_alt_ref_ratio):
 					
 					return True
 				
@@ -737,46 +838,8 @@ class Variant:
 			5) No unaffected male samples can have the variant.
 
 		"""
-		
-		if self.chrom != 'X':
-			
-			return False
-		
-		affected_females = self.family.get_affected_female_members()
-		
-		for family_member_id in affected_females:
-			
-			if self.is_hom_alt(family_member_id) == False and self.is_missing(family_member_id) == False:
-				
-				return False
-			
-			
-		unaffected_females = self.family.get_unaffected_female_members()
-		
-		for family_member_id in unaffected_females:
-			
-			if self.is_hom_alt(family_member_id) == True:
-				
-				return False
-	
-	
-		affected_males = self.family.get_affected_male_members()
-		
-		for family_member_id in affected_males:
-			
-			if self.is_hom_ref(family_member_id) == True and self.is_missing(family_member_id) == False:
-				
-				return False    
-	
-		unaffected_males = self.family.get_unaffected_male_members()
-		
-		for family_member_id in unaffected_males:
-			
-			if self.has_alt(family_member_id) == True:
-				
-				return False 
-			
-		return True
+
+		return self.family.get_inheritance_rules().matches_x_reccessive(self)
 	
 
 	def matches_x_dominant(self):
@@ -800,59 +863,8 @@ class Variant:
 			6) Unaffected samples must not have the variant.
 
 		"""
-		
-		# Must be on X chromosome
-		if self.chrom != 'X':
-			
-			return False 
-		
-		# Check affected males children,
-		affected_males = self.family.get_affected_male_members()	
-		for family_member_id in affected_males:
-			
-			# if an affected male has unaffected daughters then no match
-			daughters = self.family.get_daughters(family_member_id)
-			
-			for daughter in daughters:
-				
-				if daughter.affected == False:
-					
-					return False
-			
-			# if an affected male has an affected son then no match
-			sons = self.family.get_sons(family_member_id)
-			
-			for son in sons:
-				
-				if son.affected == True:
-					
-					return False
-		
-		# Affected males must not be hom ref
-		for family_member_id in affected_males:
-			
-			if self.is_hom_ref(family_member_id) == True and self.is_missing(family_member_id) == False :
-					
-					return False
-		
-		
-		# Affected females must be het or missing.
-		affected_females = self.family.get_affected_female_members()
-		for family_member_id in affected_females:
-			
-			if self.is_het(family_member_id) == False and self.is_missing(family_member_id) == False:
-				
-				return False
-			
-		# Unaffected samples must not have the variant.
-		unaffected = self.family.get_unaffected_family_members()
-		for family_member_id in unaffected:
-			
-			if self.has_alt(family_member_id) == True:
-				
-				return False 
-			
-		return True
+
+		return self.family.get_inheritance_rules().matches_x_dominant(self)
 			
 	def matches_uniparental_isodisomy(self, min_parental_gq=30, min_parental_depth=10):
 		"""
@@ -1101,47 +1113,15 @@ class Variant:
 		A list of all matching inheritance models.
 		"""
 
-		matching_models =[]
-
-		if self.matches_autosomal_dominant(lenient=lenient, low_penetrance_genes= low_penetrance_genes):
-
-			matching_models.append('autosomal_dominant')
-
-		if self.matches_autosomal_reccessive():
-
-			matching_models.append('autosomal_reccessive')
-
-		if self.matches_x_reccessive():
-
-			matching_models.append('x_reccessive')
-
-		if self.matches_x_dominant():
-
-			matching_models.append('x_dominant')
-
-		if self.matches_denovo(min_parental_gq=min_parental_gq_dn, min_parental_depth=min_parental_depth_dn, max_parental_alt_ref_ratio=max_parental_alt_ref_ratio_dn):
-
-			matching_models.append('de_novo')
-
-		if self.matches_uniparental_isodisomy(min_parental_depth=min_parental_depth_upi, min_parental_gq=min_parental_gq_upi):
-
-			matching_models.append('uniparental_isodisomy')
-
-		if self.matches_mitochrondrial():
-
-			matching_models.append('mitochrondrial')
-
-		if self.matches_y():
-
-			matching_models.append('y_chrom')
-
-		if self.matches_compound_het(compound_het_dict):
-
-			matching_models.append('compound_het')
-
-		return matching_models
-
-
+		return self.family.get_inheritance_rules().get_matching_inheritance_models(self,
+																				compound_het_dict,
+																				lenient=lenient,
+																				low_penetrance_genes=low_penetrance_genes,
+																				min_parental_gq_dn=min_parental_gq_dn,
+																				min_parental_depth_dn=min_parental_depth_dn,
+																				max_parental_alt_ref_ratio_dn=max_parental_alt_ref_ratio_dn,
+																				min_parental_gq_upi=min_parental_gq_upi,
+																				min_parental_depth_upi=min_parental_depth_upi)
 
 	def passes_gt_filter(self, family_member_id, min_dp=20, min_gq=30):
 		"""
@@ -1225,13 +1205,9 @@ class Variant:
 
 		"""
 		
-		unaffected = self.family.get_unaffected_family_members()
-		
-		for family_member_id in unaffected:
-			
-			if self.is_hom_alt(family_member_id) == True:
+		if self.family.get_role_masks()['unaffected'] & self.get_genotype_masks()['hom_alt']:
 				
-				return True
+			return True
 			
 		return False
 	
@@ -1429,140 +1405,176 @@ class Variant:
 			raise ValueError('Invalid aggregation function supplied')
 
 
-	def filter_on_numerical_transcript_annotation_gte(self,
-												 annotation_key,
-												 ad_het,
-												 ad_hom_alt,
-												 x_male,
-												 x_female_het,
-												 x_female_hom,
-												 compound_het,
-												 y,
-												 mt,
-												 zero_values=['.', '', None],
-												 agg_func='min',
-												 compound_het_dict = {}):
-
+	def get_filter_context(self, compound_het_dict={}):
 		"""
-		Filter on a numerical value. Is the value is larger or equal to the provided value?
+		Get the context used by the filter_on_numerical functions to choose a threshold for the variant.
 
-		Different values can be provided for different variant types. For example we can provide different 
-		values for ad_het (autosomal heterozygous) and x_male (variants on x chromsome in men).
-
-		Uses the genotype of whichever sample is set as the proband.
+		The genotype part of the context is worked out once and cached so chaining several filters does not
+		repeat it. Uses the genotype of whichever sample is set as the proband.
 
 		Input:
 
-			annotation_key - which annotation in the self.transcript_annotations list of dictionaries to get
-			ad_het - the value to filter on for variants in which the proband is heterozygouse on an autosome.
-			ad_hom_alt - the value to filter on for variants in which the proband is homozygous alt on an autosome.
-			x_male - the value to filter on for variants on the X chromsome in which the proband is male.  
-			x_female_het - the value to filter on for heterozygous variants on the X chromsome in which the proband is female. 
-			x_female_hom - the value to filter on for homozygous variants on the X chromsome in which the proband is female.
-			compound_het - the value to filter on if the variant is a compound het.
-			y - the value to filter on if the variant is on the Y chromosome.
-			mt - teh value to filter on if the variant is on the Mitochondrial chromosome.
-			zero_values - list of values which should be considered as 0 in the annotation.
-			agg_func - how to aggregate multiple values - min, max, mean
 			compound_het_dict - A dictionary of variants which are compound hets.
 
 		Returns:
 
-			True - if the variant has a value above the supplied value
-			False - otherwise.
+			context - One of FILTER_CONTEXTS i.e. compound_het, ad_het, ad_hom_alt, x_male, x_female_het,
+			x_female_hom, y or mt. None if the variant does not have a context e.g. the proband is homozygous reference.
 
 		"""
 
+		if self.variant_id in compound_het_dict:
+
+			return 'compound_het'
 
-		annotation = self.get_numerical_transcript_annotation(annotation_key, zero_values, agg_func)
 		proband = self.family.get_proband()
 		proband_id = proband.get_id()
 
+		# The context depends on which sample is the proband so the cache records the proband it was worked out for.
+		if self.filter_context == None or self.filter_context[0] != proband_id:
 
-		if self.variant_id in compound_het_dict:
+			proband_bit = self.family.get_member_bits()[proband_id]
 
-			if annotation >= compound_het:
+			genotype_masks = self.get_genotype_masks()
 
-					return True
+			het = genotype_masks['het'] & proband_bit
+			hom_alt = genotype_masks['hom_alt'] & proband_bit
 
-			else:
+			# An empty string marks a variant without a context so it is not worked out again.
+			context = ''
 
-				return False
+			if self.chrom not in ['X', 'Y', 'MT', 'M']:
 
+				if het:
 
-		if self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_het(proband_id):
+					context = 'ad_het'
 
-			if annotation >= ad_het:
+				elif hom_alt:
 
-				return True
+					context = 'ad_hom_alt'
 
-			else:
+			elif self.chrom == 'X':
 
-				return False
+				if proband.sex == 1 and genotype_masks['has_alt'] & proband_bit:
 
-		elif self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_hom_alt(proband_id):
+					context = 'x_male'
 
-			if annotation >= ad_hom_alt:
+				elif proband.sex == 2 and het:
 
-				return True
+					context = 'x_female_het'
+
+				elif proband.sex == 2 and hom_alt:
+
+					context = 'x_female_hom'
+
+			elif self.chrom == 'Y':
+
+				context = 'y'
 
 			else:
 
-				return False
+				context = 'mt'
 
-		elif self.chrom == 'X' and proband.sex == 1 and self.has_alt(proband_id):
+			self.filter_context = (proband_id, context)
 
-			if annotation >= x_male:
+		if self.filter_context[1] == '':
 
-				return True
+			return None
 
-			else:
+		return self.filter_context[1]
 
-				return False	
+	def get_filter_threshold(self,
+							 ad_het,
+							 ad_hom_alt,
+							 x_male,
+							 x_female_het,
+							 x_female_hom,
+							 compound_het,
+							 y,
+							 mt,
+							 compound_het_dict={}):
+		"""
+		Get the value to filter on for the variant's context (see get_filter_context()).
 
-		elif self.chrom == 'X' and proband.sex == 2 and self.is_het(proband_id):
+		Input:
 
-			if annotation >= x_female_het:
+			ad_het, ad_hom_alt, x_male, x_female_het, x_female_hom, compound_het, y, mt - the value to filter on for
+			each context as in filter_on_numerical_transcript_annotation_gte()
+			compound_het_dict - A dictionary of variants which are compound hets.
 
-				return True
+		Returns:
 
-			else:
+			threshold - the value for the variant's context.
 
-				return False	
+		"""
 
-		elif self.chrom == 'X' and proband.sex == 2 and self.is_hom_alt(proband_id):
+		context = self.get_filter_context(compound_het_dict)
 
-			if annotation >= x_female_hom:
+		if context == None:
 
-				return True
+			raise ValueError('Variant does not have a a recognised workflow - is the proband homozygous reference?')
 
-			else:
+		thresholds = {'compound_het': compound_het,
+					  'ad_het': ad_het,
+					  'ad_hom_alt': ad_hom_alt,
+					  'x_male': x_male,
+					  'x_female_het': x_female_het,
+					  'x_female_hom': x_female_hom,
+					  'y': y,
+					  'mt': mt}
 
-				return False
+		return thresholds[context]
 
-		elif self.chrom =='Y':
+	def filter_on_numerical_transcript_annotation_gte(self,
+												 annotation_key,
+												 ad_het,
+												 ad_hom_alt,
+												 x_male,
+												 x_female_het,
+												 x_female_hom,
+												 compound_het,
+												 y,
+												 mt,
+												 zero_values=['.', '', None],
+												 agg_func='min',
+												 compound_het_dict = {}):
 
-			if annotation >= y:
+		"""
+		Filter on a numerical value. Is the value is larger or equal to the provided value?
 
-				return True
+		Different values can be provided for different variant types. For example we can provide different 
+		values for ad_het (autosomal heterozygous) and x_male (variants on x chromsome in men).
 
-			else:
+		Uses the genotype of whichever sample is set as the proband.
 
-				return False
+		Input:
 
-		elif self.chrom =='MT' or self.chrom =='M':
+			annotation_key - which annotation in the self.transcript_annotations list of dictionaries to get
+			ad_het - the value to filter on for variants in which the proband is heterozygouse on an autosome.
+			ad_hom_alt - the value to filter on for variants in which the proband is homozygous alt on an autosome.
+			x_male - the value to filter on for variants on the X chromsome in which the proband is male.  
+			x_female_het - the value to filter on for heterozygous variants on the X chromsome in which the proband is female. 
+			x_female_hom - the value to filter on for homozygous variants on the X chromsome in which the proband is female.
+			compound_het - the value to filter on if the variant is a compound het.
+			y - the value to filter on if the variant is on the Y chromosome.
+			mt - teh value to filter on if the variant is on the Mitochondrial chromosome.
+			zero_values - list of values which should be considered as 0 in the annotation.
+			agg_func - how to aggregate multiple values - min, max, mean
+			compound_het_dict - A dictionary of variants which are compound hets.
 
-			if annotation >= mt:
+		Returns:
 
-				return True
+			True - if the variant has a value above the supplied value
+			False - otherwise.
 
-			else:
+		"""
 
-				return False
 
-		else:
+		annotation = self.get_numerical_transcript_annotation(annotation_key, zero_values, agg_func)
 
-			raise ValueError('Variant does not have a a recognised workflow - is the proband homozygous reference?')
+		threshold = self.get_filter_threshold(ad_het, ad_hom_alt, x_male, x_female_het, x_female_hom, compound_het, y, mt, compound_het_dict)
+
+		return annotation >= threshold
 
 	def filter_on_numerical_info_annotation_gte(self,
 													 annotation_key,
@@ -1610,94 +1622,10 @@ class Variant:
 
 
 			annotation = self.get_numerical_info_annotation(annotation_key, zero_values, agg_func)
-			proband = self.family.get_proband()
-			proband_id = proband.get_id()
-
-
-			if self.variant_id in compound_het_dict:
-
-				if annotation >= compound_het:
-
-						return True
-
-				else:
-
-					return False
-
-
-			if self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_het(proband_id):
-
-				if annotation >= ad_het:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_hom_alt(proband_id):
-
-				if annotation >= ad_hom_alt:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom == 'X' and proband.sex == 1 and self.has_alt(proband_id):
-
-				if annotation >= x_male:
-
-					return True
-
-				else:
-
-					return False	
-
-			elif self.chrom == 'X' and proband.sex == 2 and self.is_het(proband_id):
 
-				if annotation >= x_female_het:
+			threshold = self.get_filter_threshold(ad_het, ad_hom_alt, x_male, x_female_het, x_female_hom, compound_het, y, mt, compound_het_dict)
 
-					return True
-
-				else:
-
-					return False	
-
-			elif self.chrom == 'X' and proband.sex == 2 and self.is_hom_alt(proband_id):
-
-				if annotation >= x_female_hom:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom =='Y':
-
-				if annotation >= y:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom =='MT' or self.chrom =='M':
-
-				if annotation >= mt:
-
-					return True
-
-				else:
-
-					return False
-
-			else:
-
-				raise ValueError('Variant does not have a a recognised workflow - is the proband homozygous reference?')
+			return annotation >= threshold
 
 	def filter_on_numerical_transcript_annotation_lte(self,
 												 annotation_key,
@@ -1744,92 +1672,10 @@ class Variant:
 
 
 		annotation = self.get_numerical_transcript_annotation(annotation_key, zero_values, agg_func)
-		proband = self.family.get_proband()
-		proband_id = proband.get_id()
-
-		if self.variant_id in compound_het_dict:
-
-			if annotation <= compound_het:
-
-				return True
-
-			else:
-
-				return False
-
-		elif self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_het(proband_id):
-
-			if annotation <= ad_het:
-
-				return True
-
-			else:
-
-				return False
-
-		elif self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_hom_alt(proband_id):
-
-			if annotation <= ad_hom_alt:
-
-				return True
-
-			else:
-
-				return False
-
-		elif self.chrom == 'X' and proband.sex == 1 and self.has_alt(proband_id):
-
-			if annotation <= x_male:
-
-				return True
-
-			else:
-
-				return False	
-
-		elif self.chrom == 'X' and proband.sex == 2 and self.is_het(proband_id):
-
-			if annotation <= x_female_het:
-
-				return True
-
-			else:
-
-				return False	
-
-		elif self.chrom == 'X' and proband.sex == 2 and self.is_hom_alt(proband_id):
-
-			if annotation <= x_female_hom:
-
-				return True
 
-			else:
-
-				return False
-
-		elif self.chrom =='Y':
-
-			if annotation <= y:
+		threshold = self.get_filter_threshold(ad_het, ad_hom_alt, x_male, x_female_het, x_female_hom, compound_het, y, mt, compound_het_dict)
 
-				return True
-
-			else:
-
-				return False
-
-		elif self.chrom =='MT' or self.chrom == 'M':
-
-			if annotation <= mt:
-
-				return True
-
-			else:
-
-				return False
-
-		else:
-
-			raise ValueError('Variant does not have a a recognised workflow - is the proband homozygous reference?')
+		return annotation <= threshold
 
 
 	def filter_on_numerical_info_annotation_lte(self,
@@ -1877,92 +1723,10 @@ class Variant:
 
 
 			annotation = self.get_numerical_info_annotation(annotation_key, zero_values, agg_func)
-			proband = self.family.get_proband()
-			proband_id = proband.get_id()
-
-			if self.variant_id in compound_het_dict:
-
-				if annotation <= compound_het:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_het(proband_id):
-
-				if annotation <= ad_het:
-
-					return True
-
-				else:
-
-					return False
 
-			elif self.chrom not in ['X', 'Y', 'MT', 'M'] and self.is_hom_alt(proband_id):
+			threshold = self.get_filter_threshold(ad_het, ad_hom_alt, x_male, x_female_het, x_female_hom, compound_het, y, mt, compound_het_dict)
 
-				if annotation <= ad_hom_alt:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom == 'X' and proband.sex == 1 and self.has_alt(proband_id):
-
-				if annotation <= x_male:
-
-					return True
-
-				else:
-
-					return False	
-
-			elif self.chrom == 'X' and proband.sex == 2 and self.is_het(proband_id):
-
-				if annotation <= x_female_het:
-
-					return True
-
-				else:
-
-					return False	
-
-			elif self.chrom == 'X' and proband.sex == 2 and self.is_hom_alt(proband_id):
-
-				if annotation <= x_female_hom:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom =='Y':
-
-				if annotation <= y:
-
-					return True
-
-				else:
-
-					return False
-
-			elif self.chrom =='MT' or self.chrom == 'M':
-
-				if annotation <= mt:
-
-					return True
-
-				else:
-
-					return False
-
-			else:
-
-				raise ValueError('Variant does not have a a recognised workflow - is the proband homozygous reference?')
+			return annotation <= threshold
 
 
 	def matches_paternal_uniparental_ambiguous(self,  min_parental_gq=30, min_parental_depth=10):
@@ -2255,22 +2019,11 @@ class Variant:
 		Check all sample genotypes are not missing and have depths and gqs above the minimum.
 		"""
 
-		for sample_id in self.family.get_all_family_member_ids():
+		failed = self.get_low_quality_mask(min_dp, min_gq) | self.get_genotype_masks()['missing']
 
-			gq = self.get_genotype_quality(sample_id)
-			dp = self.get_depth(sample_id)
+		if self.family.get_role_masks()['all'] & failed:
 
-			if dp < min_dp:
-
-				return False
-
-			if gq < min_gq:
-
-				return False
-
-			if self.is_missing(sample_id) == True:
-
-				return False
+			return False
 
 		return True
 
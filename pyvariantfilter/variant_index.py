@@ -0,0 +1,310 @@
+from pyvariantfilter.utils import normalise_chrom
+import bisect
+
+
+class VariantIndex:
+	"""
+	A positional index over a set of variants. Each chromosome holds the variants sorted by position so that range,
+	nearest neighbour and window queries use a binary search rather than scanning every variant.
+
+	All positions are 1 based and inclusive to match Variant.pos e.g. a query of 2:100-200 includes variants
+	starting at 100 and 200. A variant covers the positions from pos to pos + len(ref) - 1.
+
+	starts: Dictionary with the chromosome as key and a sorted list of variant start positions as the value.
+	ends: Dictionary with the chromosome as key and a list of variant end positions in the same order as starts.
+	variant_ids: Dictionary with the chromosome as key and a list of variant_ids in the same order as starts.
+	max_length: Dictionary with the chromosome as key and the longest variant on the chromosome as the value.
+
+	"""
+
+	def __init__(self, variants=None):
+
+		self.starts = {}
+		self.ends = {}
+		self.variant_ids = {}
+		self.max_length = {}
+
+		if variants != None:
+
+			self.build(variants)
+
+	def __len__(self):
+
+		return sum(len(variant_ids) for variant_ids in self.variant_ids.values())
+
+	def build(self, variants):
+		"""
+		Build the index from scratch.
+
+		Input:
+
+			variants: An iterable of Variant objects.
+
+		Returns:
+
+			None
+
+		"""
+
+		by_chrom = {}
+
+		for variant in variants:
+
+			by_chrom.setdefault(variant.chrom, []).append((variant.pos, variant.pos + len(variant.ref) - 1, variant.variant_id))
+
+		self.starts = {}
+		self.ends = {}
+		self.variant_ids = {}
+		self.max_length = {}
+
+		for chrom in by_chrom:
+
+			entries = sorted(by_chrom[chrom])
+
+			self.starts[chrom] = [entry[0] for entry in entries]
+			self.ends[chrom] = [entry[1] for entry in entries]
+			self.variant_ids[chrom] = [entry[2] for entry in entries]
+			self.max_length[chrom] = max(entry[1] - entry[0] + 1 for entry in entries)
+
+	def add_variant(self, variant):
+		"""
+		Insert a variant keeping the chromosome sorted by position.
+
+		Input:
+
+			variant: (Variant) The variant to add.
+
+		Returns:
+
+			None
+
+		"""
+
+		chrom = variant.chrom
+		end = variant.pos + len(variant.ref) - 1
+
+		if chrom not in self.starts:
+
+			self.starts[chrom] = []
+			self.ends[chrom] = []
+			self.variant_ids[chrom] = []
+			self.max_length[chrom] = 0
+
+		index = bisect.bisect_right(self.starts[chrom], variant.pos)
+
+		self.starts[chrom].insert(index, variant.pos)
+		self.ends[chrom].insert(index, end)
+		self.variant_ids[chrom].insert(index, variant.variant_id)
+
+		self.max_length[chrom] = max(self.max_length[chrom], end - variant.pos + 1)
+
+	def retain(self, variant_ids):
+		"""
+		Remove any variants which are not in variant_ids e.g. after filtering. The order is kept so no resorting is needed.
+
+		Input:
+
+			variant_ids: A dictionary or set of the variant_ids to keep.
+
+		Returns:
+
+			None
+
+		"""
+
+		for chrom in list(self.starts):
+
+			keep = [i for i, variant_id in enumerate(self.variant_ids[chrom]) if variant_id in variant_ids]
+
+			if len(keep) == len(self.variant_ids[chrom]):
+
+				continue
+
+			if not keep:
+
+				del self.starts[chrom]
+				del self.ends[chrom]
+				del self.variant_ids[chrom]
+				del self.max_length[chrom]
+
+				continue
+
+			self.starts[chrom] = [self.starts[chrom][i] for i in keep]
+			self.ends[chrom] = [self.ends[chrom][i] for i in keep]
+			self.variant_ids[chrom] = [self.variant_ids[chrom][i] for i in keep]
+
+	def get_chroms(self):
+		"""
+		Get the chromosomes in the index.
+
+		Input: Self
+
+		Returns:
+
+			chroms: (List) The chromosomes which have at least one variant.
+
+		"""
+
+		return list(self.starts)
+
+	def get_sorted_variant_ids(self, chrom):
+		"""
+		Get the variant_ids on a chromosome sorted by position.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+
+		Returns:
+
+			variant_ids: (List) The variant_ids sorted by position.
+
+		"""
+
+		return list(self.variant_ids.get(normalise_chrom(chrom), []))
+
+	def query(self, chrom, start, end):
+		"""
+		Get the variants which overlap a region.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+			start: (Integer) 1 based start of the region.
+			end: (Integer) 1 based inclusive end of the region.
+
+		Returns:
+
+			variant_ids: (List) The variant_ids of variants overlapping the region sorted by position.
+
+		"""
+
+		chrom = normalise_chrom(chrom)
+
+		if chrom not in self.starts:
+
+			return []
+
+		starts = self.starts[chrom]
+		ends = self.ends[chrom]
+
+		# A variant starting before the region can only overlap it if it is within max_length of the start.
+		low = bisect.bisect_left(starts, start - self.max_length[chrom] + 1)
+		high = bisect.bisect_right(starts, end)
+
+		return [self.variant_ids[chrom][i] for i in range(low, high) if ends[i] >= start]
+
+	def nearest(self, chrom, pos, n=1):
+		"""
+		Get the n variants whose start is closest to a position.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+			pos: (Integer) 1 based position.
+			n: (Integer) How many variants to return.
+
+		Returns:
+
+			variant_ids: (List) Up to n variant_ids ordered by distance from pos. Ties go to the upstream variant.
+
+		"""
+
+		chrom = normalise_chrom(chrom)
+
+		if chrom not in self.starts:
+
+			return []
+
+		starts = self.starts[chrom]
+
+		right = bisect.bisect_left(starts, pos)
+		left = right - 1
+
+		nearest = []
+
+		while len(nearest) < n and (left >= 0 or right < len(starts)):
+
+			if right >= len(starts) or (left >= 0 and pos - starts[left] <= starts[right] - pos):
+
+				nearest.append(self.variant_ids[chrom][left])
+				left = left - 1
+
+			else:
+
+				nearest.append(self.variant_ids[chrom][right])
+				right = right + 1
+
+		return nearest
+
+	def iter_windows(self, chrom, window_size, step=None, start=None, end=None):
+		"""
+		Iterate over fixed size windows along a chromosome in a single pass.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+			window_size: (Integer) The window size in bases.
+			step: (Integer) How far to move the window each time. Defaults to window_size i.e. non overlapping windows.
+			start: (Integer) 1 based position of the first window. Defaults to the first variant on the chromosome.
+			end: (Integer) Stop once a window starts after this position. Defaults to the last variant on the chromosome.
+
+		Returns:
+
+			Generator of (window_start, window_end, variant_ids) tuples where variant_ids are the variants starting within
+			the 1 based inclusive window.
+
+		"""
+
+		if window_size < 1:
+
+			raise ValueError('window_size must be at least 1.')
+
+		if step == None:
+
+			step = window_size
+
+		if step < 1:
+
+			raise ValueError('step must be at least 1.')
+
+		chrom = normalise_chrom(chrom)
+
+		if chrom not in self.starts:
+
+			return
+
+		starts = self.starts[chrom]
+
+		if start == None:
+
+			start = starts[0]
+
+		if end == None:
+
+			end = starts[-1]
+
+		low = bisect.bisect_left(starts, start)
+		high = low
+
+		window_start = start
+
+		while window_start <= end:
+
+			window_end = window_start + window_size - 1
+
+			while low < len(starts) and starts[low] < window_start:
+
+				low = low + 1
+
+			if high < low:
+
+				high = low
+
+			while high < len(starts) and starts[high] <= window_end:
+
+				high = high + 1
+
+			yield window_start, window_end, self.variant_ids[chrom][low:high]
+
+			window_start = window_start + step
@@ -1,10 +1,22 @@
-from pyvariantfilter.variant import Variant
+from pyvariantfilter.variant import Variant, VALID_CHROMS, FILTER_CONTEXTS
 from pyvariantfilter.family import Family
-from pyvariantfilter.utils import parse_csq_field, get_info_field_dict, compound_het_pair_pass_filter
+from pyvariantfilter.utils import parse_csq_field, get_info_field_dict, compound_het_pair_pass_filter, get_valid_contigs, check_vcf_samples, get_regions
+from pyvariantfilter.utils import get_split_info_field_dict, trim_alleles, split_transcript_annotations
+from pyvariantfilter.stats import StageStats, VariantSetStats, WarningCounter
+from pyvariantfilter.variant_index import VariantIndex
+from pyvariantfilter.upd import call_upd_regions
+from pyvariantfilter.export import get_normalised_columns, iter_normalised_rows, write_sqlite, write_parquet
+from pyvariantfilter.storage import SQLiteVariantStore
+from pyvariantfilter.genotype_matrix import GenotypeMatrix
+from pyvariantfilter.ranking import get_ranking_features, select_top_k, default_score
 from pysam import VariantFile
 import itertools
+import logging
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
 class VariantSet:
 	"""
 	A VariantSet object allows multiple variants within a single family to be associated with each other.
@@ -17,6 +29,12 @@ class VariantSet:
 		self.variant_dict = {}
 		self.final_compound_hets = {}
 		self.family = None
+		self.stats = None
+		self.variant_index = None
+		self.inheritance_cache = {}
+		self.inheritance_cache_compound_hets = None
+		self.storage = None
+		self.gene_scores = {}
 
 	def add_family(self, family):
 		"""
@@ -35,7 +53,220 @@ class VariantSet:
 		assert isinstance(family, Family)
 		assert bool(self.variant_dict) == False
 		self.family = family
-	
+
+	def use_sqlite_storage(self, db_path, feature_keys=['Feature', 'SYMBOL', 'Gene'], batch_size=1000, cache_size=10000):
+		"""
+		Store the variants in a SQLite database rather than in memory. Call after add_family() and before reading any
+		variants. Opening an existing database reloads the variants it contains e.g. for reviewing a previous run.
+
+		The compound het grouping becomes an indexed query when the feature_key is one of feature_keys and
+		filter_variants() deletes from the database in place.
+
+		Input:
+
+			db_path: (String) Path to the SQLite database.
+			feature_keys: (List) The transcript annotation keys to index for compound het grouping.
+			batch_size: (Integer) How many variants to load at a time when iterating.
+			cache_size: (Integer) How many loaded variants to keep in memory so their cached genotype masks and results are reused.
+
+		Returns:
+
+			None - self.variant_dict becomes a SQLiteVariantStore
+
+		"""
+
+		assert isinstance(self.family, Family)
+		assert len(self.variant_dict) == 0
+
+		self.storage = SQLiteVariantStore(db_path, self.family, feature_keys=feature_keys, batch_size=batch_size, cache_size=cache_size)
+		self.variant_dict = self.storage
+
+	def _commit_storage(self):
+		"""
+		Commit pending writes if the variants are stored in SQLite.
+		"""
+
+		if self.storage != None:
+
+			self.storage.commit()
+
+	def enable_stats(self, log_json=False):
+		"""
+		Turn on per stage timing and counters. After this each stage (ingest, candidate_compound_hets,
+		filter_compound_hets, filter_variants and export) adds a StageStats object to self.stats.
+
+		Input:
+
+			log_json: (Boolean) Also log each finished stage as a JSON line using the pyvariantfilter.stats logger.
+
+		Returns:
+
+			None - creates self.stats
+
+		"""
+
+		family_id = None
+
+		if self.family != None:
+
+			family_id = self.family.family_id
+
+		self.stats = VariantSetStats(family_id=family_id, log_json=log_json)
+
+	def _finish_stage(self, stage):
+		"""
+		Stop the timer on a stage and add it to self.stats if stats are enabled.
+
+		Input:
+
+			stage: (StageStats) The stage to finish.
+
+		Returns:
+
+			None
+
+		"""
+
+		stage.stop()
+
+		if self.stats != None:
+
+			self.stats.add_stage(stage)
+
+	def _fetch_records(self, bcf_in, stage, warning_counter, regions=None):
+		"""
+		Yield the records on valid chromosomes from an open VCF.
+
+		The accepted contigs are resolved once from the VCF header (and index) with any chr prefix removed. If the VCF
+		is indexed then only the accepted contigs are fetched so records on decoy, HLA or alt contigs are never parsed
+		into variants. Otherwise the contig of each record is looked up in the resolved contigs.
+
+		Invalid contigs in the header are only logged at debug level as a GRCh38 header has thousands of them. Each
+		record on an invalid contig is rejected as invalid_chrom and counted by the warning_counter. For an indexed VCF
+		the records of the invalid contigs in the index are counted with a fetch but not yielded.
+
+		If regions are given then only those regions are fetched using the index.
+
+		Input:
+
+			bcf_in: (VariantFile) An open pysam VariantFile.
+			stage: (StageStats) The stage to record counts on.
+			warning_counter: (WarningCounter) Used to aggregate invalid chromosome warnings.
+			regions: (Dict) Merged regions from utils.get_regions() or None to read the whole VCF.
+
+		Returns:
+
+			Generator of (chrom, rec) tuples where chrom is the normalised chromosome e.g. 1 rather than chr1.
+
+		"""
+
+		contigs = list(bcf_in.header.contigs)
+
+		if bcf_in.index != None:
+
+			contigs = contigs + [contig for contig in bcf_in.index if contig not in bcf_in.header.contigs]
+
+		valid_contigs, invalid_contigs = get_valid_contigs(contigs, VALID_CHROMS)
+
+		if invalid_contigs:
+
+			logger.debug(f'{len(invalid_contigs)} contigs are not valid chromosomes and will be skipped: {invalid_contigs}')
+
+		def reject_invalid_chrom(contig):
+
+			stage.reject('invalid_chrom')
+
+			warning_counter.warn('invalid_chrom', contig, f'{contig} is not a valid chromosome. Not entered into variant set.')
+
+		if regions != None:
+
+			if bcf_in.index == None:
+
+				raise ValueError('An indexed VCF is required to load regions.')
+
+			for contig in valid_contigs:
+
+				chrom = valid_contigs[contig]
+
+				if contig not in bcf_in.index or chrom not in regions:
+
+					continue
+
+				previous_end = None
+
+				for start, end in regions[chrom]:
+
+					for rec in bcf_in.fetch(contig, start, end):
+
+						# Records spanning two regions were already read with the previous region.
+						if previous_end != None and rec.start < previous_end:
+
+							continue
+
+						stage.records_read += 1
+
+						yield chrom, rec
+
+					previous_end = end
+
+		elif bcf_in.index != None:
+
+			stage.contigs_skipped.extend(invalid_contigs)
+
+			for contig in valid_contigs:
+
+				if contig not in bcf_in.index:
+
+					continue
+
+				chrom = valid_contigs[contig]
+
+				for rec in bcf_in.fetch(contig):
+
+					stage.records_read += 1
+
+					yield chrom, rec
+
+			for contig in invalid_contigs:
+
+				if contig not in bcf_in.index:
+
+					continue
+
+				for rec in bcf_in.fetch(contig):
+
+					stage.records_read += 1
+
+					reject_invalid_chrom(contig)
+
+		else:
+
+			invalid_contigs = set(invalid_contigs)
+
+			for rec in bcf_in.fetch():
+
+				stage.records_read += 1
+
+				chrom = valid_contigs.get(rec.chrom)
+
+				# Contig missing from the header so resolve it the first time it is seen.
+				if chrom == None and rec.chrom not in invalid_contigs:
+
+					new_valid_contigs, new_invalid_contigs = get_valid_contigs([rec.chrom], VALID_CHROMS)
+
+					valid_contigs.update(new_valid_contigs)
+					invalid_contigs.update(new_invalid_contigs)
+
+					chrom = valid_contigs.get(rec.chrom)
+
+				if chrom == None:
+
+					reject_invalid_chrom(rec.chrom)
+
+					continue
+
+				yield chrom, rec
+
 	def add_variant(self, variant):
 		"""
 		Add a variant to a VariantSet.
@@ -52,8 +283,58 @@ class VariantSet:
 		
 			self.variant_dict[variant.variant_id] = variant
 
+			if self.variant_index != None:
+
+				self.variant_index.add_variant(variant)
+
+
+	def _split_record(self, rec, transcript_annotations, info_numbers, vep_csq_key='CSQ'):
+		"""
+		Split a VCF record into one set of alleles and annotations per alt allele so that multi-allelic records do not
+		need to be decomposed before reading. Biallelic records are returned unchanged.
+
+		Input:
+
+			rec: (VariantRecord) The pysam record.
+			transcript_annotations: (List) The parsed CSQ field of the record or None.
+			info_numbers: (Dict) The Number of each INFO field in the VCF header.
+			vep_csq_key: (String) The key of the CSQ field in the VCF INFO section.
+
+		Returns:
+
+			List of (allele_number, pos, ref, alt, transcript_annotations, info_dict) tuples. allele_number is the
+			index of the alt in the record starting from 1 and is used to pick the GT and AD values.
+
+		"""
+
+		alts = rec.alts
 
-	def read_variants_from_vcf(self, vcf_file, parse_csq=True, vep_csq_key='CSQ', proband_variants_only=True, filter_func=None, args=None):
+		if len(alts) == 1:
+
+			return [(1, rec.pos, rec.ref, alts[0], transcript_annotations, get_info_field_dict(rec.info, vep_csq_key))]
+
+		split_alleles = []
+
+		for allele_number, alt in enumerate(alts, start=1):
+
+			pos, ref, trimmed_alt = trim_alleles(rec.pos, rec.ref, alt)
+
+			allele_transcripts = transcript_annotations
+
+			if transcript_annotations != None:
+
+				allele_transcripts = split_transcript_annotations(transcript_annotations, rec.ref, alts, allele_number)
+
+			split_alleles.append((allele_number,
+								  pos,
+								  ref,
+								  trimmed_alt,
+								  allele_transcripts,
+								  get_split_info_field_dict(rec.info, info_numbers, allele_number, vep_csq_key)))
+
+		return split_alleles
+
+	def read_variants_from_vcf(self, vcf_file, parse_csq=True, vep_csq_key='CSQ', proband_variants_only=True, filter_func=None, args=None, regions=None, genes=None, gene_bed=None):
 		"""
 		Read variants from a standard VCF. Must have AD,GQ and DP fields in the Format section for each sample.
 
@@ -64,6 +345,9 @@ class VariantSet:
 			vep_csq_key: (String) The key of the CSQ field in the VCF INFO section.
 			proband_variants_only (Boolean) Only load variants which the proband has an alt allele.
 			import_filtered (Boolean) Whether to import variants which fail the VCF Filter
+			regions: (String or List) Only load variants in these regions. Either a BED file path or a list of (chrom, start, end) tuples with a 0 based start and exclusive end. Requires an indexed VCF.
+			genes: (List) Only load variants within these gene symbols e.g. a virtual gene panel. Requires gene_bed and an indexed VCF.
+			gene_bed: (String) BED file with the gene symbol in the fourth column used to look up the genes argument.
 
 		Returns:
 
@@ -71,15 +355,11 @@ class VariantSet:
 
 		"""
 
-		valid_chroms = {'1': None, '2': None, '3': None, '4': None,
-		 '5': None, '6': None, '7': None, '8': None, '9': None,
-		 '10': None, '11': None, '12': None, '13': None,
-		 '14': None, '15': None, '16': None, '17': None,
-		 '18': None, '19': None, '20': None, '21': None,
-		 '22': None, 'X': None, 'Y': None, 'MT': None, 'M': None}
-
 		assert self.family != None
 
+		stage = StageStats('ingest')
+		warning_counter = WarningCounter(logger)
+
 		family_member_ids = self.family.get_all_family_member_ids()
 
 		if proband_variants_only == True:
@@ -88,6 +368,15 @@ class VariantSet:
 
 		bcf_in = VariantFile(vcf_file)
 
+		load_regions = None
+
+		if regions != None or genes != None:
+
+			load_regions = get_regions(regions=regions, genes=genes, gene_bed=gene_bed)
+
+		# Genotypes are added without per sample checks so check the samples once for the whole file.
+		check_vcf_samples(bcf_in.header, family_member_ids)
+
 		if parse_csq == True:
 
 			csq_fields = str(bcf_in.header.info[vep_csq_key].record)
@@ -98,130 +387,140 @@ class VariantSet:
 
 			csq_fields = csq_fields[index:len(csq_fields)-2].split('|')
 
-		for rec in bcf_in.fetch():
-			
-			chrom = rec.chrom
-			pos = rec.pos
-			ref = rec.ref
-			alt = rec.alts
+		info_numbers = {key: bcf_in.header.info[key].number for key in bcf_in.header.info}
+
+		transcript_annotations = None
+
+		for chrom, rec in self._fetch_records(bcf_in, stage, warning_counter, regions=load_regions):
+
 			filter_status = rec.filter.keys()
-			info = rec.info
 			quality = rec.qual
 
-			if 'chr' in chrom:
+			# Star alleles are skipped below and do not have a CSQ annotation.
+			if parse_csq == True and set(rec.alts) != {'*'}:
 
-				chrom = chrom.strip('chr')
+				csq = rec.info[vep_csq_key]
 
-			# Chromosome is correct
-			if chrom not in valid_chroms:
+				transcript_annotations = parse_csq_field(csq, csq_fields)
 
-				print (f'{chrom} is not a valid chromosome. Not entered into variant set.')
+				stage.transcripts_parsed += len(transcript_annotations)
 
-				continue
+			n_alleles = len(rec.alts) + 1
 
-			info_dict = get_info_field_dict(info, vep_csq_key)
+			for allele_number, pos, ref, alt, allele_transcripts, info_dict in self._split_record(rec, transcript_annotations, info_numbers, vep_csq_key):
 
-			assert len(alt) == 1
+				if alt == '*':
 
-			alt = alt[0]
+					stage.reject('star_alt')
 
-			if alt == '*':
-				continue
+					continue
 
-			if parse_csq == True:
+				new_variant = Variant(chrom=chrom, pos=pos, ref=ref, alt=alt, filter_status=filter_status, quality=quality, validate=False)
+				new_variant.add_family(self.family)
+				new_variant.add_transcript_annotations(allele_transcripts)
+				new_variant.add_info_annotations(info_dict)
 
-				csq = rec.info[vep_csq_key]
+				# Alleles from the other alts of a multi-allelic record become missing.
+				allele_map = {0: ref, allele_number: alt}
 
-				transcript_annotations = parse_csq_field(csq, csq_fields)
+				genotypes = {}
 
-			new_variant = Variant(chrom=chrom, pos=pos, ref=ref, alt=alt, filter_status=filter_status, quality=quality)
-			new_variant.add_family(self.family)
-			new_variant.add_transcript_annotations(transcript_annotations)
-			new_variant.add_info_annotations(info_dict)
+				for family_member_id in family_member_ids:
 
-			for family_member_id in family_member_ids:
+					sample_genotype_data = rec.samples[family_member_id]
 
-				sample_genotype_data = rec.samples[family_member_id]
-				
-				ref_and_alt = [ref, alt]
-				
-				gts =[]
-				ads =[]
-				
-				for allele in sample_genotype_data['GT']:
-					
-					if allele == None:
-						
-						gts.append('.')
-						
-					else:
-						
-						gts.append(ref_and_alt[allele])
+					gts =[]
+					ads =[]
+
+					for allele in sample_genotype_data['GT']:
 
-				if gts[0] == '.' and gts[1] == '.':
+						if allele == None:
 
-						ads.append(0)
-						ads.append(0)
+							gts.append('.')
 
-				elif len(sample_genotype_data['AD']) == 1 and sample_genotype_data['AD'][0] == None:
+						else:
 
-						ads.append(0)
-						ads.append(0)
+							gts.append(allele_map.get(allele, '.'))
 
-				else:
+					if gts[0] == '.' and gts[1] == '.':
+
+							ads.append(0)
+							ads.append(0)
 
-					assert len(sample_genotype_data['AD']) ==2
+					elif len(sample_genotype_data['AD']) == 1 and sample_genotype_data['AD'][0] == None:
 
-					for ad in sample_genotype_data['AD']:
-					
-						if ad == None:
-						
 							ads.append(0)
-						
-						else:
-						
-							ads.append(ad)
-				try:
+							ads.append(0)
 
-					gq = sample_genotype_data['GQ']
+					else:
 
-				except:
+						assert len(sample_genotype_data['AD']) == n_alleles
 
-					print (f'Warning No GQ for variant {new_variant.variant_id}. This could cause filtering errors.')
-					# set to high so we don't accidently filter out
-					gq = 100
+						for ad in [sample_genotype_data['AD'][0], sample_genotype_data['AD'][allele_number]]:
 
-				if gq == None:
+							if ad == None:
 
-					gq = 0
+								ads.append(0)
 
-				dp = sample_genotype_data['DP']
+							else:
 
-				if dp == None:
+								ads.append(ad)
+					try:
 
-					dp  = 0
-				
-				new_variant.add_genotype(family_member_id, gts, ads, gq, dp)
+						gq = sample_genotype_data['GQ']
 
-			passes_filter = True
+					except:
 
-			if filter_func != None and args != None:
+						warning_counter.warn('missing_gq', family_member_id, f'Warning No GQ for variant {new_variant.variant_id}. This could cause filtering errors.')
+						# set to high so we don't accidently filter out
+						gq = 100
 
-				passes_filter = filter_func(new_variant, *args)
+					if gq == None:
 
-				assert passes_filter == True or passes_filter == False
+						gq = 0
 
-			if proband_variants_only == True:
+					dp = sample_genotype_data['DP']
+
+					if dp == None:
+
+						dp  = 0
+
+					genotypes[family_member_id] = {'genotype': gts,
+												'allele_depths': ads,
+												'genotype_quality': gq,
+												'depth': dp}
 
-				if new_variant.has_alt(proband_id) == True and passes_filter == True:
+				new_variant.add_genotypes_bulk(genotypes)
+
+				passes_filter = True
+
+				if filter_func != None and args != None:
+
+					passes_filter = filter_func(new_variant, *args)
+
+					assert passes_filter == True or passes_filter == False
+
+				if passes_filter == False:
+
+					stage.reject('filter_func')
+
+				elif proband_variants_only == True and new_variant.has_alt(proband_id) == False:
+
+					stage.reject('proband_no_alt')
+
+				else:
 
 					self.add_variant(new_variant)
 
-			elif passes_filter == True:
+					stage.variants_kept += 1
 
-				self.add_variant(new_variant)
+		warning_counter.log_summary()
+
+		self._commit_storage()
 
-	def read_variants_from_platypus_vcf(self, vcf_file, parse_csq=True, vep_csq_key='CSQ', proband_variants_only=True, filter_func=None, args=None):
+		self._finish_stage(stage)
+
+	def read_variants_from_platypus_vcf(self, vcf_file, parse_csq=True, vep_csq_key='CSQ', proband_variants_only=True, filter_func=None, args=None, regions=None, genes=None, gene_bed=None):
 		"""
 		Read variants from a platypus VCF. Must have NR, NV and GQ fields in the Format section for each sample.
 
@@ -232,21 +531,20 @@ class VariantSet:
 			vep_csq_key: (String) The key of the CSQ field in the VCF INFO section.
 			proband_variants_only (Boolean) Only load variants which the proband has an alt allele.
 			import_filtered (Boolean) Whether to import variants which fail the VCF Filter
+			regions: (String or List) Only load variants in these regions. Either a BED file path or a list of (chrom, start, end) tuples with a 0 based start and exclusive end. Requires an indexed VCF.
+			genes: (List) Only load variants within these gene symbols e.g. a virtual gene panel. Requires gene_bed and an indexed VCF.
+			gene_bed: (String) BED file with the gene symbol in the fourth column used to look up the genes argument.
 
 		Returns:
 
 			None - loads variants into self.variant_dict
 
 		"""
-		valid_chroms = {'1': None, '2': None, '3': None, '4': None,
-		 '5': None, '6': None, '7': None, '8': None, '9': None,
-		 '10': None, '11': None, '12': None, '13': None,
-		 '14': None, '15': None, '16': None, '17': None,
-		 '18': None, '19': None, '20': None, '21': None,
-		 '22': None, 'X': None, 'Y': None, 'MT': None, 'M': None}
-
 		assert self.family != None
 
+		stage = StageStats('ingest')
+		warning_counter = WarningCounter(logger)
+
 		family_member_ids = self.family.get_all_family_member_ids()
 
 		if proband_variants_only == True:
@@ -255,6 +553,15 @@ class VariantSet:
 
 		bcf_in = VariantFile(vcf_file)
 
+		load_regions = None
+
+		if regions != None or genes != None:
+
+			load_regions = get_regions(regions=regions, genes=genes, gene_bed=gene_bed)
+
+		# Genotypes are added without per sample checks so check the samples once for the whole file.
+		check_vcf_samples(bcf_in.header, family_member_ids)
+
 		if parse_csq == True:
 
 			csq_fields = str(bcf_in.header.info[vep_csq_key].record)
@@ -265,151 +572,289 @@ class VariantSet:
 
 			csq_fields = csq_fields[index:len(csq_fields)-2].split('|')
 
-		for rec in bcf_in.fetch():
-			
-			chrom = rec.chrom
-			pos = rec.pos
-			ref = rec.ref
-			alt = rec.alts
+		info_numbers = {key: bcf_in.header.info[key].number for key in bcf_in.header.info}
+
+		transcript_annotations = None
+
+		for chrom, rec in self._fetch_records(bcf_in, stage, warning_counter, regions=load_regions):
+
 			filter_status = rec.filter.keys()
-			info = rec.info
 			quality = rec.qual
 
-			info_dict = get_info_field_dict(info, vep_csq_key)
+			# Star alleles are skipped below and do not have a CSQ annotation.
+			if parse_csq == True and set(rec.alts) != {'*'}:
 
-			if 'chr' in chrom:
+				csq = rec.info[vep_csq_key]
 
-				chrom = chrom.strip('chr')
+				transcript_annotations = parse_csq_field(csq, csq_fields)
 
-			# Chromosome is correct
-			if chrom not in valid_chroms:
+				stage.transcripts_parsed += len(transcript_annotations)
 
-				print (f'{chrom} is not a valid chromosome. Not entered into variant set.')
+			n_alts = len(rec.alts)
 
-				continue
-			
-			assert len(alt) == 1
+			for allele_number, pos, ref, alt, allele_transcripts, info_dict in self._split_record(rec, transcript_annotations, info_numbers, vep_csq_key):
 
-			alt = alt[0]
+				if alt == '*':
 
-			if alt == '*':
-				continue
+					stage.reject('star_alt')
 
-			if parse_csq == True:
+					continue
 
-				csq = rec.info[vep_csq_key]
+				new_variant = Variant(chrom=chrom, pos=pos, ref=ref, alt=alt, filter_status=filter_status, quality=quality, validate=False)
+				new_variant.add_family(self.family)
+				new_variant.add_transcript_annotations(allele_transcripts)
+				new_variant.add_info_annotations(info_dict)
 
-				transcript_annotations = parse_csq_field(csq, csq_fields)
+				# Alleles from the other alts of a multi-allelic record become missing.
+				allele_map = {0: ref, allele_number: alt}
 
-			new_variant = Variant(chrom=chrom, pos=pos, ref=ref, alt=alt, filter_status=filter_status, quality=quality)
-			new_variant.add_family(self.family)
-			new_variant.add_transcript_annotations(transcript_annotations)
-			new_variant.add_info_annotations(info_dict)
+				genotypes = {}
 
+				for family_member_id in family_member_ids:
 
-			for family_member_id in family_member_ids:
+					sample_genotype_data = rec.samples[family_member_id]
 
-				sample_genotype_data = rec.samples[family_member_id]
-				
-				ref_and_alt = [ref, alt]
-				
-				gts =[]
-				ads =[]
-				
-				for allele in sample_genotype_data['GT']:
-					
-					if allele == None:
-						
-						gts.append('.')
-						
-					else:
-						
-						gts.append(ref_and_alt[allele])
+					gts =[]
+					ads =[]
 
-				if gts[0] == '.' and gts[1] == '.':
+					for allele in sample_genotype_data['GT']:
 
-						ads.append(0)
-						ads.append(0)
+						if allele == None:
 
+							gts.append('.')
 
-				else:
+						else:
+
+							gts.append(allele_map.get(allele, '.'))
 
+					# Platypus gives NR and NV once per alt allele.
 					total_depth = sample_genotype_data['NR']
 					variant_depth = sample_genotype_data['NV']
 
-					assert len(total_depth) == 1
-					assert len(variant_depth) == 1
+					if gts[0] == '.' and gts[1] == '.':
+
+							ads.append(0)
+							ads.append(0)
+
+					else:
 
-					allele_depth_ref = total_depth[0] - variant_depth[0]
-					allele_depth_alt = variant_depth[0]
+						assert len(total_depth) == n_alts
+						assert len(variant_depth) == n_alts
 
+						allele_depth_ref = total_depth[allele_number - 1] - variant_depth[allele_number - 1]
+						allele_depth_alt = variant_depth[allele_number - 1]
 
-					ads.append(allele_depth_ref)
-					ads.append(allele_depth_alt)
+						ads.append(allele_depth_ref)
+						ads.append(allele_depth_alt)
 
-				gq = sample_genotype_data['GQ'][0]
+					gq = sample_genotype_data['GQ'][0]
 
-				if gq == None:
+					if gq == None:
 
-					gq = 0
+						gq = 0
 
-				dp = sample_genotype_data['NR'][0]
+					dp = total_depth[allele_number - 1]
 
-				if dp == None:
+					if dp == None:
 
-					dp  = 0
+						dp  = 0
 
-				
-				new_variant.add_genotype(family_member_id, gts, ads, gq, dp)
+					genotypes[family_member_id] = {'genotype': gts,
+												'allele_depths': ads,
+												'genotype_quality': gq,
+												'depth': dp}
 
-			passes_filter = True
+				new_variant.add_genotypes_bulk(genotypes)
 
-			if filter_func != None and args != None:
+				passes_filter = True
 
-				passes_filter = filter_func(new_variant, *args)
+				if filter_func != None and args != None:
 
-				assert passes_filter == True or passes_filter == False
+					passes_filter = filter_func(new_variant, *args)
 
+					assert passes_filter == True or passes_filter == False
 
-			if proband_variants_only == True:
+				if passes_filter == False:
+
+					stage.reject('filter_func')
+
+				elif proband_variants_only == True and new_variant.has_alt(proband_id) == False:
+
+					stage.reject('proband_no_alt')
 
-				if new_variant.has_alt(proband_id) == True and passes_filter == True:
+				else:
 
 					self.add_variant(new_variant)
 
-			elif passes_filter == True:
+					stage.variants_kept += 1
 
-				self.add_variant(new_variant)
+		warning_counter.log_summary()
+
+		self._commit_storage()
+
+		self._finish_stage(stage)
 	
 				
-	def get_candidate_compound_hets(self, feature_key='Feature', consequences={'transcript_ablation': None,
-													'splice_acceptor_variant': None,
-													'splice_donor_variant': None,
-													'stop_gained': None,
-													'frameshift_variant': None,
-													'stop_lost': None,
-													'start_lost': None,
-													'transcript_amplification': None,
-													'inframe_insertion': None,
-													'inframe_deletion': None,
-													'missense_variant': None,
-													'protein_altering_variant': None,
-													'splice_region_variant': None,
-													'incomplete_terminal_codon_variant': None,
-													'start_retained_variant': None,
-													'stop_retained_variant': None,
-													'synonymous_variant': None,
-													'coding_sequence_variant': None,
-													'mature_miRNA_variant': None,
-													'5_prime_UTR_variant': None,
-													'3_prime_UTR_variant': None,
-													'non_coding_transcript_exon_variant': None,
-													'intron_variant': None,
-													'NMD_transcript_variant': None,
-													'non_coding_transcript_variant': None,
-													'upstream_gene_variant': None,
-													'downstream_gene_variant': None,
-													'TFBS_ablation': None,
+	def read_variants_from_genotype_matrix(self, genotype_matrix, parse_csq=True, proband_variants_only=True, filter_func=None, args=None, regions=None, genes=None, gene_bed=None, chunk_size=10000, check_vcf=True):
+		"""
+		Read variants from a memory mapped genotype matrix created with genotype_matrix.build_genotype_matrix() rather
+		than decoding the VCF again. Only the columns of the family members are read.
+
+		When proband_variants_only is True the sites where the proband has no alt allele are removed using the
+		arrays before any Variant objects are created so they are counted as proband_no_alt even if they would
+		also fail filter_func.
+
+		Input:
+
+			genotype_matrix: (GenotypeMatrix or String) The matrix or the directory it was written to.
+			parse_csq: (Boolean) Whether to parse the CSQ field. The matrix must have been built with parse_csq=True.
+			proband_variants_only (Boolean) Only load variants which the proband has an alt allele.
+			filter_func: (function) A function taking a Variant and the args which returns True to keep the variant.
+			args: (Tuple) Additional arguments to filter_func.
+			regions: (String or List) Only load variants in these regions. Either a BED file path or a list of (chrom, start, end) tuples with a 0 based start and exclusive end.
+			genes: (List) Only load variants within these gene symbols e.g. a virtual gene panel. Requires gene_bed.
+			gene_bed: (String) BED file with the gene symbol in the fourth column used to look up the genes argument.
+			chunk_size: (Integer) How many sites to read from the arrays at a time.
+			check_vcf: (Boolean) Raise a ValueError if the VCF the matrix was built from has changed since.
+
+		Returns:
+
+			None - loads variants into self.variant_dict
+
+		"""
+
+		assert self.family != None
+
+		stage = StageStats('ingest')
+
+		if isinstance(genotype_matrix, str):
+
+			genotype_matrix = GenotypeMatrix(genotype_matrix)
+
+		if check_vcf == True:
+
+			genotype_matrix.check_vcf()
+
+		if parse_csq == True and genotype_matrix.csq_fields == None:
+
+			raise ValueError('The genotype matrix was built without the CSQ field.')
+
+		family_member_ids = self.family.get_all_family_member_ids()
+
+		sample_indices = genotype_matrix.get_sample_indices(family_member_ids)
+
+		load_regions = None
+
+		if regions != None or genes != None:
+
+			load_regions = get_regions(regions=regions, genes=genes, gene_bed=gene_bed)
+
+		rows = np.arange(genotype_matrix.n_sites)[genotype_matrix.get_rows(load_regions)]
+
+		stage.records_read = len(rows)
+
+		for chunk_start in range(0, len(rows), chunk_size):
+
+			chunk_rows = rows[chunk_start:chunk_start + chunk_size]
+
+			gt = genotype_matrix.get_block('gt', chunk_rows, sample_indices)
+
+			if proband_variants_only == True:
+
+				proband_index = family_member_ids.index(self.family.get_proband_id())
+
+				proband_has_alt = (gt[:, proband_index, :] == 1).any(axis=1)
+
+				proband_no_alt = int((~proband_has_alt).sum())
+
+				if proband_no_alt > 0:
+
+					stage.records_rejected['proband_no_alt'] = stage.records_rejected.get('proband_no_alt', 0) + proband_no_alt
+
+				chunk_rows = chunk_rows[proband_has_alt]
+				gt = gt[proband_has_alt]
+
+			ad = genotype_matrix.get_block('ad', chunk_rows, sample_indices).tolist()
+			dp = genotype_matrix.get_block('dp', chunk_rows, sample_indices).tolist()
+			gq = genotype_matrix.get_block('gq', chunk_rows, sample_indices).tolist()
+			gt = gt.tolist()
+
+			for i, site in enumerate(genotype_matrix.iter_sites(chunk_rows)):
+
+				new_variant = Variant(chrom=site['chrom'], pos=site['pos'], ref=site['ref'], alt=site['alt'], filter_status=site['filter_status'], quality=site['quality'], validate=False)
+				new_variant.add_family(self.family)
+
+				if parse_csq == True:
+
+					transcript_annotations = parse_csq_field(site['csq'], genotype_matrix.csq_fields)
+
+					stage.transcripts_parsed += len(transcript_annotations)
+
+					new_variant.add_transcript_annotations(transcript_annotations)
+
+				new_variant.add_info_annotations(site['info'])
+
+				alleles = [site['ref'], site['alt']]
+
+				genotypes = {}
+
+				for j, family_member_id in enumerate(family_member_ids):
+
+					genotypes[family_member_id] = {'genotype': ['.' if allele == -1 else alleles[allele] for allele in gt[i][j]],
+												   'allele_depths': ad[i][j],
+												   'genotype_quality': gq[i][j],
+												   'depth': dp[i][j]}
+
+				new_variant.add_genotypes_bulk(genotypes)
+
+				if filter_func != None and args != None:
+
+					passes_filter = filter_func(new_variant, *args)
+
+					assert passes_filter == True or passes_filter == False
+
+					if passes_filter == False:
+
+						stage.reject('filter_func')
+
+						continue
+
+				self.add_variant(new_variant)
+
+				stage.variants_kept += 1
+
+		self._commit_storage()
+
+		self._finish_stage(stage)
+
+	def get_candidate_compound_hets(self, feature_key='Feature', consequences={'transcript_ablation': None,
+													'splice_acceptor_variant': None,
+													'splice_donor_variant': None,
+													'stop_gained': None,
+													'frameshift_variant': None,
+													'stop_lost': None,
+													'start_lost': None,
+													'transcript_amplification': None,
+													'inframe_insertion': None,
+													'inframe_deletion': None,
+													'missense_variant': None,
+													'protein_altering_variant': None,
+													'splice_region_variant': None,
+													'incomplete_terminal_codon_variant': None,
+													'start_retained_variant': None,
+													'stop_retained_variant': None,
+													'synonymous_variant': None,
+													'coding_sequence_variant': None,
+													'mature_miRNA_variant': None,
+													'5_prime_UTR_variant': None,
+													'3_prime_UTR_variant': None,
+													'non_coding_transcript_exon_variant': None,
+													'intron_variant': None,
+													'NMD_transcript_variant': None,
+													'non_coding_transcript_variant': None,
+													'upstream_gene_variant': None,
+													'downstream_gene_variant': None,
+													'TFBS_ablation': None,
 													'TFBS_amplification': None,
 													'TF_binding_site_variant': None,
 													'regulatory_region_ablation': None,
@@ -441,17 +886,33 @@ class VariantSet:
 
 		assert isinstance(self.family, Family)
 
+		stage = StageStats('candidate_compound_hets')
+
 		self.candidate_compound_het_dict = {}
 
 		proband = self.family.get_proband()
+
+		if self.storage != None and feature_key in self.storage.feature_keys:
+
+			self.candidate_compound_het_dict, stage.variants_kept = self.storage.get_candidate_compound_hets(feature_key, consequences)
+
+			stage.records_read = len(self.variant_dict)
+
+			self._finish_stage(stage)
+
+			return
 				
 		for variant in self.variant_dict:
+
+			stage.records_read += 1
 			
 			if (self.variant_dict[variant].is_on_autosome_or_xfemale() and
 				self.variant_dict[variant].is_het(proband.get_id()) and 
 				self.variant_dict[variant].get_worst_consequence() in consequences):
 
 				if self.variant_dict[variant].is_hom_alt_in_unaffected() == False:
+
+					stage.variants_kept += 1
 			
 					for gene in self.variant_dict[variant].get_genes(feature_key=feature_key):
 
@@ -463,6 +924,8 @@ class VariantSet:
 
 							self.candidate_compound_het_dict[gene].append(self.variant_dict[variant])
 
+		self._finish_stage(stage)
+
 
 	def get_unfiltered_compound_hets_as_dict(self):
 		"""
@@ -480,6 +943,7 @@ class VariantSet:
 		assert self.candidate_compound_het_dict != False
 
 		self.final_compound_hets = {}
+		self.clear_inheritance_cache()
 
 		for gene in self.candidate_compound_het_dict:
 
@@ -509,6 +973,8 @@ class VariantSet:
 
 		"""
 
+		stage = StageStats('filter_compound_hets')
+
 		self.filtered_compound_het_dict = {}
 	
 		proband = self.family.get_proband()
@@ -531,6 +997,8 @@ class VariantSet:
 				# Loop Through each pair
 				for pair in all_combinations:
 
+					stage.pairs_evaluated += 1
+
 					if compound_het_pair_pass_filter(pair,
 													 affected,
 													 unaffected,
@@ -539,6 +1007,8 @@ class VariantSet:
 													 include_denovo=include_denovo,
 													 allow_hets_in_unaffected=allow_hets_in_unaffected,
 													 check_affected=check_affected) == True:
+
+						stage.pairs_passed += 1
 						
 						if gene not in self.filtered_compound_het_dict:
 							
@@ -548,6 +1018,8 @@ class VariantSet:
 
 
 							self.filtered_compound_het_dict[gene].append(pair)
+
+		self._finish_stage(stage)
 						
 
 	def get_filtered_compound_hets_as_dict(self):
@@ -564,6 +1036,7 @@ class VariantSet:
 		"""
 
 		self.final_compound_hets = {}
+		self.clear_inheritance_cache()
 
 		assert self.filtered_compound_het_dict != False
 
@@ -591,8 +1064,472 @@ class VariantSet:
 
 		"""
 
-		self.variant_dict = {k : v for k,v in filter(lambda x: function(x[1], *args), self.variant_dict.items())}
+		stage = StageStats('filter_variants')
+		stage.records_read = len(self.variant_dict)
+
+		failed = [variant_id for variant_id, variant in self.variant_dict.items() if not function(variant, *args)]
+
+		self._remove_variants(failed)
+
+		stage.variants_kept = len(self.variant_dict)
+
+		if stage.records_read > stage.variants_kept:
+
+			stage.records_rejected['filter_func'] = stage.records_read - stage.variants_kept
+
+		self._finish_stage(stage)
+
+	def filter_on_numerical_annotation(self,
+										annotation_key,
+										ad_het,
+										ad_hom_alt,
+										x_male,
+										x_female_het,
+										x_female_hom,
+										compound_het,
+										y,
+										mt,
+										annotation_type='transcript',
+										comparison='gte',
+										zero_values=['.', '', None],
+										agg_func='min',
+										compound_het_dict={}):
+		"""
+		Filter the whole VariantSet on a numerical annotation with a different threshold for each inheritance context.
+
+		Gives the same result as filter_variants() with Variant.filter_on_numerical_transcript_annotation_gte() or one of
+		the other three filter_on_numerical functions. The annotation value and context of each variant are written into
+		two arrays in a single pass over the variants, reusing the context cached on each variant (see
+		Variant.get_filter_context()), and every value is then compared with its context's threshold in one go. Failing
+		variants are deleted from self.variant_dict in place.
+
+		Input:
+
+			annotation_key - which annotation to get e.g. gnomAD_AF
+			ad_het, ad_hom_alt, x_male, x_female_het, x_female_hom, compound_het, y, mt - the threshold for each
+			context. See Variant.filter_on_numerical_transcript_annotation_gte()
+			annotation_type - transcript to use the CSQ annotations or info to use the INFO annotations.
+			comparison - gte to keep variants with a value larger or equal to the threshold or lte for smaller or equal.
+			zero_values - list of values which should be considered as 0 in the annotation.
+			agg_func - how to aggregate multiple values - min, max, mean
+			compound_het_dict - A dictionary of variants which are compound hets.
+
+		Returns:
+
+			None - filters self.variant_dict
+
+		"""
+
+		if annotation_type not in ['transcript', 'info']:
+
+			raise ValueError(f'Unknown annotation type ({annotation_type}) - must be transcript or info.')
+
+		if comparison not in ['gte', 'lte']:
+
+			raise ValueError(f'Unknown comparison ({comparison}) - must be gte or lte.')
+
+		stage = StageStats('filter_variants')
+
+		# Thresholds in the same order as FILTER_CONTEXTS
+		thresholds = np.array([compound_het, ad_het, ad_hom_alt, x_male, x_female_het, x_female_hom, y, mt], dtype=float)
+
+		context_codes = {context: i for i, context in enumerate(FILTER_CONTEXTS)}
+
+		variant_ids = list(self.variant_dict)
+		values = np.empty(len(variant_ids), dtype=float)
+		contexts = np.empty(len(variant_ids), dtype='int8')
+
+		for i, variant in enumerate(self.variant_dict.values()):
+
+			context = variant.get_filter_context(compound_het_dict)
+
+			if context == None:
+
+				raise ValueError('Variant does not have a a recognised workflow - is the proband homozygous reference?')
+
+			contexts[i] = context_codes[context]
+
+			if annotation_type == 'transcript':
+
+				values[i] = variant.get_numerical_transcript_annotation(annotation_key, zero_values, agg_func)
+
+			else:
+
+				values[i] = variant.get_numerical_info_annotation(annotation_key, zero_values, agg_func)
+
+		stage.records_read = len(variant_ids)
+
+		if comparison == 'gte':
+
+			keep = values >= thresholds[contexts]
+
+		else:
+
+			keep = values <= thresholds[contexts]
+
+		self._remove_variants([variant_ids[i] for i in np.flatnonzero(~keep)])
+
+		stage.variants_kept = int(keep.sum())
+
+		if stage.records_read > stage.variants_kept:
+
+			stage.records_rejected['filter_func'] = stage.records_read - stage.variants_kept
+
+		self._finish_stage(stage)
+
+	def get_filter_contexts(self, compound_het_dict={}):
+		"""
+		Get the context of every variant used by the numerical annotation filters as a single column.
+
+		Each variant caches its own context (see Variant.get_filter_context()) so chained filters only work it out once.
+
+		Input:
+
+			compound_het_dict - A dictionary of variants which are compound hets.
+
+		Returns:
+
+			contexts: (numpy.ndarray) One code per variant in self.variant_dict order. The code is the index of the context
+			in FILTER_CONTEXTS i.e. 0 compound_het, 1 ad_het, 2 ad_hom_alt, 3 x_male, 4 x_female_het, 5 x_female_hom,
+			6 y and 7 mt or -1 if there is no context e.g. the proband is homozygous reference.
+
+		"""
+
+		context_codes = {context: i for i, context in enumerate(FILTER_CONTEXTS)}
+		context_codes[None] = -1
+
+		return np.array([context_codes[variant.get_filter_context(compound_het_dict)] for variant in self.variant_dict.values()], dtype='int8')
+
+	def _remove_variants(self, variant_ids):
+		"""
+		Delete variants from self.variant_dict in place and keep the positional index and any SQLite storage up to date.
+
+		Input:
+
+			variant_ids: (List) The variant_ids to remove.
+
+		Returns:
+
+			None
+
+		"""
+
+		for variant_id in variant_ids:
+
+			del self.variant_dict[variant_id]
+
+		if self.variant_index != None:
+
+			self.variant_index.retain(self.variant_dict)
+
+		self._commit_storage()
+
+
+	def get_variant_index(self):
+		"""
+		Get the positional index over self.variant_dict. The index is built the first time it is needed and then kept
+		up to date by add_variant() and filter_variants().
+
+		Input: Self
+
+		Returns:
 
+			variant_index: (VariantIndex) The positional index.
+
+		"""
+
+		if self.variant_index == None:
+
+			self.variant_index = VariantIndex(self.variant_dict.values())
+
+		return self.variant_index
+
+	def get_variants_in_region(self, chrom, start, end):
+		"""
+		Get the variants which overlap a region e.g. a CNV.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+			start: (Integer) 1 based start of the region.
+			end: (Integer) 1 based inclusive end of the region.
+
+		Returns:
+
+			variants: (List) Variant objects overlapping the region sorted by position.
+
+		"""
+
+		return [self.variant_dict[variant_id] for variant_id in self.get_variant_index().query(chrom, start, end)]
+
+	def get_nearest_variants(self, chrom, pos, n=1):
+		"""
+		Get the variants closest to a position.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+			pos: (Integer) 1 based position.
+			n: (Integer) How many variants to return.
+
+		Returns:
+
+			variants: (List) Up to n Variant objects ordered by distance from pos.
+
+		"""
+
+		return [self.variant_dict[variant_id] for variant_id in self.get_variant_index().nearest(chrom, pos, n=n)]
+
+	def get_sorted_variants(self, chrom):
+		"""
+		Get the variants on a chromosome sorted by position.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+
+		Returns:
+
+			variants: (List) Variant objects sorted by position.
+
+		"""
+
+		return [self.variant_dict[variant_id] for variant_id in self.get_variant_index().get_sorted_variant_ids(chrom)]
+
+	def iter_variant_windows(self, chrom, window_size, step=None, start=None, end=None):
+		"""
+		Iterate over fixed size windows along a chromosome.
+
+		Input:
+
+			chrom: (String) The chromosome e.g. 2 or chr2
+			window_size: (Integer) The window size in bases.
+			step: (Integer) How far to move the window each time. Defaults to window_size.
+			start: (Integer) 1 based position of the first window. Defaults to the first variant on the chromosome.
+			end: (Integer) Stop once a window starts after this position. Defaults to the last variant on the chromosome.
+
+		Returns:
+
+			Generator of (window_start, window_end, variants) tuples where variants is a list of Variant objects.
+
+		"""
+
+		for window_start, window_end, variant_ids in self.get_variant_index().iter_windows(chrom, window_size, step=step, start=start, end=end):
+
+			yield window_start, window_end, [self.variant_dict[variant_id] for variant_id in variant_ids]
+
+	def call_upd_regions(self,
+						 chroms=None,
+						 window_size=5000000,
+						 step=None,
+						 min_supporting_sites=5,
+						 min_support_fraction=0.8,
+						 min_biparental_sites=5,
+						 min_parental_gq=30,
+						 min_parental_depth=10):
+		"""
+		Call candidate uniparental disomy and biparental inheritance segments in a single pass along each chromosome.
+
+		See upd.call_upd_regions() for details of the input arguments.
+
+		Input: See upd.call_upd_regions()
+
+		Returns:
+
+			segments: (List) A list of segment dictionaries.
+
+		"""
+
+		return call_upd_regions(self,
+								chroms=chroms,
+								window_size=window_size,
+								step=step,
+								min_supporting_sites=min_supporting_sites,
+								min_support_fraction=min_support_fraction,
+								min_biparental_sites=min_biparental_sites,
+								min_parental_gq=min_parental_gq,
+								min_parental_depth=min_parental_depth)
+
+	def clear_inheritance_cache(self):
+		"""
+		Clear the cached inheritance models. Called when self.final_compound_hets is rebuilt.
+
+		Call this directly if genotypes are changed after get_variant_inheritance_models() or to_df() have been run.
+
+		Input: Self
+
+		Returns:
+
+			None
+
+		"""
+
+		self.inheritance_cache = {}
+		self.inheritance_cache_compound_hets = None
+
+	def get_variant_inheritance_models(self, variant_id,
+										lenient=False,
+										low_penetrance_genes={},
+										min_parental_gq_dn=30,
+										min_parental_depth_dn=10,
+										max_parental_alt_ref_ratio_dn=0.04,
+										min_parental_gq_upi=30,
+										min_parental_depth_upi=10):
+		"""
+		Get the matching inheritance models for a variant in the set using self.final_compound_hets for the compound het model.
+
+		Results are cached per parameter set so repeated calls e.g. from to_df() only evaluate each variant once.
+
+		Input:
+
+			variant_id: (String) The variant_id of a variant in self.variant_dict
+			See Variant.get_matching_inheritance_models() for the other arguments.
+
+		Returns:
+
+			models: (List) The matching inheritance models.
+
+		"""
+
+		# Assigning a new final_compound_hets dict makes any cached compound het results stale.
+		if self.inheritance_cache_compound_hets is not self.final_compound_hets:
+
+			self.inheritance_cache = {}
+			self.inheritance_cache_compound_hets = self.final_compound_hets
+
+		key = (lenient,
+			   tuple(sorted(low_penetrance_genes)),
+			   min_parental_gq_dn,
+			   min_parental_depth_dn,
+			   max_parental_alt_ref_ratio_dn,
+			   min_parental_gq_upi,
+			   min_parental_depth_upi)
+
+		models_dict = self.inheritance_cache.setdefault(key, {})
+
+		if variant_id not in models_dict:
+
+			models_dict[variant_id] = self.variant_dict[variant_id].get_matching_inheritance_models(compound_het_dict=self.final_compound_hets,
+																									 lenient=lenient,
+																									 low_penetrance_genes=low_penetrance_genes,
+																									 min_parental_gq_dn=min_parental_gq_dn,
+																									 min_parental_depth_dn=min_parental_depth_dn,
+																									 max_parental_alt_ref_ratio_dn=max_parental_alt_ref_ratio_dn,
+																									 min_parental_gq_upi=min_parental_gq_upi,
+																									 min_parental_depth_upi=min_parental_depth_upi)
+
+		return models_dict[variant_id]
+
+	def add_gene_scores(self, gene_score_dict, feature_key='SYMBOL'):
+		"""
+		Attach a phenotype score to each variant e.g. from wrappers.run_phen2gene() or HPOGeneScorer.score().
+
+		The score of a variant is the highest score of the genes in its transcript annotations. Scores are converted
+		to floats and worked out once here rather than when the variants are exported. Variants with no scored genes
+		or no transcript annotations get a score of None.
+
+		Input:
+
+			gene_score_dict: (Dict) Dictionary with the gene as the key and the score as the value.
+			feature_key: (String) The transcript annotation key to match the genes on.
+
+		Returns:
+
+			None - The scores are stored in self.gene_scores with the variant_id as the key.
+
+		"""
+
+		gene_score_dict = {gene: float(score) for gene, score in gene_score_dict.items()}
+
+		gene_scores = {}
+
+		for variant_id, variant in self.variant_dict.items():
+
+			variant_score = None
+
+			if variant.transcript_annotations != None:
+
+				for transcript in variant.transcript_annotations:
+
+					score = gene_score_dict.get(transcript.get(feature_key))
+
+					if score != None and (variant_score == None or score > variant_score):
+
+						variant_score = score
+
+			gene_scores[variant_id] = variant_score
+
+		self.gene_scores = gene_scores
+
+	def get_gene_score(self, variant_id):
+		"""
+		Get the score added by add_gene_scores() for a variant.
+
+		Input:
+
+			variant_id: (String) The variant_id of a variant in self.variant_dict
+
+		Returns:
+
+			score: (Float) The gene score or None if the variant has no score.
+
+		"""
+
+		return self.gene_scores.get(variant_id)
+
+	def get_top_variants(self, k=50,
+							score_func=default_score,
+							frequency_key='gnomAD_AF',
+							frequency_type='transcript',
+							lenient=False,
+							low_penetrance_genes={},
+							min_parental_gq_dn=30,
+							min_parental_depth_dn=10,
+							max_parental_alt_ref_ratio_dn=0.04,
+							min_parental_gq_upi=30,
+							min_parental_depth_upi=10):
+		"""
+		Rank the variants and return the top k without building a DataFrame.
+
+		Each variant is scored from its inheritance models (using self.final_compound_hets for the compound het model),
+		worst consequence, population frequency and the gene score from add_gene_scores(). Only the k best variants
+		are kept while streaming over self.variant_dict so this also works with SQLite storage.
+
+		Input:
+
+			k: (Integer) The number of variants to return.
+			score_func: Function taking the feature dictionary from ranking.get_ranking_features() and returning a score
+			which can be compared. Defaults to ranking.default_score()
+			frequency_key: (String) The population frequency annotation. Use None to skip the frequency.
+			frequency_type: (String) transcript or info
+			See Variant.get_matching_inheritance_models() for the other arguments.
+
+		Returns:
+
+			ranked: (List) Feature dictionaries for the top k variants from best to worst with score and rank keys added.
+
+		"""
+
+		def iter_features():
+
+			for variant_id, variant in self.variant_dict.items():
+
+				inheritance_models = variant.get_matching_inheritance_models(compound_het_dict=self.final_compound_hets,
+																			  lenient=lenient,
+																			  low_penetrance_genes=low_penetrance_genes,
+																			  min_parental_gq_dn=min_parental_gq_dn,
+																			  min_parental_depth_dn=min_parental_depth_dn,
+																			  max_parental_alt_ref_ratio_dn=max_parental_alt_ref_ratio_dn,
+																			  min_parental_gq_upi=min_parental_gq_upi,
+																			  min_parental_depth_upi=min_parental_depth_upi)
+
+				yield get_ranking_features(variant,
+										   inheritance_models,
+										   gene_score=self.gene_scores.get(variant_id),
+										   frequency_key=frequency_key,
+										   frequency_type=frequency_type)
+
+		return select_top_k(iter_features(), k, score_func=score_func)
 
 	def to_df(self, add_inheritance=True,
 				 lenient=False,
@@ -611,11 +1548,28 @@ class VariantSet:
 
 		"""
 
+		stage = StageStats('export')
+
 		df_list = []
 
 		for variant in self.variant_dict :
     
 		    var = self.variant_dict [variant]
+
+		    stage.records_read += 1
+		    stage.variants_kept += 1
+
+		    # The inheritance models do not depend on the transcript so work them out once per variant.
+		    if add_inheritance == True:
+
+		        inheritance_models = '|'.join(self.get_variant_inheritance_models(variant,
+		        																	lenient=lenient,
+		        																	low_penetrance_genes=low_penetrance_genes,
+		        																	min_parental_gq_dn=min_parental_gq_dn,
+		        																	min_parental_depth_dn=min_parental_depth_dn,
+		        																	max_parental_alt_ref_ratio_dn=max_parental_alt_ref_ratio_dn,
+		        																	min_parental_gq_upi=min_parental_gq_upi,
+		        																	min_parental_depth_upi=min_parental_depth_upi))
 		    
 		    for transcript in var.transcript_annotations:
 		        
@@ -631,16 +1585,13 @@ class VariantSet:
 
 		        if add_inheritance == True:
 
-		        	row['inheritance_models'] = '|'.join(var.get_matching_inheritance_models(compound_het_dict= self.final_compound_hets,
-		        																			lenient=lenient,
-		        																			min_parental_gq_dn=min_parental_gq_dn,
-		        																			min_parental_depth_dn =min_parental_depth_dn,
-		        																			max_parental_alt_ref_ratio_dn= max_parental_alt_ref_ratio_dn,
-		        																			min_parental_gq_upi = min_parental_gq_upi,
-		        																			min_parental_depth_upi = min_parental_depth_upi
-		        																			))
+		        	row['inheritance_models'] = inheritance_models
 
 		        row['worst_consequence'] = var.get_worst_consequence()
+
+		        if self.gene_scores:
+
+		        	row['gene_score'] = self.gene_scores.get(variant)
 		        
 		        for sample in var.genotypes:
 		                   
@@ -662,8 +1613,123 @@ class VariantSet:
 
 		df = pd.DataFrame(df_list)
 
+		self._finish_stage(stage)
+
 		return df
 
+	def to_normalised_dfs(self, add_inheritance=True,
+							lenient=False,
+							low_penetrance_genes={},
+							min_parental_gq_dn=30,
+							min_parental_depth_dn=10,
+							max_parental_alt_ref_ratio_dn=0.04,
+							min_parental_gq_upi=30,
+							min_parental_depth_upi=10):
+		"""
+		Convert variant_dict to normalised Pandas DataFrames rather than one wide row per transcript.
+
+		variants - One row per variant with the INFO fields and inheritance models.
+		genotypes - One row per variant and sample.
+		transcripts - One row per variant and transcript annotation.
+
+		The tables are joined on the integer variant_key column.
+
+		Input: See to_df()
+
+		Returns:
+
+			dfs: (Dict) Dictionary with the keys variants, genotypes and transcripts and Pandas DataFrames as the values.
+
+		"""
+
+		stage = StageStats('export')
+
+		inheritance_args = {'lenient': lenient,
+							'low_penetrance_genes': low_penetrance_genes,
+							'min_parental_gq_dn': min_parental_gq_dn,
+							'min_parental_depth_dn': min_parental_depth_dn,
+							'max_parental_alt_ref_ratio_dn': max_parental_alt_ref_ratio_dn,
+							'min_parental_gq_upi': min_parental_gq_upi,
+							'min_parental_depth_upi': min_parental_depth_upi}
+
+		columns, info_types = get_normalised_columns(self, add_inheritance=add_inheritance)
+
+		rows = {table_name: [] for table_name in columns}
+
+		for chunk in iter_normalised_rows(self, add_inheritance=add_inheritance, inheritance_args=inheritance_args):
+
+			for table_name in chunk:
+
+				rows[table_name].extend(chunk[table_name])
+
+		dfs = {table_name: pd.DataFrame(rows[table_name], columns=columns[table_name]) for table_name in columns}
+
+		stage.records_read = len(self.variant_dict)
+		stage.variants_kept = len(self.variant_dict)
+
+		self._finish_stage(stage)
+
+		return dfs
+
+	def write_normalised_tables(self, output,
+								output_format='sqlite',
+								chunk_size=10000,
+								add_inheritance=True,
+								lenient=False,
+								low_penetrance_genes={},
+								min_parental_gq_dn=30,
+								min_parental_depth_dn=10,
+								max_parental_alt_ref_ratio_dn=0.04,
+								min_parental_gq_upi=30,
+								min_parental_depth_upi=10):
+		"""
+		Stream the normalised variants, genotypes and transcripts tables (see to_normalised_dfs()) to disk in chunks
+		so the whole export is never held in memory at once.
+
+		Input:
+
+			output: (String) The SQLite database path or for Parquet the path prefix e.g. out gives out.variants.parquet
+			output_format: (String) sqlite or parquet. Parquet requires pyarrow.
+			chunk_size: (Integer) The number of variants written at a time.
+			Other arguments: See to_df()
+
+		Returns:
+
+			None
+
+		"""
+
+		if output_format not in ['sqlite', 'parquet']:
+
+			raise ValueError(f'Unknown output format ({output_format}) - must be sqlite or parquet.')
+
+		stage = StageStats('export')
+
+		inheritance_args = {'lenient': lenient,
+							'low_penetrance_genes': low_penetrance_genes,
+							'min_parental_gq_dn': min_parental_gq_dn,
+							'min_parental_depth_dn': min_parental_depth_dn,
+							'max_parental_alt_ref_ratio_dn': max_parental_alt_ref_ratio_dn,
+							'min_parental_gq_upi': min_parental_gq_upi,
+							'min_parental_depth_upi': min_parental_depth_upi}
+
+		columns, info_types = get_normalised_columns(self, add_inheritance=add_inheritance)
+
+		chunks = iter_normalised_rows(self, add_inheritance=add_inheritance, inheritance_args=inheritance_args, chunk_size=chunk_size)
+
+		if output_format == 'sqlite':
+
+			write_sqlite(chunks, columns, output)
+
+		else:
+
+			write_parquet(chunks, columns, info_types, output)
+
+		stage.records_read = len(self.variant_dict)
+		stage.variants_kept = len(self.variant_dict)
+
+		self._finish_stage(stage)
+
 
 
 
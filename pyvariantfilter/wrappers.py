@@ -1,6 +1,15 @@
-import os
+import asyncio
 import csv
-import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+
 
 def run_phenolyzer(perl_executable, phenolyzer_script, temp_dir, job_name, hpo_terms, symbol=True):
 	"""
@@ -23,28 +32,115 @@ def run_phenolyzer(perl_executable, phenolyzer_script, temp_dir, job_name, hpo_t
 
 	assert temp_dir != '' and job_name != ''
 
-	final_gene_list = f'{temp_dir}/phenolyser_result_{job_name}.final_gene_list'
+	check_hpo_terms(hpo_terms)
 
-	gene_score_dict = {}
+	# Each run gets its own directory so removing its files cannot touch another job e.g. FAM1 and FAM10.
+	job_dir = tempfile.mkdtemp(prefix=f'phenolyser_{job_name}_', dir=temp_dir)
 
-	for term in hpo_terms:
+	file_roots = f'{job_dir}/phenolyser_result_{job_name}'
 
-		if term[0:3] != 'HP:':
+	final_gene_list = f'{file_roots}.final_gene_list'
 
-			raise ValueError(f'{term} does not begin with HP:')
+	try:
+
+		hpo_terms = ';'.join(hpo_terms)
+		command = f'{perl_executable} {phenolyzer_script} "{hpo_terms}" -p -ph -logistic -out {file_roots}'
+
+		os.system(command)
+
+		exists = os.path.isfile(final_gene_list)
+
+		if not exists:
+
+			raise ValueError('No output file created.')
+
+		gene_score_dict = read_gene_list(final_gene_list, symbol=symbol)
+
+	finally:
 
+		# Remove old files.
+		shutil.rmtree(job_dir, ignore_errors=True)
 
-	hpo_terms = ';'.join(hpo_terms)
-	command = f'{perl_executable} {phenolyzer_script} "{hpo_terms}" -p -ph -logistic -out {temp_dir}/phenolyser_result_{job_name}'
+	return gene_score_dict
+
+def run_phen2gene(phen2gene_dir, temp_dir, job_name, hpo_terms, symbol=True):
+	"""
+	Python wrapper for running Phen2Gene on default settings.
+
+	Input:
 
+		phen2gene_dir (String): Location of the directory containing the Phen2Gene script.
+		temp_dir (String): A temporary directory to store results.
+		job_name (String): A name for the temporary files.
+		hpo_terms (List): List of HPO terms to use.
+		symbol (Boolean): Whether to use the gene symbol or the gene_id as the key in the output dictionary.
+
+	Output:
+		
+		gene_score_dict (Dict): A dictionary with the gene as the key and the score as the value.
+
+	"""
+
+	assert temp_dir != '' and job_name != ''
+
+	hpo_terms = ' '.join(hpo_terms)
+
+	command = f'cd {phen2gene_dir} && python {phen2gene_dir}/phen2gene.py -m  {hpo_terms} -out temp/{job_name}'
 	os.system(command)
 
+	final_gene_list = f'{phen2gene_dir}/temp/{job_name}/input_case.final_candidate_gene_list'
+
 	exists = os.path.isfile(final_gene_list)
 
 	if not exists:
 
 		raise ValueError('No output file created.')
 
+	gene_score_dict = read_gene_list(final_gene_list, symbol=symbol)
+
+	os.remove(final_gene_list)
+
+	return gene_score_dict
+
+
+def check_hpo_terms(hpo_terms):
+	"""
+	Check that each HPO term begins with HP:
+
+	Input:
+
+		hpo_terms (List): List of HPO terms.
+
+	Output:
+
+		None - raises a ValueError for an invalid term.
+
+	"""
+
+	for term in hpo_terms:
+
+		if term[0:3] != 'HP:':
+
+			raise ValueError(f'{term} does not begin with HP:')
+
+
+def read_gene_list(final_gene_list, symbol=True):
+	"""
+	Read the gene list written by Phenolyzer or Phen2Gene.
+
+	Input:
+
+		final_gene_list (String): Path to the tab separated gene list.
+		symbol (Boolean): Whether to use the gene symbol or the gene_id as the key in the output dictionary.
+
+	Output:
+
+		gene_score_dict (Dict): A dictionary with the gene as the key and the score as the value.
+
+	"""
+
+	gene_score_dict = {}
+
 	with open(final_gene_list) as csvfile:
 
 		reader = csv.reader(csvfile, delimiter='\t')
@@ -61,82 +157,366 @@ def run_phenolyzer(perl_executable, phenolyzer_script, temp_dir, job_name, hpo_t
 
 					gene_score_dict[row[2]] = row[3]
 
+	return gene_score_dict
 
-	# Remove old files.
 
-	file_roots = f'{temp_dir}/phenolyser_result_{job_name}'
+def get_cache_key(tool, tool_version, hpo_terms, symbol=True):
+	"""
+	Get the GeneScoreCache key for a phenotype set. The HPO terms are sorted and deduplicated so the order they are
+	given in does not matter.
 
-	files = glob.glob(f'{file_roots}*')
+	Input:
 
-	for file in files:
+		tool (String): The tool name e.g. phenolyzer
+		tool_version (String): The tool version. Change this when the tool or its database is updated.
+		hpo_terms (List): List of HPO terms.
+		symbol (Boolean): Whether the result is keyed on gene symbol.
 
-		os.remove(file)
+	Output:
 
-	return gene_score_dict
+		key (String): A hex digest.
 
-def run_phen2gene(phen2gene_dir, temp_dir, job_name, hpo_terms, symbol=True):
 	"""
-	Python wrapper for running Phen2Gene on default settings.
+
+	key_dict = {'tool': tool,
+				'tool_version': tool_version,
+				'hpo_terms': sorted(set(hpo_terms)),
+				'symbol': symbol}
+
+	return hashlib.sha256(json.dumps(key_dict, sort_keys=True).encode()).hexdigest()
+
+
+class GeneScoreCache:
+	"""
+	An on disk cache of gene_score_dicts so that a phenotype set is only prioritised once for each tool and version.
+
+	Each result is a JSON file named after its key from get_cache_key().
+
+	cache_dir: Directory to store the results in. Created if it does not exist (String)
+
+	"""
+
+	def __init__(self, cache_dir):
+
+		self.cache_dir = cache_dir
+
+		os.makedirs(cache_dir, exist_ok=True)
+
+	def get(self, key):
+		"""
+		Get a cached result.
+
+		Input:
+
+			key (String): Key from get_cache_key()
+
+		Output:
+
+			gene_score_dict (Dict): The cached result or None if the key is not in the cache.
+
+		"""
+
+		path = os.path.join(self.cache_dir, f'{key}.json')
+
+		if not os.path.isfile(path):
+
+			return None
+
+		with open(path) as f:
+
+			return json.load(f)
+
+	def set(self, key, gene_score_dict):
+		"""
+		Add a result to the cache. The file is written under a temporary name and then renamed so a partly written
+		result is never read.
+
+		Input:
+
+			key (String): Key from get_cache_key()
+			gene_score_dict (Dict): The result to cache.
+
+		Output:
+
+			None
+
+		"""
+
+		path = os.path.join(self.cache_dir, f'{key}.json')
+		temp_path = f'{path}.{os.getpid()}.tmp'
+
+		with open(temp_path, 'w') as f:
+
+			json.dump(gene_score_dict, f)
+
+		os.replace(temp_path, path)
+
+
+async def run_command_async(command, timeout=None, cwd=None):
+	"""
+	Run a command without blocking the event loop.
 
 	Input:
 
-		phen2gene_dir (String): Location of the directory containing the Phen2Gene script.
-		temp_dir (String): A temporary directory to store results.
-		job_name (String): A name for the temporary files.
-		hpo_terms (List): List of HPO terms to use.
-		symbol (Boolean): Whether to use the gene symbol or the gene_id as the key in the output dictionary.
+		command (List): The executable and its arguments.
+		timeout (Integer): Seconds to wait before killing the command. None to wait forever.
+		cwd (String): Directory to run the command in.
 
 	Output:
-		
+
+		None - raises a ValueError if the command fails or times out.
+
+	"""
+
+	process = await asyncio.create_subprocess_exec(*command, cwd=cwd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+
+	try:
+
+		stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+
+	except asyncio.TimeoutError:
+
+		raise ValueError(f'{command[0]} timed out after {timeout} seconds.')
+
+	finally:
+
+		# Kill the command if it is still running e.g. on a timeout or if the task was cancelled.
+		if process.returncode == None:
+
+			process.kill()
+			await process.wait()
+
+	if process.returncode != 0:
+
+		raise ValueError(f'{command[0]} failed with exit code {process.returncode}: {stderr.decode().strip()}')
+
+
+async def run_phenolyzer_async(perl_executable, phenolyzer_script, temp_dir, job_name, hpo_terms, symbol=True, timeout=None):
+	"""
+	Asynchronous version of run_phenolyzer() using a subprocess rather than os.system.
+
+	Input: See run_phenolyzer()
+
+		timeout (Integer): Seconds to wait before killing Phenolyzer.
+
+	Output:
+
 		gene_score_dict (Dict): A dictionary with the gene as the key and the score as the value.
 
 	"""
 
 	assert temp_dir != '' and job_name != ''
 
-	gene_score_dict = {}
+	check_hpo_terms(hpo_terms)
 
-	hpo_terms = ' '.join(hpo_terms)
+	job_dir = tempfile.mkdtemp(prefix=f'phenolyser_{job_name}_', dir=temp_dir)
 
-	command = f'cd {phen2gene_dir} && python {phen2gene_dir}/phen2gene.py -m  {hpo_terms} -out temp/{job_name}'
-	os.system(command)
+	file_roots = f'{job_dir}/phenolyser_result_{job_name}'
 
-	final_gene_list = f'{phen2gene_dir}/temp/{job_name}/input_case.final_candidate_gene_list'
+	try:
 
-	exists = os.path.isfile(final_gene_list)
+		await run_command_async([perl_executable, phenolyzer_script, ';'.join(hpo_terms), '-p', '-ph', '-logistic', '-out', file_roots], timeout=timeout)
 
-	if not exists:
+		final_gene_list = f'{file_roots}.final_gene_list'
 
-		raise ValueError('No output file created.')
+		if not os.path.isfile(final_gene_list):
 
-	with open(final_gene_list) as csvfile:
+			raise ValueError('No output file created.')
 
-		reader = csv.reader(csvfile, delimiter='\t')
+		return read_gene_list(final_gene_list, symbol=symbol)
 
-		for row in reader:
+	finally:
 
-			if row[1] != 'Gene':
+		shutil.rmtree(job_dir, ignore_errors=True)
 
-				if symbol:
 
-					gene_score_dict[row[1]] = row[3]
+async def run_phen2gene_async(phen2gene_dir, temp_dir, job_name, hpo_terms, symbol=True, timeout=None, python_executable=sys.executable):
+	"""
+	Asynchronous version of run_phen2gene() using a subprocess rather than os.system.
 
-				else:
+	Input: See run_phen2gene()
 
-					gene_score_dict[row[2]] = row[3]
+		timeout (Integer): Seconds to wait before killing Phen2Gene.
+		python_executable (String): The Python used to run phen2gene.py
 
+	Unlike run_phen2gene() the output is written to a directory for the job within temp_dir rather than
+	phen2gene_dir/temp, which is removed afterwards.
 
-	os.remove(final_gene_list)
+	Output:
 
-	return gene_score_dict
+		gene_score_dict (Dict): A dictionary with the gene as the key and the score as the value.
+
+	"""
+
+	assert temp_dir != '' and job_name != ''
+
+	check_hpo_terms(hpo_terms)
+
+	job_dir = os.path.abspath(tempfile.mkdtemp(prefix=f'phen2gene_{job_name}_', dir=temp_dir))
+
+	final_gene_list = f'{job_dir}/input_case.final_candidate_gene_list'
+
+	try:
 
+		await run_command_async([python_executable, f'{phen2gene_dir}/phen2gene.py', '-m'] + list(hpo_terms) + ['-out', job_dir], timeout=timeout, cwd=phen2gene_dir)
 
+		if not os.path.isfile(final_gene_list):
 
+			raise ValueError('No output file created.')
 
+		return read_gene_list(final_gene_list, symbol=symbol)
 
+	finally:
 
+		shutil.rmtree(job_dir, ignore_errors=True)
 
 
+async def prioritise_phenotypes_async(hpo_term_sets,
+									  tool,
+									  tool_args,
+									  tool_version,
+									  max_workers=4,
+									  timeout=3600,
+									  cache_dir=None,
+									  symbol=True):
+	"""
+	Run Phenolyzer or Phen2Gene for many families at once with at most max_workers running at the same time.
+
+	Families with the same phenotype set share a single run and if a cache_dir is given results are read from and
+	written to a GeneScoreCache so repeated phenotype sets return without running the tool.
+
+	A failed run does not stop the others - its error is returned for each family sharing the phenotype set.
+
+	Input:
+
+		hpo_term_sets (Dict): Dictionary with a job name e.g. the family_id as the key and a list of HPO terms as the value.
+		tool (String): phenolyzer or phen2gene
+		tool_args (Dict): The tool specific arguments - perl_executable, phenolyzer_script and temp_dir for phenolyzer
+		or phen2gene_dir and temp_dir (and optionally python_executable) for phen2gene.
+		tool_version (String): The tool version used in the cache key.
+		max_workers (Integer): The maximum number of tools to run at once.
+		timeout (Integer): Seconds to wait for each run before killing it.
+		cache_dir (String): Directory for the GeneScoreCache or None to not cache results.
+		symbol (Boolean): Whether to use the gene symbol or the gene_id as the key in the output dictionaries.
+
+	Output:
+
+		results (Dict): Dictionary with the job name as the key and a gene_score_dict as the value for the jobs which ran.
+		errors (Dict): Dictionary with the job name as the key and the exception as the value for the jobs which failed.
+
+	"""
+
+	if tool == 'phenolyzer':
+
+		run_tool = run_phenolyzer_async
+
+	elif tool == 'phen2gene':
+
+		run_tool = run_phen2gene_async
+
+	else:
+
+		raise ValueError(f'Unknown tool ({tool}) - must be phenolyzer or phen2gene.')
+
+	cache = None
+
+	if cache_dir != None:
+
+		cache = GeneScoreCache(cache_dir)
+
+	# Group the jobs by phenotype set so each unique set is only run once.
+	jobs_by_key = {}
+
+	for job_name, hpo_terms in hpo_term_sets.items():
+
+		check_hpo_terms(hpo_terms)
+
+		key = get_cache_key(tool, tool_version, hpo_terms, symbol=symbol)
+
+		jobs_by_key.setdefault(key, []).append(job_name)
+
+	async def run_key(key, semaphore):
+
+		if cache != None:
+
+			gene_score_dict = cache.get(key)
+
+			if gene_score_dict != None:
+
+				return gene_score_dict
 
+		job_name = jobs_by_key[key][0]
 
+		async with semaphore:
+
+			logger.info(f'Running {tool} for {job_name}.')
+
+			gene_score_dict = await run_tool(job_name=job_name, hpo_terms=sorted(set(hpo_term_sets[job_name])), symbol=symbol, timeout=timeout, **tool_args)
+
+		if cache != None:
+
+			cache.set(key, gene_score_dict)
+
+		return gene_score_dict
+
+	semaphore = asyncio.Semaphore(max_workers)
+
+	keys = list(jobs_by_key)
+
+	gene_score_dicts = await asyncio.gather(*[run_key(key, semaphore) for key in keys], return_exceptions=True)
+
+	results = {}
+	errors = {}
+
+	for key, gene_score_dict in zip(keys, gene_score_dicts):
+
+		if isinstance(gene_score_dict, Exception):
+
+			logger.error(f'{tool} failed for {", ".join(jobs_by_key[key])}: {gene_score_dict}')
+
+		elif isinstance(gene_score_dict, BaseException):
+
+			# e.g. a cancelled run
+			raise gene_score_dict
+
+		for job_name in jobs_by_key[key]:
+
+			if isinstance(gene_score_dict, Exception):
+
+				errors[job_name] = gene_score_dict
+
+			else:
+
+				results[job_name] = gene_score_dict
+
+	return results, errors
+
+
+def prioritise_phenotypes(hpo_term_sets,
+						  tool,
+						  tool_args,
+						  tool_version,
+						  max_workers=4,
+						  timeout=3600,
+						  cache_dir=None,
+						  symbol=True):
+	"""
+	Synchronous version of prioritise_phenotypes_async() for use outside an event loop.
+
+	Input: See prioritise_phenotypes_async()
+
+	Output:
+
+		results (Dict): Dictionary with the job name as the key and a gene_score_dict as the value for the jobs which ran.
+		errors (Dict): Dictionary with the job name as the key and the exception as the value for the jobs which failed.
+
+	"""
 
+	return asyncio.run(prioritise_phenotypes_async(hpo_term_sets,
+												   tool,
+												   tool_args,
+												   tool_version,
+												   max_workers=max_workers,
+												   timeout=timeout,
+												   cache_dir=cache_dir,
+												   symbol=symbol))
@@ -19,6 +19,13 @@ setuptools.setup(
     ],
     install_requires=[
    'pysam>=0.15.2',
-   'pandas>=0.23.4'
+   'pandas>=0.23.4',
+   'numpy'
 ],
+    extras_require={
+   'parquet': ['pyarrow']
+},
+    entry_points={
+   'console_scripts': ['pyvariantfilter=pyvariantfilter.cli:main']
+},
 )
@@ -1,8 +1,28 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
 import unittest
 from pyvariantfilter.family_member import FamilyMember
 from pyvariantfilter.family import Family
-from pyvariantfilter.variant import Variant
+from pyvariantfilter.variant import Variant, VALID_CHROMS, FILTER_CONTEXTS
 from pyvariantfilter.variant_set import VariantSet
+from pyvariantfilter.stats import WarningCounter
+from pyvariantfilter.utils import normalise_chrom, get_valid_contigs, merge_intervals, trim_alleles, get_vep_alleles, split_transcript_annotations
+from pyvariantfilter.genotype_matrix import build_genotype_matrix
+from pyvariantfilter.wrappers import get_cache_key, prioritise_phenotypes, prioritise_phenotypes_async, run_command_async
+from pyvariantfilter.ranking import select_top_k
+from pyvariantfilter.cli import main as cli_main, read_ped_families, get_default_proband
+from pyvariantfilter.config import AnalysisConfig, IMPORT_FILTER_CONTEXTS, load_analysis_config
+from pyvariantfilter.hpo_scorer import HPOGeneScorer, read_hpo_gene_table, read_phen2gene_knowledgebase
+import numpy as np
+import pandas as pd
+import pysam
 
 
 class TestCreateFamilyMember(unittest.TestCase):
@@ -3516,6 +3536,2204 @@ class TestFilterInfoAnnotation(unittest.TestCase):
 		self.assertEqual(gnomad_filt2, False)
 
 
+class TestVariantSetStats(unittest.TestCase):
+
+	def test_ingest_and_pairing_stats(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+		variant_set.enable_stats()
+
+		variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+		variant_set.get_candidate_compound_hets()
+		variant_set.filter_compound_hets()
+
+		ingest = variant_set.stats.get_stage('ingest')
+
+		self.assertEqual(ingest.records_read, 9)
+		self.assertEqual(ingest.variants_kept, 5)
+		self.assertEqual(ingest.records_rejected, {'invalid_chrom': 2, 'star_alt': 1, 'proband_no_alt': 1})
+		self.assertEqual(ingest.contigs_skipped, ['chrUn_KI270302v1', 'HLA-A*01:01:01:01'])
+		self.assertEqual(ingest.transcripts_parsed, 7)
+
+		pairing = variant_set.stats.get_stage('filter_compound_hets')
+
+		self.assertEqual(pairing.pairs_evaluated, 1)
+		self.assertEqual(pairing.pairs_passed, 1)
+
+		stats_dict = variant_set.stats.to_dict()
+
+		self.assertEqual(stats_dict['family_id'], 'FAM001')
+		self.assertEqual([stage['stage'] for stage in stats_dict['stages']], ['ingest', 'candidate_compound_hets', 'filter_compound_hets'])
+
+	def test_stats_disabled_by_default(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+		variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+		self.assertEqual(variant_set.stats, None)
+		self.assertEqual(len(variant_set.variant_dict), 5)
+
+	def test_json_log_line(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+		variant_set.enable_stats(log_json=True)
+
+		with self.assertLogs('pyvariantfilter.stats', level='INFO') as logs:
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', filter_func=lambda variant: variant.passes_filter(), args=())
+
+		stage_dict = json.loads(logs.records[0].getMessage())
+
+		self.assertEqual(stage_dict['stage'], 'ingest')
+		self.assertEqual(stage_dict['family_id'], 'FAM001')
+		self.assertEqual(stage_dict['records_rejected']['filter_func'], 1)
+
+
+class TestReaderWarnings(unittest.TestCase):
+
+	def test_invalid_contigs_skipped_by_name(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING') as logs:
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+		self.assertIn('invalid_chrom: 2 warnings {"HLA-A*01:01:01:01": 1, "chrUn_KI270302v1": 1}', logs.output[-1])
+		self.assertEqual(len(variant_set.variant_dict), 5)
+
+	def test_unindexed_vcf_checks_each_record(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+		variant_set.enable_stats()
+
+		with tempfile.TemporaryDirectory() as temp_dir:
+
+			shutil.copy('test_data/FAM001.trio.vcf.gz', temp_dir)
+
+			with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+				variant_set.read_variants_from_vcf(f'{temp_dir}/FAM001.trio.vcf.gz')
+
+		ingest = variant_set.stats.get_stage('ingest')
+
+		self.assertEqual(ingest.records_read, 9)
+		self.assertEqual(ingest.records_rejected['invalid_chrom'], 2)
+		self.assertEqual(len(variant_set.variant_dict), 5)
+
+	def test_header_only_invalid_contigs_not_warned(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		with tempfile.TemporaryDirectory() as temp_dir:
+
+			vcf_file = f'{temp_dir}/FAM001.extra_contigs.vcf'
+
+			with pysam.VariantFile('test_data/FAM001.trio.vcf.gz') as bcf_in:
+
+				header = bcf_in.header.copy()
+
+				for i in range(10):
+
+					header.contigs.add(f'chrUn_EXTRA{i}', length=1000)
+
+				with pysam.VariantFile(vcf_file, 'w', header=header) as bcf_out:
+
+					for rec in bcf_in.fetch():
+
+						bcf_out.write(rec)
+
+			pysam.tabix_index(vcf_file, preset='vcf')
+
+			for indexed in [True, False]:
+
+				if indexed == False:
+
+					os.remove(f'{vcf_file}.gz.tbi')
+
+				variant_set = VariantSet()
+				variant_set.add_family(my_family)
+				variant_set.enable_stats()
+
+				with self.assertLogs('pyvariantfilter.variant_set', level='WARNING') as logs:
+
+					variant_set.read_variants_from_vcf(f'{vcf_file}.gz')
+
+				ingest = variant_set.stats.get_stage('ingest')
+
+				self.assertEqual(ingest.records_rejected['invalid_chrom'], 2)
+				self.assertNotIn('EXTRA', ''.join(logs.output))
+				self.assertIn('invalid_chrom: 2 warnings {"HLA-A*01:01:01:01": 1, "chrUn_KI270302v1": 1}', logs.output[-1])
+
+	def test_warning_counter_rate_limit(self):
+
+		logger = logging.getLogger('pyvariantfilter.test')
+		warning_counter = WarningCounter(logger, max_logged_per_reason=2)
+
+		with self.assertLogs('pyvariantfilter.test', level='WARNING') as logs:
+
+			for i in range(10):
+
+				warning_counter.warn('missing_gq', 'mum', 'No GQ')
+
+			warning_counter.log_summary()
+
+		self.assertEqual(len(logs.output), 4)
+		self.assertEqual(warning_counter.get_total('missing_gq'), 10)
+		self.assertEqual(warning_counter.counts, {'missing_gq': {'mum': 10}})
+
+
+class TestContigResolution(unittest.TestCase):
+
+	def test_normalise_chrom(self):
+
+		self.assertEqual(normalise_chrom('chr1'), '1')
+		self.assertEqual(normalise_chrom('chrM'), 'M')
+		self.assertEqual(normalise_chrom('X'), 'X')
+		self.assertEqual(normalise_chrom('HLA-A*01:01:01:01'), 'HLA-A*01:01:01:01')
+
+	def test_get_valid_contigs(self):
+
+		valid_contigs, invalid_contigs = get_valid_contigs(['chr1', 'chrX', 'chrUn_KI270302v1', 'chr1_KI270706v1_random', 'MT'], VALID_CHROMS)
+
+		self.assertEqual(valid_contigs, {'chr1': '1', 'chrX': 'X', 'MT': 'MT'})
+		self.assertEqual(invalid_contigs, ['chrUn_KI270302v1', 'chr1_KI270706v1_random'])
+
+	def test_trusted_variant_skips_validation(self):
+
+		variant = Variant(chrom='chrUn', pos=10, ref='G', alt='A', validate=False)
+
+		self.assertEqual(variant.variant_id, 'chrUn:10G>A')
+
+		with self.assertRaises(ValueError):
+
+			Variant(chrom='chrUn', pos=10, ref='G', alt='A')
+
+	def test_reader_normalises_chromosomes(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+		self.assertCountEqual(variant_set.variant_dict.keys(), ['1:100G>A', '1:200C>T', '2:600G>GA', 'X:1000C>A', 'M:50A>G'])
+
+
+class TestBulkGenotypes(unittest.TestCase):
+
+	def test_add_genotypes_bulk(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant = Variant(chrom='2', pos=10, ref='G', alt='A')
+		variant.add_family(my_family)
+
+		variant.add_genotypes_bulk({'proband': {'genotype': ['G', 'A'], 'allele_depths': [10, 8], 'genotype_quality': 99, 'depth': 18},
+									'mum': {'genotype': ['G', 'G'], 'allele_depths': [20, 0], 'genotype_quality': 60, 'depth': 20},
+									'dad': {'genotype': ['G', 'G'], 'allele_depths': [20, 0], 'genotype_quality': 60, 'depth': 20}})
+
+		self.assertEqual(variant.is_het('proband'), True)
+		self.assertEqual(variant.get_alt_reads('proband'), 8)
+		self.assertEqual(variant.matches_denovo(), True)
+
+	def test_reader_genotypes(self):
+
+		my_family = Family('FAM001')
+		my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+		variant = variant_set.variant_dict['1:200C>T']
+
+		self.assertEqual(variant.genotypes['dad'], {'genotype': ['C', 'T'], 'allele_depths': [10, 12], 'genotype_quality': 99, 'depth': 22})
+		self.assertEqual(variant.genotypes['mum'], {'genotype': ['C', 'C'], 'allele_depths': [25, 0], 'genotype_quality': 75, 'depth': 25})
+
+	def test_family_member_not_in_vcf(self):
+
+		mum = FamilyMember('mum', 'FAM002', 2, False)
+		proband = FamilyMember('sibling', 'FAM002', 1, True, mum=mum)
+		my_family = Family('FAM002')
+		my_family.add_family_member(mum)
+		my_family.add_family_member(proband)
+		my_family.set_proband(proband.get_id())
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+
+		with self.assertRaises(ValueError):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+
+class TestRegionLoading(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+	def test_merge_intervals(self):
+
+		merged = merge_intervals([('chr1', 100, 200), ('1', 150, 300), ('1', 300, 400), ('1', 500, 600), ('chrX', 5, 10)])
+
+		self.assertEqual(merged, {'1': [(100, 400), (500, 600)], 'X': [(5, 10)]})
+
+	def test_load_region_list(self):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+		variant_set.enable_stats()
+
+		variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', regions=[('chr1', 150, 250), ('2', 0, 1000)])
+
+		self.assertCountEqual(variant_set.variant_dict.keys(), ['1:200C>T', '2:600G>GA'])
+		self.assertEqual(variant_set.stats.get_stage('ingest').records_read, 3)
+
+	def test_overlapping_regions_read_once(self):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+		variant_set.enable_stats()
+
+		variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', regions=[('chr2', 598, 600), ('chr2', 600, 602), ('chr1', 99, 100), ('chr1', 90, 100)])
+
+		self.assertCountEqual(variant_set.variant_dict.keys(), ['1:100G>A', '2:600G>GA'])
+		self.assertEqual(variant_set.stats.get_stage('ingest').records_read, 2)
+
+	def test_load_gene_panel(self):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+
+		variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', genes=['GENEA', 'GENED'], gene_bed='test_data/FAM001.genes.bed')
+
+		self.assertCountEqual(variant_set.variant_dict.keys(), ['1:100G>A', '1:200C>T', 'X:1000C>A'])
+
+	def test_unknown_gene(self):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+
+		with self.assertRaises(ValueError):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', genes=['NOTAGENE'], gene_bed='test_data/FAM001.genes.bed')
+
+
+class TestVariantIndex(unittest.TestCase):
+
+	def setUp(self):
+
+		mum = FamilyMember('mum', 'FAM001', 2, False)
+		dad = FamilyMember('dad', 'FAM001', 1, False)
+		proband = FamilyMember('proband', 'FAM001', 1, True, mum=mum, dad=dad)
+		self.my_family = Family('FAM001')
+		self.my_family.add_family_member(mum)
+		self.my_family.add_family_member(dad)
+		self.my_family.add_family_member(proband)
+		self.my_family.set_proband(proband.get_id())
+
+		self.variant_set = VariantSet()
+		self.variant_set.add_family(self.my_family)
+
+		for chrom, pos, ref in [('2', 500, 'G'), ('2', 100, 'GTTTT'), ('2', 300, 'G'), ('2', 102, 'G'), ('3', 50, 'G')]:
+
+			variant = Variant(chrom=chrom, pos=pos, ref=ref, alt='A')
+			variant.add_family(self.my_family)
+			self.variant_set.add_variant(variant)
+
+	def test_region_query(self):
+
+		self.assertEqual([variant.pos for variant in self.variant_set.get_variants_in_region('chr2', 103, 300)], [100, 300])
+		self.assertEqual([variant.pos for variant in self.variant_set.get_variants_in_region('2', 105, 299)], [])
+		self.assertEqual(self.variant_set.get_variants_in_region('X', 1, 1000), [])
+
+	def test_nearest(self):
+
+		self.assertEqual([variant.pos for variant in self.variant_set.get_nearest_variants('2', 290)], [300])
+		self.assertEqual([variant.pos for variant in self.variant_set.get_nearest_variants('2', 101, n=3)], [100, 102, 300])
+
+	def test_index_kept_in_sync(self):
+
+		self.variant_set.get_variant_index()
+
+		variant = Variant(chrom='2', pos=250, ref='G', alt='A')
+		variant.add_family(self.my_family)
+		self.variant_set.add_variant(variant)
+
+		self.assertEqual([variant.pos for variant in self.variant_set.get_sorted_variants('2')], [100, 102, 250, 300, 500])
+
+		self.variant_set.filter_variants(lambda variant: variant.pos > 200, ())
+
+		self.assertEqual([variant.pos for variant in self.variant_set.get_sorted_variants('2')], [250, 300, 500])
+		self.assertEqual(self.variant_set.get_sorted_variants('3'), [])
+		self.assertEqual(len(self.variant_set.get_variant_index()), 3)
+
+	def test_windows(self):
+
+		windows = [(start, end, [variant.pos for variant in variants]) for start, end, variants in self.variant_set.iter_variant_windows('2', 200, step=100)]
+
+		self.assertEqual(windows, [(100, 299, [100, 102]), (200, 399, [300]), (300, 499, [300]), (400, 599, [500]), (500, 699, [500])])
+
+
+class TestUPDRegions(unittest.TestCase):
+
+	def test_paternal_isodisomy_and_biparental_segments(self):
+
+		dad = FamilyMember('dad', 'FAM001', 1, False)
+		mum = FamilyMember('mum', 'FAM001', 2, False)
+		proband = FamilyMember('proband', 'FAM001', 1, True, dad=dad, mum=mum)
+		my_family = Family('FAM001')
+		my_family.add_family_member(dad)
+		my_family.add_family_member(mum)
+		my_family.add_family_member(proband)
+		my_family.set_proband(proband.get_id())
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+
+		# Paternal isodisomy - mum hom ref, dad het and proband hom alt
+		for pos in range(1000, 11000, 1000):
+
+			variant = Variant(chrom='2', pos=pos, ref='G', alt='A')
+			variant.add_family(my_family)
+			variant.add_genotype('proband', ['A', 'A'], [0, 20], 99, 20)
+			variant.add_genotype('mum', ['G', 'G'], [20, 0], 99, 20)
+			variant.add_genotype('dad', ['G', 'A'], [10, 10], 99, 20)
+			variant_set.add_variant(variant)
+
+		# Biparental - mum hom ref, dad hom alt and proband het
+		for pos in range(1000000, 1010000, 1000):
+
+			variant = Variant(chrom='2', pos=pos, ref='G', alt='A')
+			variant.add_family(my_family)
+			variant.add_genotype('proband', ['G', 'A'], [10, 10], 99, 20)
+			variant.add_genotype('mum', ['G', 'G'], [20, 0], 99, 20)
+			variant.add_genotype('dad', ['A', 'A'], [0, 20], 99, 20)
+			variant_set.add_variant(variant)
+
+		segments = variant_set.call_upd_regions(window_size=20000)
+
+		self.assertEqual(len(segments), 2)
+
+		self.assertEqual(segments[0], {'chrom': '2',
+									   'start': 1000,
+									   'end': 10000,
+									   'call': 'paternal_upd',
+									   'sites': 10,
+									   'supporting_sites': 10,
+									   'isodisomy_sites': 10,
+									   'contradicting_sites': 0})
+
+		self.assertEqual(segments[1]['call'], 'biparental')
+		self.assertEqual(segments[1]['start'], 1000000)
+		self.assertEqual(segments[1]['end'], 1009000)
+		self.assertEqual(segments[1]['supporting_sites'], 10)
+
+	def test_requires_both_parents(self):
+
+		mum = FamilyMember('mum', 'FAM001', 2, False)
+		proband = FamilyMember('proband', 'FAM001', 1, True, mum=mum)
+		my_family = Family('FAM001')
+		my_family.add_family_member(mum)
+		my_family.add_family_member(proband)
+		my_family.set_proband(proband.get_id())
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+
+		with self.assertRaises(ValueError):
+
+			variant_set.call_upd_regions()
+
+	def test_min_sites_must_be_positive(self):
+
+		dad = FamilyMember('dad', 'FAM001', 1, False)
+		mum = FamilyMember('mum', 'FAM001', 2, False)
+		proband = FamilyMember('proband', 'FAM001', 1, True, dad=dad, mum=mum)
+		my_family = Family('FAM001')
+		my_family.add_family_member(dad)
+		my_family.add_family_member(mum)
+		my_family.add_family_member(proband)
+		my_family.set_proband(proband.get_id())
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+
+		# Not informative - everyone het so the window has no supporting or biparental sites
+		variant = Variant(chrom='2', pos=1000, ref='G', alt='A')
+		variant.add_family(my_family)
+		variant.add_genotype('proband', ['G', 'A'], [10, 10], 99, 20)
+		variant.add_genotype('mum', ['G', 'A'], [10, 10], 99, 20)
+		variant.add_genotype('dad', ['G', 'A'], [10, 10], 99, 20)
+		variant_set.add_variant(variant)
+
+		with self.assertRaises(ValueError):
+
+			variant_set.call_upd_regions(min_supporting_sites=0)
+
+		with self.assertRaises(ValueError):
+
+			variant_set.call_upd_regions(min_biparental_sites=0)
+
+
+class TestGenotypeMasks(unittest.TestCase):
+
+	def setUp(self):
+
+		dad = FamilyMember('dad', 'FAM001', 1, False)
+		mum = FamilyMember('mum', 'FAM001', 2, True)
+		proband = FamilyMember('proband', 'FAM001', 1, True, dad=dad, mum=mum)
+		sister = FamilyMember('sister', 'FAM001', 2, False, dad=dad, mum=mum)
+		self.my_family = Family('FAM001')
+		self.my_family.add_family_member(dad)
+		self.my_family.add_family_member(mum)
+		self.my_family.add_family_member(proband)
+		self.my_family.add_family_member(sister)
+		self.my_family.set_proband(proband.get_id())
+
+	def test_role_masks(self):
+
+		self.assertEqual(self.my_family.get_member_bits(), {'dad': 1, 'mum': 2, 'proband': 4, 'sister': 8})
+		self.assertEqual(self.my_family.get_role_masks(), {'all': 15, 'affected': 6, 'unaffected': 9, 'male': 5, 'female': 10, 'proband': 4})
+
+	def test_genotype_masks(self):
+
+		variant = Variant(chrom='2', pos=10, ref='G', alt='A')
+		variant.add_family(self.my_family)
+		variant.add_genotype('dad', ['G', 'G'], [20, 0], 99, 20)
+		variant.add_genotype('mum', ['G', 'A'], [10, 10], 10, 20)
+		variant.add_genotype('proband', ['A', 'A'], [0, 20], 99, 20)
+		variant.add_genotype('sister', ['.', '.'], [0, 0], 0, 0)
+
+		self.assertEqual(variant.get_genotype_masks(), {'has_alt': 6, 'het': 2, 'hom_alt': 4, 'hom_ref': 1, 'missing': 8})
+		self.assertEqual(variant.get_low_quality_mask(10, 20), 10)
+
+		variant.add_genotype('sister', ['A', 'A'], [0, 20], 99, 20)
+
+		self.assertEqual(variant.get_genotype_masks()['hom_alt'], 12)
+		self.assertEqual(variant.is_hom_alt_in_unaffected(), True)
+
+	def test_masks_match_per_sample_methods(self):
+
+		random.seed(33)
+
+		genotypes = [['G', 'G'], ['G', 'A'], ['A', 'G'], ['A', 'A'], ['.', '.'], ['A', '.'], ['.', 'G']]
+
+		for i in range(500):
+
+			variant = Variant(chrom='2', pos=10, ref='G', alt='A')
+			variant.add_family(self.my_family)
+
+			for family_member_id in self.my_family.get_all_family_member_ids():
+
+				variant.add_genotype(family_member_id, list(random.choice(genotypes)), [10, 10], random.choice([10, 30, 99]), random.choice([5, 15, 30]))
+
+			affected = self.my_family.get_affected_family_members()
+			unaffected = self.my_family.get_unaffected_family_members()
+
+			expected_ar = (all(variant.is_hom_alt(sample) or variant.is_missing(sample) for sample in affected) and
+						   not any(variant.is_hom_alt(sample) for sample in unaffected))
+
+			expected_gq = all(variant.get_depth(sample) >= 10 and variant.get_genotype_quality(sample) >= 20 and not variant.is_missing(sample)
+							  for sample in self.my_family.get_all_family_member_ids())
+
+			self.assertEqual(variant.matches_autosomal_reccessive(), expected_ar)
+			self.assertEqual(variant.is_hom_alt_in_unaffected(), any(variant.is_hom_alt(sample) for sample in unaffected))
+			self.assertEqual(variant.all_samples_pass_genotype_quality(min_dp=10, min_gq=20), expected_gq)
+
+
+class TestInheritanceRules(unittest.TestCase):
+
+	def setUp(self):
+
+		dad = FamilyMember('dad', 'FAM001', 1, True)
+		mum = FamilyMember('mum', 'FAM001', 2, False)
+		proband = FamilyMember('proband', 'FAM001', 2, True, dad=dad, mum=mum)
+		brother = FamilyMember('brother', 'FAM001', 1, False, dad=dad, mum=mum)
+		self.my_family = Family('FAM001')
+		self.my_family.add_family_member(dad)
+		self.my_family.add_family_member(mum)
+		self.my_family.add_family_member(proband)
+		self.my_family.add_family_member(brother)
+		self.my_family.set_proband(proband.get_id())
+		self.dad = dad
+		self.mum = mum
+		self.males = self.my_family.get_male_family_members()
+
+	def test_rules_shared_by_variants(self):
+
+		rules = self.my_family.get_inheritance_rules()
+
+		self.assertEqual(rules.x_dominant_possible, True)
+		self.assertIs(self.my_family.get_inheritance_rules(), rules)
+
+		sister = FamilyMember('sister', 'FAM001', 2, False, dad=self.dad, mum=self.mum)
+		self.my_family.add_family_member(sister)
+
+		# An affected dad with an unaffected daughter rules out X dominant for every variant.
+		self.assertIsNot(self.my_family.get_inheritance_rules(), rules)
+		self.assertEqual(self.my_family.get_inheritance_rules().x_dominant_possible, False)
+
+	def test_rules_match_per_sample_methods(self):
+
+		random.seed(34)
+
+		genotypes = [['G', 'G'], ['G', 'A'], ['A', 'A'], ['.', '.'], ['A', '.']]
+
+		affected = self.my_family.get_affected_family_members()
+		unaffected = self.my_family.get_unaffected_family_members()
+
+		for i in range(500):
+
+			chrom = random.choice(['2', 'X'])
+
+			variant = Variant(chrom=chrom, pos=10, ref='G', alt='A')
+			variant.add_family(self.my_family)
+
+			for family_member_id in self.my_family.get_all_family_member_ids():
+
+				variant.add_genotype(family_member_id, list(random.choice(genotypes)), [10, 10], 99, 30)
+
+			het_or_missing = all(variant.is_het(sample) or variant.is_missing(sample) for sample in affected)
+			unaffected_ref = not any(variant.has_alt(sample) for sample in unaffected)
+
+			self.assertEqual(variant.matches_autosomal_dominant(), chrom == '2' and het_or_missing and unaffected_ref)
+
+			if chrom == 'X':
+
+				affected_males_alt = all(not variant.is_hom_ref(sample) for sample in affected if sample in self.males)
+				affected_females_het = all(variant.is_het(sample) or variant.is_missing(sample) for sample in affected if sample not in self.males)
+
+				self.assertEqual(variant.matches_x_dominant(), affected_males_alt and affected_females_het and unaffected_ref)
+
+
+class TestDenovoCache(unittest.TestCase):
+
+	def setUp(self):
+
+		dad = FamilyMember('dad', 'FAM001', 1, False)
+		mum = FamilyMember('mum', 'FAM001', 2, False)
+		proband = FamilyMember('proband', 'FAM001', 1, True, dad=dad, mum=mum)
+		self.my_family = Family('FAM001')
+		self.my_family.add_family_member(dad)
+		self.my_family.add_family_member(mum)
+		self.my_family.add_family_member(proband)
+		self.my_family.set_proband(proband.get_id())
+
+	def test_denovo_cached_per_threshold(self):
+
+		variant = Variant(chrom='2', pos=10, ref='G', alt='A')
+		variant.add_family(self.my_family)
+		variant.add_genotype('dad', ['G', 'G'], [40, 0], 99, 40)
+		variant.add_genotype('mum', ['G', 'G'], [40, 1], 99, 41)
+		variant.add_genotype('proband', ['G', 'A'], [20, 20], 99, 40)
+
+		self.assertEqual(variant.get_alt_ref_ratio('mum'), 1 / 40)
+		self.assertEqual(variant.matches_denovo(), True)
+		self.assertEqual(variant.matches_denovo(max_parental_alt_ref_ratio=0.01), False)
+		self.assertEqual(len(variant.denovo_cache), 2)
+
+		variant.add_genotype('dad', ['G', 'A'], [20, 20], 99, 40)
+
+		self.assertEqual(variant.denovo_cache, {})
+		self.assertEqual(variant.matches_denovo(), False)
+
+
+class TestFusedInheritanceModels(unittest.TestCase):
+
+	def get_expected_models(self, variant, compound_het_dict):
+
+		# Works the models out one sample at a time straight from the genotype lists rather than through the Variant
+		# predicates or masks so it does not share any code with the fused evaluation.
+		members = variant.family.family_members
+		proband = [member for member in members if member.proband == True][0]
+
+		def alt_count(member):
+
+			return variant.genotypes[member.get_id()]['genotype'].count(variant.alt)
+
+		def is_missing(member):
+
+			return variant.genotypes[member.get_id()]['genotype'].count('.') == 2
+
+		def is_hom_ref(member):
+
+			return variant.genotypes[member.get_id()]['genotype'].count(variant.ref) == 2
+
+		def passes_quality(member, min_gq, min_dp):
+
+			genotype_data = variant.genotypes[member.get_id()]
+
+			return genotype_data['genotype_quality'] >= min_gq and genotype_data['depth'] >= min_dp
+
+		def alt_ref_ratio(member):
+
+			ref_reads, alt_reads = variant.genotypes[member.get_id()]['allele_depths']
+
+			if ref_reads == 0:
+
+				return 0
+
+			return alt_reads / ref_reads
+
+		affected = [member for member in members if member.affected == True]
+		unaffected = [member for member in members if member.affected == False]
+
+		autosomal = variant.chrom not in ['X', 'Y', 'MT', 'M']
+
+		mum = proband.mum
+		dad = proband.dad
+
+		expected = []
+
+		# autosomal_dominant
+		if (autosomal and
+			all(alt_count(member) == 1 or is_missing(member) for member in affected) and
+			all(alt_count(member) == 0 for member in unaffected)):
+
+			expected.append('autosomal_dominant')
+
+		# autosomal_reccessive
+		if (autosomal and
+			all(alt_count(member) == 2 or is_missing(member) for member in affected) and
+			all(alt_count(member) != 2 for member in unaffected)):
+
+			expected.append('autosomal_reccessive')
+
+		# x_reccessive
+		x_reccessive = variant.chrom == 'X'
+
+		for member in members:
+
+			if member.sex == 2 and member.affected == True and alt_count(member) != 2 and is_missing(member) == False:
+
+				x_reccessive = False
+
+			elif member.sex == 2 and member.affected == False and alt_count(member) == 2:
+
+				x_reccessive = False
+
+			elif member.sex == 1 and member.affected == True and is_hom_ref(member) and is_missing(member) == False:
+
+				x_reccessive = False
+
+			elif member.sex == 1 and member.affected == False and alt_count(member) > 0:
+
+				x_reccessive = False
+
+		if x_reccessive:
+
+			expected.append('x_reccessive')
+
+		# x_dominant
+		x_dominant = variant.chrom == 'X'
+
+		for member in members:
+
+			if member.sex == 1 and member.affected == True:
+
+				for child in members:
+
+					if child.dad == member or child.mum == member:
+
+						if child.sex == 2 and child.affected == False:
+
+							x_dominant = False
+
+						elif child.sex == 1 and child.affected == True:
+
+							x_dominant = False
+
+				if is_hom_ref(member) and is_missing(member) == False:
+
+					x_dominant = False
+
+			elif member.sex == 2 and member.affected == True and alt_count(member) != 1 and is_missing(member) == False:
+
+				x_dominant = False
+
+			if member.affected == False and alt_count(member) > 0:
+
+				x_dominant = False
+
+		if x_dominant:
+
+			expected.append('x_dominant')
+
+		# de_novo
+		if (alt_count(proband) > 0 and mum != None and dad != None and
+			alt_count(mum) == 0 and passes_quality(mum, 30, 10) and alt_ref_ratio(mum) <= 0.04 and
+			alt_count(dad) == 0 and passes_quality(dad, 30, 10) and alt_ref_ratio(dad) < 0.04):
+
+			expected.append('de_novo')
+
+		# uniparental_isodisomy
+		if (mum != None and dad != None and alt_count(proband) == 2 and
+			passes_quality(mum, 30, 10) and passes_quality(dad, 30, 10)):
+
+			if autosomal and ((alt_count(mum) == 1 and alt_count(dad) == 0) or (alt_count(dad) == 1 and alt_count(mum) == 0)):
+
+				expected.append('uniparental_isodisomy')
+
+			elif variant.chrom == 'X' and proband.sex == 2 and alt_count(dad) == 0 and alt_count(mum) in [0, 1]:
+
+				expected.append('uniparental_isodisomy')
+
+		if variant.chrom in ['MT', 'M']:
+
+			expected.append('mitochrondrial')
+
+		if variant.chrom == 'Y':
+
+			expected.append('y_chrom')
+
+		if variant.variant_id in compound_het_dict:
+
+			expected.append('compound_het')
+
+		return expected
+
+	def test_fused_matches_individual_models(self):
+
+		random.seed(36)
+
+		genotypes = [['G', 'G'], ['G', 'A'], ['A', 'A'], ['.', '.'], ['A', '.']]
+
+		models_seen = set()
+
+		for i in range(300):
+
+			my_family = Family('FAM001')
+
+			if random.random() < 0.2:
+
+				proband = FamilyMember('proband', 'FAM001', random.choice([1, 2]), True)
+				my_family.add_family_member(proband)
+
+			else:
+
+				dad = FamilyMember('dad', 'FAM001', 1, random.choice([True, False]))
+				mum = FamilyMember('mum', 'FAM001', 2, random.choice([True, False]))
+				proband = FamilyMember('proband', 'FAM001', random.choice([1, 2]), True, dad=dad, mum=mum)
+				my_family.add_family_member(dad)
+				my_family.add_family_member(mum)
+				my_family.add_family_member(proband)
+
+				for j in range(random.randint(0, 2)):
+
+					my_family.add_family_member(FamilyMember(f'sib{j}', 'FAM001', random.choice([1, 2]), random.choice([True, False]), dad=dad, mum=mum))
+
+			my_family.set_proband(proband.get_id())
+
+			for j in range(20):
+
+				variant = Variant(chrom=random.choice(['2', 'X', 'Y', 'MT']), pos=10, ref='G', alt='A')
+				variant.add_family(my_family)
+
+				for family_member_id in my_family.get_all_family_member_ids():
+
+					variant.add_genotype(family_member_id,
+										 list(random.choice(genotypes)),
+										 [random.randint(0, 40), random.choice([0, 0, 1, 10])],
+										 random.choice([10, 30, 99]),
+										 random.choice([5, 10, 30]))
+
+				compound_het_dict = random.choice([{}, {variant.variant_id: None}])
+
+				expected = self.get_expected_models(variant, compound_het_dict)
+
+				self.assertEqual(variant.get_matching_inheritance_models(compound_het_dict), expected)
+
+				models_seen.update(expected)
+
+		# Every model is exercised by the random families.
+		self.assertEqual(models_seen, {'autosomal_dominant', 'autosomal_reccessive', 'x_reccessive', 'x_dominant', 'de_novo',
+									   'uniparental_isodisomy', 'mitochrondrial', 'y_chrom', 'compound_het'})
+
+
+class TestInheritanceCache(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.variant_set = VariantSet()
+		self.variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			self.variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+	def test_to_df_reuses_models(self):
+
+		self.variant_set.get_candidate_compound_hets(feature_key='SYMBOL')
+		self.variant_set.get_unfiltered_compound_hets_as_dict()
+
+		df = self.variant_set.to_df()
+
+		self.assertEqual(len(self.variant_set.inheritance_cache), 1)
+
+		models_dict = list(self.variant_set.inheritance_cache.values())[0]
+
+		self.assertEqual(len(models_dict), len(self.variant_set.variant_dict))
+		self.assertIn('compound_het', models_dict['1:100G>A'])
+
+		df_again = self.variant_set.to_df()
+
+		self.assertIs(list(self.variant_set.inheritance_cache.values())[0], models_dict)
+		self.assertEqual(list(df['inheritance_models']), list(df_again['inheritance_models']))
+
+		self.variant_set.to_df(lenient=True)
+
+		self.assertEqual(len(self.variant_set.inheritance_cache), 2)
+
+	def test_cache_cleared_with_compound_hets(self):
+
+		self.variant_set.to_df()
+
+		self.assertNotIn('compound_het', self.variant_set.get_variant_inheritance_models('1:100G>A'))
+
+		self.variant_set.get_candidate_compound_hets(feature_key='SYMBOL')
+		self.variant_set.get_unfiltered_compound_hets_as_dict()
+
+		self.assertEqual(self.variant_set.inheritance_cache, {})
+		self.assertIn('compound_het', self.variant_set.get_variant_inheritance_models('1:100G>A'))
+
+
+class TestNormalisedExport(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.variant_set = VariantSet()
+		self.variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			self.variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+		self.tmp_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+
+		shutil.rmtree(self.tmp_dir)
+
+	def test_normalised_dfs(self):
+
+		dfs = self.variant_set.to_normalised_dfs()
+
+		self.assertEqual(len(dfs['variants']), 5)
+		self.assertEqual(len(dfs['genotypes']), 15)
+		self.assertEqual(len(dfs['transcripts']), 6)
+		self.assertEqual(len(dfs['transcripts']), len(self.variant_set.to_df()))
+
+		variant_key = dfs['variants'].set_index('variant_id').loc['2:600G>GA', 'variant_key']
+		genotypes = dfs['genotypes'][dfs['genotypes']['variant_key'] == variant_key].set_index('sample')
+
+		self.assertEqual(genotypes.loc['proband', 'genotype'], 'G/GA')
+		self.assertEqual(genotypes.loc['mum', 'genotype'], 'G/G')
+		self.assertIn('SYMBOL', dfs['transcripts'].columns)
+		self.assertNotIn('proband_GT', dfs['variants'].columns)
+
+	def test_write_sqlite(self):
+
+		db_path = os.path.join(self.tmp_dir, 'FAM001.db')
+
+		self.variant_set.write_normalised_tables(db_path, chunk_size=2)
+
+		connection = sqlite3.connect(db_path)
+
+		counts = {table_name: connection.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0] for table_name in ['variants', 'genotypes', 'transcripts']}
+
+		genes = connection.execute("""SELECT DISTINCT t.SYMBOL FROM variants v
+									   JOIN transcripts t ON t.variant_key = v.variant_key
+									   WHERE v.chromosome = '1'""").fetchall()
+
+		connection.close()
+
+		self.assertEqual(counts, {'variants': 5, 'genotypes': 15, 'transcripts': 6})
+		self.assertEqual(genes, [('GENEA',)])
+
+	def test_write_parquet(self):
+
+		try:
+
+			import pyarrow
+
+		except ImportError:
+
+			self.skipTest('pyarrow is not installed.')
+
+		output_prefix = os.path.join(self.tmp_dir, 'FAM001')
+
+		self.variant_set.write_normalised_tables(output_prefix, output_format='parquet', chunk_size=2)
+
+		variants = pd.read_parquet(f'{output_prefix}.variants.parquet')
+		genotypes = pd.read_parquet(f'{output_prefix}.genotypes.parquet')
+
+		self.assertEqual(list(variants['variant_key']), list(range(5)))
+		self.assertEqual(len(genotypes), 15)
+
+	def test_write_parquet_mixed_info_types(self):
+
+		try:
+
+			import pyarrow.parquet as pq
+
+		except ImportError:
+
+			self.skipTest('pyarrow is not installed.')
+
+		# An INFO field with Number=. can have one value for some variants and several for others.
+		for value, variant in zip([3, (1, 2), None, 4, (5, 6, 7)], self.variant_set.variant_dict.values()):
+
+			variant.info_annotations['MIXED'] = value
+
+		output_prefix = os.path.join(self.tmp_dir, 'FAM001')
+
+		self.variant_set.write_normalised_tables(output_prefix, output_format='parquet', chunk_size=2)
+
+		variants = pq.read_table(f'{output_prefix}.variants.parquet')
+
+		self.assertEqual(variants.schema.field('info_MIXED').type, 'string')
+		self.assertEqual(variants.column('info_MIXED').to_pylist(), ['3', '1,2', None, '4', '5,6,7'])
+
+	def test_unknown_format(self):
+
+		with self.assertRaises(ValueError):
+
+			self.variant_set.write_normalised_tables(os.path.join(self.tmp_dir, 'FAM001'), output_format='csv')
+
+
+class TestSQLiteStorage(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.tmp_dir = tempfile.mkdtemp()
+		self.db_path = os.path.join(self.tmp_dir, 'FAM001.db')
+
+		self.memory_set = VariantSet()
+		self.memory_set.add_family(self.my_family)
+
+		self.sqlite_set = VariantSet()
+		self.sqlite_set.add_family(self.my_family)
+		self.sqlite_set.use_sqlite_storage(self.db_path)
+
+		for variant_set in [self.memory_set, self.sqlite_set]:
+
+			with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+				variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+	def tearDown(self):
+
+		self.sqlite_set.storage.close()
+		shutil.rmtree(self.tmp_dir)
+
+	def test_same_variants(self):
+
+		self.assertEqual(list(self.sqlite_set.variant_dict), list(self.memory_set.variant_dict))
+
+		for variant_id, variant in self.sqlite_set.variant_dict.items():
+
+			memory_variant = self.memory_set.variant_dict[variant_id]
+
+			self.assertEqual(variant.genotypes, memory_variant.genotypes)
+			self.assertEqual(variant.transcript_annotations, memory_variant.transcript_annotations)
+			self.assertEqual(variant.info_annotations, memory_variant.info_annotations)
+
+		self.assertTrue(self.memory_set.to_df().equals(self.sqlite_set.to_df()))
+
+	def test_compound_het_query(self):
+
+		for feature_key in ['SYMBOL', 'Feature']:
+
+			self.memory_set.get_candidate_compound_hets(feature_key=feature_key)
+			self.sqlite_set.get_candidate_compound_hets(feature_key=feature_key)
+
+			memory_candidates = {gene: [variant.variant_id for variant in variants] for gene, variants in self.memory_set.candidate_compound_het_dict.items()}
+			sqlite_candidates = {gene: [variant.variant_id for variant in variants] for gene, variants in self.sqlite_set.candidate_compound_het_dict.items()}
+
+			self.assertEqual(sqlite_candidates, memory_candidates)
+
+			if feature_key == 'SYMBOL':
+
+				self.assertEqual(set(sqlite_candidates['GENEA']), {'1:100G>A', '1:200C>T'})
+
+	def test_compound_het_query_follows_proband(self):
+
+		for family_member in self.my_family.family_members:
+
+			if family_member.get_id() == 'mum':
+
+				family_member.affected = True
+
+		self.my_family.set_proband('mum')
+
+		self.memory_set.get_candidate_compound_hets(feature_key='SYMBOL')
+		self.sqlite_set.get_candidate_compound_hets(feature_key='SYMBOL')
+
+		memory_candidates = {gene: [variant.variant_id for variant in variants] for gene, variants in self.memory_set.candidate_compound_het_dict.items()}
+		sqlite_candidates = {gene: [variant.variant_id for variant in variants] for gene, variants in self.sqlite_set.candidate_compound_het_dict.items()}
+
+		self.assertEqual(sqlite_candidates, memory_candidates)
+		self.assertNotIn('1:200C>T', sqlite_candidates.get('GENEA', []))
+
+	def test_variant_cache(self):
+
+		variant = self.sqlite_set.variant_dict['1:200C>T']
+
+		variant.get_filter_context()
+
+		# The same Variant is returned so its caches are kept.
+		self.assertIs(self.sqlite_set.variant_dict['1:200C>T'], variant)
+		self.assertNotEqual(self.sqlite_set.variant_dict['1:200C>T'].filter_context, None)
+
+		self.sqlite_set.storage.cache_size = 2
+
+		list(self.sqlite_set.variant_dict.values())
+
+		self.assertEqual(len(self.sqlite_set.storage.variant_cache), 2)
+		self.assertIsNot(self.sqlite_set.variant_dict['1:200C>T'], variant)
+
+		self.sqlite_set.storage.cache_size = 0
+		self.sqlite_set.storage.variant_cache.clear()
+
+		self.assertIsNot(self.sqlite_set.variant_dict['1:200C>T'], self.sqlite_set.variant_dict['1:200C>T'])
+
+	def test_empty_transcript_annotations(self):
+
+		variant = Variant(chrom='3', pos=10, ref='G', alt='A')
+		variant.add_family(self.my_family)
+
+		for family_member_id in self.my_family.get_all_family_member_ids():
+
+			variant.add_genotype(family_member_id, ['G', 'A'], [10, 10], 99, 20)
+
+		variant.add_transcript_annotations([])
+
+		self.sqlite_set.add_variant(variant)
+
+		self.sqlite_set.storage.variant_cache.clear()
+
+		self.assertEqual(self.sqlite_set.variant_dict['3:10G>A'].transcript_annotations, [])
+
+		del self.sqlite_set.variant_dict['3:10G>A']
+
+		variant.transcript_annotations = None
+
+		self.sqlite_set.add_variant(variant)
+
+		self.sqlite_set.storage.variant_cache.clear()
+
+		self.assertEqual(self.sqlite_set.variant_dict['3:10G>A'].transcript_annotations, None)
+
+	def test_filter_and_reopen(self):
+
+		self.sqlite_set.filter_variants(lambda variant: variant.chrom == '1', ())
+
+		self.assertEqual(list(self.sqlite_set.variant_dict), ['1:100G>A', '1:200C>T'])
+
+		self.sqlite_set.storage.close()
+
+		reopened_set = VariantSet()
+		reopened_set.add_family(self.my_family)
+		reopened_set.use_sqlite_storage(self.db_path)
+
+		self.assertEqual(len(reopened_set.variant_dict), 2)
+		self.assertIn('1:200C>T', reopened_set.variant_dict)
+
+		self.sqlite_set = reopened_set
+
+
+class TestGenotypeMatrix(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.tmp_dir = tempfile.mkdtemp()
+
+		with self.assertLogs('pyvariantfilter.genotype_matrix', level='WARNING'):
+
+			self.genotype_matrix = build_genotype_matrix('test_data/FAM001.trio.vcf.gz', self.tmp_dir, chunk_size=2)
+
+	def tearDown(self):
+
+		shutil.rmtree(self.tmp_dir)
+
+	def read_vcf(self, **kwargs):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', **kwargs)
+
+		return variant_set
+
+	def test_matrix_shape(self):
+
+		self.assertEqual(self.genotype_matrix.samples, ['proband', 'mum', 'dad'])
+		self.assertEqual(self.genotype_matrix.gt.shape, (len(self.genotype_matrix), 3, 2))
+		self.assertEqual(list(self.genotype_matrix.contigs), ['1', '2', 'X', 'M'])
+		self.assertEqual(self.genotype_matrix.get_site(0)['pos'], 100)
+
+	def test_same_as_vcf(self):
+
+		for proband_variants_only in [True, False]:
+
+			vcf_set = self.read_vcf(proband_variants_only=proband_variants_only)
+
+			matrix_set = VariantSet()
+			matrix_set.add_family(self.my_family)
+			matrix_set.enable_stats()
+			matrix_set.read_variants_from_genotype_matrix(self.tmp_dir, proband_variants_only=proband_variants_only, chunk_size=2)
+
+			self.assertEqual(list(matrix_set.variant_dict), list(vcf_set.variant_dict))
+
+			for variant_id, variant in matrix_set.variant_dict.items():
+
+				vcf_variant = vcf_set.variant_dict[variant_id]
+
+				self.assertEqual(variant.genotypes, vcf_variant.genotypes)
+				self.assertEqual(variant.transcript_annotations, vcf_variant.transcript_annotations)
+				self.assertEqual(variant.info_annotations, vcf_variant.info_annotations)
+				self.assertEqual(list(variant.filter_status), list(vcf_variant.filter_status))
+				self.assertEqual(variant.quality, vcf_variant.quality)
+
+		self.assertEqual(matrix_set.stats.get_stage('ingest').records_read, len(self.genotype_matrix))
+
+	def test_regions(self):
+
+		matrix_set = VariantSet()
+		matrix_set.add_family(self.my_family)
+		matrix_set.read_variants_from_genotype_matrix(self.genotype_matrix, regions=[('chr1', 150, 250), ('2', 0, 1000)])
+
+		self.assertEqual(list(matrix_set.variant_dict), ['1:200C>T', '2:600G>GA'])
+
+	def test_multiallelic_same_as_vcf(self):
+
+		matrix_dir = os.path.join(self.tmp_dir, 'multiallelic')
+
+		genotype_matrix = build_genotype_matrix('test_data/FAM001.multiallelic.vcf.gz', matrix_dir, chunk_size=2)
+
+		self.assertEqual(genotype_matrix.get_site(1)['alt'], 'T')
+
+		for proband_variants_only in [True, False]:
+
+			vcf_set = VariantSet()
+			vcf_set.add_family(self.my_family)
+			vcf_set.read_variants_from_vcf('test_data/FAM001.multiallelic.vcf.gz', proband_variants_only=proband_variants_only)
+
+			matrix_set = VariantSet()
+			matrix_set.add_family(self.my_family)
+			matrix_set.read_variants_from_genotype_matrix(genotype_matrix, proband_variants_only=proband_variants_only)
+
+			self.assertEqual(list(matrix_set.variant_dict), list(vcf_set.variant_dict))
+
+			for variant_id, variant in matrix_set.variant_dict.items():
+
+				vcf_variant = vcf_set.variant_dict[variant_id]
+
+				self.assertEqual(variant.genotypes, vcf_variant.genotypes)
+				self.assertEqual(variant.transcript_annotations, vcf_variant.transcript_annotations)
+				self.assertEqual(variant.info_annotations, vcf_variant.info_annotations)
+
+	def test_changed_vcf(self):
+
+		vcf_file = os.path.join(self.tmp_dir, 'FAM001.vcf.gz')
+		matrix_dir = os.path.join(self.tmp_dir, 'matrix')
+
+		shutil.copy('test_data/FAM001.multiallelic.vcf.gz', vcf_file)
+
+		genotype_matrix = build_genotype_matrix(vcf_file, matrix_dir)
+
+		genotype_matrix.check_vcf()
+
+		# Regenerate the VCF after the matrix was built.
+		shutil.copy('test_data/FAM001.trio.vcf.gz', vcf_file)
+
+		matrix_set = VariantSet()
+		matrix_set.add_family(self.my_family)
+
+		with self.assertRaises(ValueError):
+
+			matrix_set.read_variants_from_genotype_matrix(matrix_dir)
+
+		matrix_set.read_variants_from_genotype_matrix(matrix_dir, check_vcf=False)
+
+		self.assertEqual(len(matrix_set.variant_dict), 4)
+
+	def test_get_block(self):
+
+		rows = np.arange(1, 4)
+
+		block = self.genotype_matrix.get_block('dp', rows, [1, 2])
+
+		self.assertTrue(np.shares_memory(block, self.genotype_matrix.dp))
+		self.assertEqual(block.tolist(), self.genotype_matrix.dp[1:4, 1:3].tolist())
+		self.assertEqual(self.genotype_matrix.get_block('dp', rows, [2, 0]).tolist(), self.genotype_matrix.dp[1:4][:, [2, 0]].tolist())
+		self.assertEqual(self.genotype_matrix.get_block('gt', np.array([0, 2]), [2, 1]).tolist(), self.genotype_matrix.gt[[0, 2]][:, [2, 1]].tolist())
+
+	def test_missing_sample(self):
+
+		my_family = Family('FAM002')
+		my_family.add_family_member(FamilyMember('other', 'FAM002', 1, True))
+		my_family.set_proband('other')
+
+		matrix_set = VariantSet()
+		matrix_set.add_family(my_family)
+
+		with self.assertRaises(ValueError):
+
+			matrix_set.read_variants_from_genotype_matrix(self.genotype_matrix)
+
+
+class TestBatchNumericalFilter(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+	def get_variant_set(self, proband_variants_only=True):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', proband_variants_only=proband_variants_only)
+
+		variant_set.get_candidate_compound_hets(feature_key='SYMBOL')
+		variant_set.get_unfiltered_compound_hets_as_dict()
+
+		return variant_set
+
+	def test_same_as_filter_variants(self):
+
+		random.seed(41)
+
+		functions = {('transcript', 'gte'): Variant.filter_on_numerical_transcript_annotation_gte,
+					 ('transcript', 'lte'): Variant.filter_on_numerical_transcript_annotation_lte,
+					 ('info', 'gte'): Variant.filter_on_numerical_info_annotation_gte,
+					 ('info', 'lte'): Variant.filter_on_numerical_info_annotation_lte}
+
+		annotation_keys = {'transcript': 'gnomAD_AF', 'info': 'AC'}
+
+		for i in range(50):
+
+			annotation_type, comparison = random.choice(list(functions))
+
+			thresholds = [random.choice([0, 0.001, 0.01, 0.5, 1, 2]) for j in range(8)]
+
+			batch_set = self.get_variant_set()
+			function_set = self.get_variant_set()
+
+			batch_set.filter_on_numerical_annotation(annotation_keys[annotation_type], *thresholds,
+													 annotation_type=annotation_type,
+													 comparison=comparison,
+													 compound_het_dict=batch_set.final_compound_hets)
+
+			function_set.filter_variants(functions[(annotation_type, comparison)], (annotation_keys[annotation_type], *thresholds, ['.', '', None], 'min', function_set.final_compound_hets))
+
+			self.assertEqual(list(batch_set.variant_dict), list(function_set.variant_dict))
+
+	def test_filters_in_place(self):
+
+		variant_set = self.get_variant_set()
+		variant_set.enable_stats()
+
+		variant_dict = variant_set.variant_dict
+		variant_index = variant_set.get_variant_index()
+
+		variant_set.filter_on_numerical_annotation('gnomAD_AF', 0, 0, 0, 0, 0, 0, 0, 0, comparison='lte')
+
+		self.assertIs(variant_set.variant_dict, variant_dict)
+		self.assertEqual(list(variant_dict), ['2:600G>GA', 'M:50A>G'])
+		self.assertEqual(len(variant_index), len(variant_dict))
+		self.assertEqual(variant_set.stats.get_stage('filter_variants').records_read, 5)
+
+	def test_proband_hom_ref(self):
+
+		variant_set = self.get_variant_set(proband_variants_only=False)
+
+		with self.assertRaises(ValueError):
+
+			variant_set.filter_on_numerical_annotation('gnomAD_AF', 1, 1, 1, 1, 1, 1, 1, 1)
+
+
+class TestFilterContext(unittest.TestCase):
+
+	def get_expected_context(self, variant, proband, compound_het_dict):
+
+		proband_id = proband.get_id()
+
+		if variant.variant_id in compound_het_dict:
+
+			return 'compound_het'
+
+		elif variant.chrom not in ['X', 'Y', 'MT', 'M'] and variant.is_het(proband_id):
+
+			return 'ad_het'
+
+		elif variant.chrom not in ['X', 'Y', 'MT', 'M'] and variant.is_hom_alt(proband_id):
+
+			return 'ad_hom_alt'
+
+		elif variant.chrom == 'X' and proband.sex == 1 and variant.has_alt(proband_id):
+
+			return 'x_male'
+
+		elif variant.chrom == 'X' and proband.sex == 2 and variant.is_het(proband_id):
+
+			return 'x_female_het'
+
+		elif variant.chrom == 'X' and proband.sex == 2 and variant.is_hom_alt(proband_id):
+
+			return 'x_female_hom'
+
+		elif variant.chrom == 'Y':
+
+			return 'y'
+
+		elif variant.chrom == 'MT' or variant.chrom == 'M':
+
+			return 'mt'
+
+		return None
+
+	def test_context_matches_if_chain(self):
+
+		random.seed(42)
+
+		genotypes = [['G', 'G'], ['G', 'A'], ['A', 'A'], ['.', '.'], ['A', '.']]
+
+		for sex in [1, 2]:
+
+			proband = FamilyMember('proband', 'FAM001', sex, True)
+			my_family = Family('FAM001')
+			my_family.add_family_member(proband)
+			my_family.set_proband('proband')
+
+			for i in range(100):
+
+				variant = Variant(chrom=random.choice(['2', 'X', 'Y', 'MT']), pos=10, ref='G', alt='A')
+				variant.add_family(my_family)
+				variant.add_genotype('proband', list(random.choice(genotypes)), [10, 10], 99, 30)
+
+				compound_het_dict = random.choice([{}, {variant.variant_id: None}])
+
+				self.assertEqual(variant.get_filter_context(compound_het_dict), self.get_expected_context(variant, proband, compound_het_dict))
+
+	def test_context_cached(self):
+
+		proband = FamilyMember('proband', 'FAM001', 2, True)
+		my_family = Family('FAM001')
+		my_family.add_family_member(proband)
+		my_family.set_proband('proband')
+
+		variant = Variant(chrom='X', pos=10, ref='G', alt='A')
+		variant.add_family(my_family)
+		variant.add_genotype('proband', ['G', 'A'], [10, 10], 99, 30)
+		variant.add_transcript_annotations([{'gnomAD_AF': '0.01'}])
+
+		self.assertEqual(variant.filter_on_numerical_transcript_annotation_lte('gnomAD_AF', 0, 0, 0, 0.02, 0, 0, 0, 0), True)
+		self.assertEqual(variant.filter_context, ('proband', 'x_female_het'))
+		self.assertEqual(variant.filter_on_numerical_transcript_annotation_gte('gnomAD_AF', 0, 0, 0, 0.02, 0, 0, 0, 0), False)
+
+		variant.add_genotype('proband', ['G', 'G'], [10, 0], 99, 30)
+
+		self.assertEqual(variant.filter_context, None)
+
+		with self.assertRaises(ValueError):
+
+			variant.filter_on_numerical_transcript_annotation_gte('gnomAD_AF', 0, 0, 0, 0.02, 0, 0, 0, 0)
+
+		self.assertEqual(variant.filter_context, ('proband', ''))
+
+	def test_context_follows_proband(self):
+
+		with tempfile.TemporaryDirectory() as temp_dir:
+
+			ped_file_path = os.path.join(temp_dir, 'FAM001.ped')
+
+			# The same trio with mum also affected so she can be set as the proband.
+			with open(ped_file_path, 'w') as f:
+
+				f.write('FAM001\tproband\tdad\tmum\t1\t2\n')
+				f.write('FAM001\tmum\t0\t0\t2\t2\n')
+				f.write('FAM001\tdad\t0\t0\t1\t1\n')
+
+			my_family = Family('FAM001')
+			my_family.read_from_ped_file(ped_file_path, 'FAM001', 'proband')
+
+		variant_set = VariantSet()
+		variant_set.add_family(my_family)
+		variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+		x_variant = variant_set.variant_dict['X:1000C>A']
+		autosomal_variant = variant_set.variant_dict['1:200C>T']
+
+		self.assertEqual(x_variant.get_filter_context(), 'x_male')
+		self.assertEqual(autosomal_variant.get_filter_context(), 'ad_het')
+
+		my_family.set_proband('mum')
+
+		self.assertEqual(x_variant.get_filter_context(), 'x_female_het')
+		self.assertEqual(autosomal_variant.get_filter_context(), None)
+
+		self.assertEqual(x_variant.filter_on_numerical_transcript_annotation_lte('gnomAD_AF', 0, 0, 0, 1, 0, 0, 0, 0), True)
+
+		with self.assertRaises(ValueError):
+
+			autosomal_variant.filter_on_numerical_transcript_annotation_lte('gnomAD_AF', 1, 1, 1, 1, 1, 1, 1, 1)
+
+		with self.assertRaises(ValueError):
+
+			autosomal_variant.filter_on_numerical_info_annotation_gte('AC', 0, 0, 0, 0, 0, 0, 0, 0)
+
+
+class TestPhenotypePrioritisation(unittest.TestCase):
+
+	def setUp(self):
+
+		self.tmp_dir = tempfile.mkdtemp()
+		self.phen2gene_dir = os.path.join(self.tmp_dir, 'phen2gene')
+		self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+
+		os.makedirs(self.phen2gene_dir)
+
+		# A stand in for phen2gene.py which writes a gene list and records each run.
+		with open(os.path.join(self.phen2gene_dir, 'phen2gene.py'), 'w') as f:
+
+			f.write("""import os, sys
+terms = sys.argv[sys.argv.index('-m') + 1:sys.argv.index('-out')]
+out = sys.argv[sys.argv.index('-out') + 1]
+if 'HP:9999' in terms:
+	sys.exit('Unknown HPO term')
+os.makedirs(out, exist_ok=True)
+with open('runs.txt', 'a') as runs:
+	runs.write(' '.join(terms) + '\\n')
+with open(os.path.join(out, 'input_case.final_candidate_gene_list'), 'w') as gene_list:
+	gene_list.write('Rank\\tGene\\tID\\tScore\\n')
+	for i, term in enumerate(terms):
+		gene_list.write(f'{i + 1}\\tGENE{term[3:]}\\t{i}\\t{1 / (i + 1)}\\n')
+""")
+
+	def tearDown(self):
+
+		shutil.rmtree(self.tmp_dir)
+
+	def get_runs(self):
+
+		with open(os.path.join(self.phen2gene_dir, 'runs.txt')) as f:
+
+			return f.read().splitlines()
+
+	def test_cache_key_ignores_order(self):
+
+		self.assertEqual(get_cache_key('phen2gene', '1.0', ['HP:0002', 'HP:0001']), get_cache_key('phen2gene', '1.0', ['HP:0001', 'HP:0002', 'HP:0001']))
+		self.assertNotEqual(get_cache_key('phen2gene', '1.0', ['HP:0001']), get_cache_key('phen2gene', '1.1', ['HP:0001']))
+
+	def test_prioritise_and_cache(self):
+
+		hpo_term_sets = {'FAM001': ['HP:0002', 'HP:0001'],
+						 'FAM002': ['HP:0001', 'HP:0002'],
+						 'FAM003': ['HP:0003']}
+
+		tool_args = {'phen2gene_dir': self.phen2gene_dir, 'temp_dir': self.tmp_dir}
+
+		results, errors = prioritise_phenotypes(hpo_term_sets, 'phen2gene', tool_args, '1.0', max_workers=2, timeout=60, cache_dir=self.cache_dir)
+
+		self.assertEqual(errors, {})
+		self.assertEqual(results['FAM001'], {'GENE0001': '1.0', 'GENE0002': '0.5'})
+		self.assertEqual(results['FAM002'], results['FAM001'])
+		self.assertEqual(sorted(self.get_runs()), ['HP:0001 HP:0002', 'HP:0003'])
+
+		results, errors = asyncio.run(prioritise_phenotypes_async({'FAM004': ['HP:0003']}, 'phen2gene', tool_args, '1.0', cache_dir=self.cache_dir))
+
+		self.assertEqual(results['FAM004'], {'GENE0003': '1.0'})
+		self.assertEqual(len(self.get_runs()), 2)
+
+	def test_failed_run(self):
+
+		tool_args = {'phen2gene_dir': self.tmp_dir, 'temp_dir': self.tmp_dir}
+
+		results, errors = prioritise_phenotypes({'FAM001': ['HP:0001']}, 'phen2gene', tool_args, '1.0')
+
+		self.assertEqual(results, {})
+		self.assertIsInstance(errors['FAM001'], ValueError)
+
+		with self.assertRaises(ValueError):
+
+			prioritise_phenotypes({'FAM001': ['0001']}, 'phen2gene', tool_args, '1.0')
+
+	def test_phenolyzer_jobs_do_not_remove_each_others_files(self):
+
+		phenolyzer_script = os.path.join(self.tmp_dir, 'disease_annotation.py')
+		temp_dir = os.path.join(self.tmp_dir, 'phenolyzer_temp')
+
+		os.makedirs(temp_dir)
+
+		# A stand in for Phenolyzer. FAM10 keeps running after writing its output so FAM1 finishes first.
+		with open(phenolyzer_script, 'w') as f:
+
+			f.write("""import sys, time
+terms = sys.argv[1].split(';')
+out = sys.argv[sys.argv.index('-out') + 1]
+with open(out + '.final_gene_list', 'w') as gene_list:
+	gene_list.write('Rank\\tGene\\tID\\tScore\\n')
+	gene_list.write(f'1\\tGENE{terms[0][3:]}\\t1\\t1.0\\n')
+if 'HP:0010' in terms:
+	time.sleep(1)
+""")
+
+		tool_args = {'perl_executable': sys.executable, 'phenolyzer_script': phenolyzer_script, 'temp_dir': temp_dir}
+
+		results, errors = prioritise_phenotypes({'FAM1': ['HP:0001'], 'FAM10': ['HP:0010']}, 'phenolyzer', tool_args, '1.0', max_workers=2)
+
+		self.assertEqual(errors, {})
+		self.assertEqual(results, {'FAM1': {'GENE0001': '1.0'}, 'FAM10': {'GENE0010': '1.0'}})
+		self.assertEqual(os.listdir(temp_dir), [])
+
+	def test_phen2gene_output_in_temp_dir(self):
+
+		temp_dir = os.path.join(self.tmp_dir, 'phen2gene_temp')
+
+		os.makedirs(temp_dir)
+
+		tool_args = {'phen2gene_dir': self.phen2gene_dir, 'temp_dir': temp_dir}
+
+		results, errors = prioritise_phenotypes({'FAM001': ['HP:0001']}, 'phen2gene', tool_args, '1.0')
+
+		self.assertEqual(results, {'FAM001': {'GENE0001': '1.0'}})
+		self.assertEqual(os.listdir(temp_dir), [])
+		self.assertFalse(os.path.exists(os.path.join(self.phen2gene_dir, 'temp')))
+
+	def test_failed_run_keeps_other_results(self):
+
+		hpo_term_sets = {'FAM001': ['HP:0001'],
+						 'FAM002': ['HP:9999', 'HP:0002'],
+						 'FAM003': ['HP:0002', 'HP:9999']}
+
+		tool_args = {'phen2gene_dir': self.phen2gene_dir, 'temp_dir': self.tmp_dir}
+
+		results, errors = prioritise_phenotypes(hpo_term_sets, 'phen2gene', tool_args, '1.0', cache_dir=self.cache_dir)
+
+		self.assertEqual(results, {'FAM001': {'GENE0001': '1.0'}})
+		self.assertEqual(sorted(errors), ['FAM002', 'FAM003'])
+		self.assertIsInstance(errors['FAM002'], ValueError)
+
+		# The failed phenotype set is not cached so it is run again.
+		results, errors = prioritise_phenotypes(hpo_term_sets, 'phen2gene', tool_args, '1.0', cache_dir=self.cache_dir)
+
+		self.assertEqual(self.get_runs(), ['HP:0001'])
+		self.assertEqual(sorted(errors), ['FAM002', 'FAM003'])
+
+	def test_cancelled_run_is_killed(self):
+
+		pid_file = os.path.join(self.tmp_dir, 'pid.txt')
+
+		command = [sys.executable, '-c', f'import os, time\nopen({pid_file!r}, "w").write(str(os.getpid()))\ntime.sleep(60)']
+
+		async def run_and_cancel():
+
+			task = asyncio.ensure_future(run_command_async(command))
+
+			while not os.path.exists(pid_file) or os.path.getsize(pid_file) == 0:
+
+				await asyncio.sleep(0.05)
+
+			task.cancel()
+
+			with self.assertRaises(asyncio.CancelledError):
+
+				await task
+
+		asyncio.run(run_and_cancel())
+
+		with open(pid_file) as f:
+
+			pid = int(f.read())
+
+		# The child has been killed and reaped.
+		with self.assertRaises(ProcessLookupError):
+
+			os.kill(pid, 0)
+
+
+class TestHPOGeneScorer(unittest.TestCase):
+
+	def setUp(self):
+
+		self.tmp_dir = tempfile.mkdtemp()
+
+		with open(os.path.join(self.tmp_dir, 'hpo_genes.tsv'), 'w') as f:
+
+			f.write('hpo\tgene\tscore\n')
+			f.write('HP:0001250\tSCN1A\t1.0\n')
+			f.write('HP:0001250\tKCNQ2\t0.5\n')
+			f.write('HP:0001250\tKCNQ2\t0.25\n')
+			f.write('HP:0001263\tSCN1A\t0.5\n')
+			f.write('HP:0001263\tMECP2\t1.0\n')
+
+		self.kb_dir = os.path.join(self.tmp_dir, 'Knowledgebase')
+
+		os.makedirs(self.kb_dir)
+
+		with open(os.path.join(self.kb_dir, 'HP_0001250.candidate_gene_list'), 'w') as f:
+
+			f.write('Rank\tGene\tID\tScore\n')
+			f.write('1\tSCN1A\t6323\t1.0\n')
+			f.write('2\tKCNQ2\t3785\t0.5\n')
+
+	def tearDown(self):
+
+		shutil.rmtree(self.tmp_dir)
+
+	def test_score(self):
+
+		scorer = HPOGeneScorer(read_hpo_gene_table(os.path.join(self.tmp_dir, 'hpo_genes.tsv')))
+
+		self.assertEqual(len(scorer), 2)
+
+		gene_score_dict = scorer.score(['HP:0001250', 'HP:0001263'], normalise=False)
+
+		self.assertEqual(list(gene_score_dict), ['SCN1A', 'MECP2', 'KCNQ2'])
+		self.assertEqual(gene_score_dict, {'SCN1A': 1.5, 'MECP2': 1.0, 'KCNQ2': 0.5})
+
+		gene_score_dict = scorer.score(['HP:0001250', 'HP:0001263', 'HP:9999999'], term_weights={'HP:0001263': 2})
+
+		self.assertEqual(gene_score_dict, {'MECP2': 1.0, 'SCN1A': 1.0, 'KCNQ2': 0.25})
+
+		self.assertEqual(scorer.score(['HP:9999999']), {})
+
+		with self.assertRaises(ValueError):
+
+			scorer.score(['0001250'])
+
+	def test_score_batch(self):
+
+		scorer = HPOGeneScorer(read_hpo_gene_table(os.path.join(self.tmp_dir, 'hpo_genes.tsv')))
+
+		results = scorer.score_batch({'FAM001': ['HP:0001250'], 'FAM002': ['HP:0001263', 'HP:0001250'], 'FAM003': ['HP:0001250', 'HP:0001263']})
+
+		self.assertEqual(results['FAM001'], {'SCN1A': 1.0, 'KCNQ2': 0.5})
+		self.assertEqual(results['FAM002'], results['FAM003'])
+
+	def test_phen2gene_knowledgebase(self):
+
+		scorer = HPOGeneScorer(read_phen2gene_knowledgebase(self.kb_dir))
+
+		self.assertEqual(scorer.score(['HP:0001250']), {'SCN1A': 1.0, 'KCNQ2': 0.5})
+
+		scorer = HPOGeneScorer(read_phen2gene_knowledgebase(self.kb_dir, gene_column=2))
+
+		self.assertEqual(list(scorer.score(['HP:0001250'])), ['6323', '3785'])
+
+
+class TestGeneScores(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.variant_set = VariantSet()
+		self.variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			self.variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+	def test_add_gene_scores(self):
+
+		self.variant_set.variant_dict['1:200C>T'].transcript_annotations[1]['SYMBOL'] = 'GENEC'
+
+		self.variant_set.add_gene_scores({'GENEA': '0.5', 'GENEC': '0.75', 'GENEB': '1.0'})
+
+		self.assertEqual(self.variant_set.get_gene_score('1:100G>A'), 0.5)
+		self.assertEqual(self.variant_set.get_gene_score('1:200C>T'), 0.75)
+		self.assertEqual(self.variant_set.get_gene_score('2:600G>GA'), 1.0)
+		self.assertEqual(self.variant_set.get_gene_score('X:1000C>A'), None)
+
+	def test_export(self):
+
+		self.assertNotIn('gene_score', self.variant_set.to_df().columns)
+
+		self.variant_set.add_gene_scores({'GENEA': 0.5})
+
+		df = self.variant_set.to_df()
+
+		self.assertEqual(df['gene_score'].dtype, 'float64')
+		self.assertEqual(list(df[df['variant_id'] == '1:200C>T']['gene_score']), [0.5, 0.5])
+		self.assertTrue(df[df['variant_id'] == '2:600G>GA']['gene_score'].isnull().all())
+
+		variants = self.variant_set.to_normalised_dfs()['variants'].set_index('variant_id')
+
+		self.assertEqual(variants.loc['1:100G>A', 'gene_score'], 0.5)
+
+
+class TestRanking(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.variant_set = VariantSet()
+		self.variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			self.variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+	def test_select_top_k(self):
+
+		random.seed(1)
+
+		items = [{'id': i, 'value': random.randint(0, 20)} for i in range(500)]
+
+		expected = sorted(items, key=lambda item: (-item['value'], item['id']))
+
+		for k in [1, 7, 50, 1000]:
+
+			ranked = select_top_k(items, k, score_func=lambda item: item['value'])
+
+			self.assertEqual([item['id'] for item in ranked], [item['id'] for item in expected[:k]])
+			self.assertEqual([item['rank'] for item in ranked], list(range(1, min(k, 500) + 1)))
+
+		with self.assertRaises(ValueError):
+
+			select_top_k(items, 0)
+
+	def test_default_ranking(self):
+
+		ranked = self.variant_set.get_top_variants(k=3)
+
+		self.assertEqual([features['variant_id'] for features in ranked], ['2:600G>GA', 'X:1000C>A', 'M:50A>G'])
+		self.assertEqual(ranked[0]['inheritance_models'], ['autosomal_dominant', 'de_novo'])
+		self.assertEqual(ranked[1]['worst_consequence'], 'stop_gained')
+		self.assertEqual(ranked[1]['population_frequency'], 0.0001)
+
+	def test_gene_score_ranking(self):
+
+		self.variant_set.add_gene_scores({'GENEA': 0.5, 'GENED': 0.9})
+
+		ranked = self.variant_set.get_top_variants(k=2, score_func=lambda features: features['gene_score'] or 0, frequency_key=None)
+
+		self.assertEqual([features['variant_id'] for features in ranked], ['X:1000C>A', '1:100G>A'])
+		self.assertEqual(ranked[0]['population_frequency'], None)
+
+	def test_sqlite_ranking(self):
+
+		tmp_dir = tempfile.mkdtemp()
+
+		try:
+
+			variant_set = VariantSet()
+			variant_set.add_family(self.my_family)
+			variant_set.use_sqlite_storage(os.path.join(tmp_dir, 'FAM001.db'))
+
+			with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+				variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+			self.assertEqual(variant_set.get_top_variants(k=4), self.variant_set.get_top_variants(k=4))
+
+			variant_set.storage.close()
+
+		finally:
+
+			shutil.rmtree(tmp_dir)
+
+
+class TestMultiAllelic(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.variant_set = VariantSet()
+		self.variant_set.add_family(self.my_family)
+		self.variant_set.read_variants_from_vcf('test_data/FAM001.multiallelic.vcf.gz')
+
+	def test_trim_alleles(self):
+
+		self.assertEqual(trim_alleles(600, 'GTT', 'GT'), (600, 'GT', 'G'))
+		self.assertEqual(trim_alleles(600, 'GTT', 'G'), (600, 'GTT', 'G'))
+		self.assertEqual(trim_alleles(100, 'CA', 'CT'), (101, 'A', 'T'))
+		self.assertEqual(trim_alleles(100, 'G', 'A'), (100, 'G', 'A'))
+
+	def test_vep_alleles(self):
+
+		self.assertEqual(get_vep_alleles('G', ['A', 'T']), ['A', 'T'])
+		self.assertEqual(get_vep_alleles('GTT', ['G', 'GT']), ['-', 'T'])
+		self.assertEqual(get_vep_alleles('G', ['GA', 'T']), ['GA', 'T'])
+
+		transcripts = [{'Allele': 'A', 'ALLELE_NUM': '2'}, {'Allele': 'A', 'ALLELE_NUM': '1'}]
+
+		self.assertEqual(split_transcript_annotations(transcripts, 'G', ['A', 'A'], 1), [{'Allele': 'A', 'ALLELE_NUM': '1'}])
+
+	def test_split(self):
+
+		self.assertEqual(list(self.variant_set.variant_dict), ['1:100G>A', '1:100G>T', '1:300A>C', '2:600GT>G'])
+
+		variant = self.variant_set.variant_dict['1:100G>T']
+
+		self.assertEqual(variant.genotypes['proband']['genotype'], ['.', 'T'])
+		self.assertEqual(variant.genotypes['proband']['allele_depths'], [5, 7])
+		self.assertEqual(variant.genotypes['dad']['genotype'], ['G', 'T'])
+		self.assertEqual(variant.get_worst_consequence(), 'stop_gained')
+		self.assertEqual(variant.info_annotations['AC'], 1)
+
+		variant = self.variant_set.variant_dict['2:600GT>G']
+
+		self.assertEqual(variant.genotypes['proband']['genotype'], ['GT', 'G'])
+		self.assertEqual(variant.genotypes['proband']['allele_depths'], [10, 8])
+		self.assertEqual(variant.get_genes(), ['NM_0004.2'])
+		self.assertEqual(variant.is_het('proband'), True)
+
+	def test_biallelic_unchanged(self):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz')
+
+		self.assertEqual(list(variant_set.variant_dict), ['1:100G>A', '1:200C>T', '2:600G>GA', 'X:1000C>A', 'M:50A>G'])
+		self.assertEqual(len(variant_set.variant_dict['1:200C>T'].transcript_annotations), 2)
+
+
+class TestCommandLine(unittest.TestCase):
+
+	def setUp(self):
+
+		self.tmp_dir = tempfile.mkdtemp()
+		self.output_dir = os.path.join(self.tmp_dir, 'output')
+		self.ped = os.path.join(self.tmp_dir, 'families.ped')
+
+		with open('test_data/FAM001.ped') as f:
+
+			ped = f.read()
+
+		with open(self.ped, 'w') as f:
+
+			f.write(ped)
+			f.write('FAM002\tchild\tfather\tmother\t2\t2\n')
+			f.write('FAM002\tmother\t0\t0\t2\t1\n')
+			f.write('FAM002\tfather\t0\t0\t1\t1\n')
+
+	def tearDown(self):
+
+		shutil.rmtree(self.tmp_dir)
+
+	def get_summary(self):
+
+		with open(os.path.join(self.output_dir, 'run_summary.json')) as f:
+
+			return json.load(f)
+
+	def test_ped_families(self):
+
+		families = read_ped_families(self.ped)
+
+		self.assertEqual(list(families), ['FAM001', 'FAM002'])
+		self.assertEqual(get_default_proband(families['FAM001']), 'proband')
+		self.assertEqual(get_default_proband(families['FAM002']), 'child')
+
+	def test_run(self):
+
+		with self.assertLogs('pyvariantfilter', level='WARNING'):
+
+			exit_code = cli_main(['--vcf', 'test_data/FAM001.trio.vcf.gz', '--ped', self.ped, '--output', self.output_dir, '--families', 'FAM001'])
+
+		self.assertEqual(exit_code, 0)
+
+		df = pd.read_csv(os.path.join(self.output_dir, 'FAM001.tsv'), sep='\t')
+
+		self.assertEqual(sorted(set(df['variant_id'])), ['1:100G>A', '1:200C>T', 'X:1000C>A'])
+
+		summary = self.get_summary()
+
+		self.assertEqual(summary['families_completed'], 1)
+		self.assertEqual(summary['families'][0]['rows'], 4)
+		self.assertEqual(summary['config_hash'], AnalysisConfig().get_hash())
+		self.assertEqual(summary['families'][0]['import_filter_rejected']['pass_only'], 1)
+		self.assertEqual([stage['stage'] for stage in summary['families'][0]['stats']['stages']], ['ingest', 'candidate_compound_hets', 'filter_compound_hets', 'export'])
+
+	def test_parallel_run_with_failure(self):
+
+		config_path = os.path.join(self.tmp_dir, 'config.json')
+
+		with open(config_path, 'w') as f:
+
+			json.dump({'import_filter': {'pass_only': False, 'min_dp': 10}, 'output': {'matching_models_only': False}}, f)
+
+		exit_code = cli_main(['--vcf', 'test_data/FAM001.trio.vcf.gz',
+							  '--ped', self.ped,
+							  '--config', config_path,
+							  '--output', self.output_dir,
+							  '--threads', '2',
+							  '--format', 'parquet',
+							  '--regions', 'test_data/FAM001.genes.bed'])
+
+		self.assertEqual(exit_code, 1)
+
+		summary = self.get_summary()
+
+		self.assertEqual([family['status'] for family in summary['families']], ['completed', 'failed'])
+		self.assertIn('not samples in the VCF', summary['families'][1]['error'])
+
+		df = pd.read_parquet(os.path.join(self.output_dir, 'FAM001.parquet'))
+
+		self.assertIn('2:600G>GA', set(df['variant_id']))
+
+	def test_resume(self):
+
+		run_args = ['--vcf', 'test_data/FAM001.trio.vcf.gz', '--ped', self.ped, '--output', self.output_dir]
+
+		with self.assertLogs('pyvariantfilter', level='WARNING'):
+
+			self.assertEqual(cli_main(run_args), 1)
+
+		summary = self.get_summary()
+
+		self.assertEqual(summary['units_run'], 2)
+
+		with open(os.path.join(self.output_dir, 'manifest.json')) as f:
+
+			manifest = json.load(f)
+
+		self.assertEqual(manifest['units']['FAM001']['status'], 'completed')
+		self.assertEqual(len(manifest['inputs']['vcf']['sha256']), 64)
+
+		# Only the failed family is run again.
+		with self.assertLogs('pyvariantfilter', level='WARNING'):
+
+			self.assertEqual(cli_main(run_args), 1)
+
+		summary = self.get_summary()
+
+		self.assertEqual(summary['units_run'], 1)
+		self.assertEqual(summary['units_skipped'], 1)
+		self.assertEqual(summary['families'][0]['skipped'], True)
+		self.assertEqual(summary['families'][0]['rows'], 4)
+
+		# A changed config makes the completed family stale.
+		config_path = os.path.join(self.tmp_dir, 'config.json')
+
+		with open(config_path, 'w') as f:
+
+			json.dump({'import_filter': {'min_dp': 10}}, f)
+
+		with self.assertLogs('pyvariantfilter', level='WARNING'):
+
+			cli_main(run_args + ['--families', 'FAM001', '--config', config_path])
+
+		self.assertEqual(self.get_summary()['units_run'], 1)
+
+		cli_main(run_args + ['--families', 'FAM001', '--config', config_path])
+
+		self.assertEqual(self.get_summary()['units_run'], 0)
+
+		# A missing output is run again.
+		os.remove(os.path.join(self.output_dir, 'FAM001.tsv'))
+
+		with self.assertLogs('pyvariantfilter', level='WARNING'):
+
+			cli_main(run_args + ['--families', 'FAM001', '--config', config_path])
+
+		self.assertEqual(self.get_summary()['units_run'], 1)
+
+	def test_split_contigs(self):
+
+		config_path = os.path.join(self.tmp_dir, 'config.json')
+
+		with open(config_path, 'w') as f:
+
+			json.dump({'import_filter': {'pass_only': False, 'min_dp': 10}}, f)
+
+		run_args = ['--vcf', 'test_data/FAM001.trio.vcf.gz', '--ped', self.ped, '--config', config_path, '--families', 'FAM001']
+
+		with self.assertLogs('pyvariantfilter', level='WARNING'):
+
+			cli_main(run_args + ['--output', os.path.join(self.tmp_dir, 'whole')])
+
+		self.assertEqual(cli_main(run_args + ['--output', self.output_dir, '--split-contigs', '--threads', '2']), 0)
+
+		summary = self.get_summary()
+
+		self.assertEqual([unit['family_id'] for unit in summary['families']], ['FAM001'])
+		self.assertEqual(summary['units_run'], 4)
+
+		expected = pd.read_csv(os.path.join(self.tmp_dir, 'whole', 'FAM001.tsv'), sep='\t', dtype=str, keep_default_na=False)
+		df = pd.read_csv(os.path.join(self.output_dir, 'FAM001.tsv'), sep='\t', dtype=str, keep_default_na=False)
+
+		self.assertEqual(list(df['variant_id']), list(expected['variant_id']))
+		self.assertEqual(list(df['inheritance_models']), list(expected['inheritance_models']))
+
+		self.assertEqual(cli_main(run_args + ['--output', self.output_dir, '--split-contigs']), 0)
+
+		summary = self.get_summary()
+
+		self.assertEqual(summary['units_skipped'], 4)
+		self.assertEqual(summary['families'][0]['skipped'], True)
+		self.assertEqual(summary['families'][0]['rows'], len(expected))
+
+
+class TestAnalysisConfig(unittest.TestCase):
+
+	def setUp(self):
+
+		self.my_family = Family('FAM001')
+		self.my_family.read_from_ped_file('test_data/FAM001.ped', 'FAM001', 'proband')
+
+		self.tmp_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+
+		shutil.rmtree(self.tmp_dir)
+
+	def read_variants(self, filter_func, args, proband_variants_only=True):
+
+		variant_set = VariantSet()
+		variant_set.add_family(self.my_family)
+
+		with self.assertLogs('pyvariantfilter.variant_set', level='WARNING'):
+
+			variant_set.read_variants_from_vcf('test_data/FAM001.trio.vcf.gz', filter_func=filter_func, args=args, proband_variants_only=proband_variants_only)
+
+		return variant_set
+
+	def test_hash(self):
+
+		config = AnalysisConfig({'import_filter': {'min_dp': 20, 'consequences': ['stop_gained', 'missense_variant', 'stop_gained']},
+								 'inheritance': {'max_parental_alt_ref_ratio_dn': 0}})
+
+		same_config = AnalysisConfig({'inheritance': {'max_parental_alt_ref_ratio_dn': 0.0},
+									  'import_filter': {'consequences': ['missense_variant', 'stop_gained']}})
+
+		self.assertEqual(config, same_config)
+		self.assertEqual(config.get_hash(), same_config.get_hash())
+		self.assertNotEqual(config.get_hash(), AnalysisConfig().get_hash())
+		self.assertEqual(AnalysisConfig(config.to_dict()).get_hash(), config.get_hash())
+
+	def test_validation(self):
+
+		for config_dict in [{'filters': {}},
+							{'import_filter': {'min_depth': 10}},
+							{'import_filter': {'min_dp': '10'}},
+							{'import_filter': {'pass_only': 1}},
+							{'import_filter': {'numerical_filters': [{'annotation_key': 'gnomAD_AF', 'thresholds': {'ad_het': 0.01}}]}},
+							{'import_filter': {'numerical_filters': [{'annotation_key': 'gnomAD_AF', 'comparison': 'lt'}]}},
+							{'import_filter': {'numerical_filters': [{'annotation_key': 'gnomAD_AF', 'thresholds': {context: 0.01 for context in FILTER_CONTEXTS}}]}},
+							{'output': {'format': 'xlsx'}},
+							{'output': {'columns': ['variant_id', 1]}}]:
+
+			with self.assertRaises(ValueError):
+
+				AnalysisConfig(config_dict)
+
+	def test_plan_order(self):
+
+		config = AnalysisConfig({'import_filter': {'numerical_filters': [{'annotation_key': 'gnomAD_AF'},
+																		 {'annotation_key': 'AC', 'annotation_type': 'info', 'comparison': 'gte',
+																		  'thresholds': {context: 2 for context in IMPORT_FILTER_CONTEXTS}}]}})
+
+		self.assertEqual(config.get_import_filter().get_plan(), ['proband_has_alt', 'pass_only', 'genotype_quality', 'consequences', 'info_AC_gte', 'transcript_gnomAD_AF_lte'])
+
+	def test_same_as_filter_func(self):
+
+		def import_filter(variant, proband_id):
+
+			if variant.has_alt(proband_id) and variant.passes_gt_filter(proband_id, min_dp=10) and variant.passes_filter():
+
+				freq_filter = variant.filter_on_numerical_transcript_annotation_lte('gnomAD_AF', 0.0015, 0.0015, 0.0015, 0.0015, 0.0015, 0.0015, 0.0015, 0.0015)
+
+				return freq_filter and variant.get_worst_consequence() in ['missense_variant', 'stop_gained']
+
+			return False
+
+		config_path = os.path.join(self.tmp_dir, 'config.json')
+
+		with open(config_path, 'w') as f:
+
+			json.dump({'import_filter': {'min_dp': 10,
+										 'consequences': ['missense_variant', 'stop_gained'],
+										 'numerical_filters': [{'annotation_key': 'gnomAD_AF', 'thresholds': {context: 0.0015 for context in IMPORT_FILTER_CONTEXTS}}]}}, f)
+
+		plan = load_analysis_config(config_path).get_import_filter()
+
+		expected = self.read_variants(import_filter, (self.my_family.get_proband_id(),))
+		variant_set = self.read_variants(plan, (self.my_family.get_proband_id(),))
+
+		self.assertEqual(list(variant_set.variant_dict), list(expected.variant_dict))
+		self.assertEqual(list(variant_set.variant_dict), ['1:100G>A', 'X:1000C>A'])
+		self.assertEqual(plan.rejected['transcript_gnomAD_AF_lte'], 1)
+		self.assertEqual(plan.rejected['pass_only'], 1)
+
+	def test_numerical_filter_without_context(self):
+
+		plan = AnalysisConfig({'import_filter': {'proband_has_alt': False,
+												 'pass_only': False,
+												 'min_dp': None,
+												 'min_gq': None,
+												 'consequences': None,
+												 'numerical_filters': [{'annotation_key': 'gnomAD_AF', 'thresholds': {context: 1 for context in IMPORT_FILTER_CONTEXTS}}]}}).get_import_filter()
+
+		variant_set = self.read_variants(plan, (self.my_family.get_proband_id(),), proband_variants_only=False)
+
+		# The variant where the proband is homozygous reference is rejected rather than raising a ValueError.
+		self.assertEqual(plan.rejected['transcript_gnomAD_AF_lte'], 1)
+		self.assertEqual(len(variant_set.variant_dict), 5)
+
+
 if __name__ == '__main__':
 	unittest.main()
 